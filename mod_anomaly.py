@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+import warnings
+from math import sqrt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+
+# shifts: up to MAX_CHANGES change points per series by binary segmentation;
+# a split is kept when both sides have at least MIN_SEGMENT samples and their
+# means differ by CHANGE_T times the sample-to-sample noise and by MIN_SHIFT
+# of the larger mean
+MAX_CHANGES = 3
+MIN_SEGMENT = 5
+CHANGE_T = 6.0
+MIN_SHIFT = 0.2
+# shifts are looked for in a running median of MEDIAN_WINDOW samples, so a
+# spike of less than half the window is left to the outlier test
+MEDIAN_WINDOW = 5
+
+# outliers: samples more than OUTLIER_Z robust sd from the series' level
+# (after its shifts), as in Iglewicz and Hoaglin's modified z-score
+OUTLIER_Z = 3.5
+
+# shifts and outliers of different series starting within CO_MOVE_SAMPLES of
+# the first one moved together
+CO_MOVE_SAMPLES = 2
+
+# sd of a normal distribution from its median (MAD) and mean absolute deviation
+MAD_SD = 1.4826
+MEAN_AD_SD = 1.253314
+
+
+def _median(values):
+    ordered = sorted(values)
+    n = len(ordered)
+    if not n:
+        return NAN
+    mid = n // 2
+    return ordered[mid] if n % 2 else (ordered[mid - 1] + ordered[mid]) / 2.0
+
+
+def _scale(deviations):
+    """Robust sd of absolute deviations from a median: the MAD, else the mean absolute deviation, 0 if none."""
+    mad = _median(deviations)
+    if mad > 0:
+        return MAD_SD * mad
+    return MEAN_AD_SD * sum(deviations) / len(deviations) if deviations else 0.0
+
+
+def _series_python(values):
+    """([(k, last, before, after, t)], [(j, value, baseline, z)]) of one series (see AnomalyAnalysis)."""
+    width = len(values)
+    diffs = [values[j + 1] - values[j] for j in range(width - 1)
+             if values[j] == values[j] and values[j + 1] == values[j + 1]]
+    center = _median(diffs)
+    sigma = _scale([abs(d - center) for d in diffs]) / sqrt(2)
+
+    half = MEDIAN_WINDOW // 2
+    smooth = [_median([w for w in values[max(j - half, 0):j + half + 1] if w == w]) if v == v else NAN
+              for (j, v) in enumerate(values)]
+
+    # prefix sums and counts of the valid samples, of the smoothed series for the splits
+    (p, ps, q) = ([0.0], [0.0], [0])
+    for (v, vs) in zip(values, smooth):
+        valid = v == v
+        p.append(p[-1] + (v if valid else 0.0))
+        ps.append(ps[-1] + (vs if valid else 0.0))
+        q.append(q[-1] + valid)
+
+    starts = [0]
+    scores = {}
+    for change in range(MAX_CHANGES):
+        if sigma <= 0:
+            break
+        (best_t, best_k) = (0.0, None)
+        bounds = starts + [width]
+        for (s, e) in zip(bounds, bounds[1:]):
+            for k in range(s + 1, e):
+                (nl, nr) = (q[k] - q[s], q[e] - q[k])
+                if nl < MIN_SEGMENT or nr < MIN_SEGMENT:
+                    continue
+                (ml, mr) = ((ps[k] - ps[s]) / nl, (ps[e] - ps[k]) / nr)
+                if abs(ml - mr) < MIN_SHIFT * max(abs(ml), abs(mr)):
+                    continue
+                t = abs(ml - mr) / (sigma * sqrt(1.0 / nl + 1.0 / nr))
+                if t > best_t:
+                    (best_t, best_k) = (t, k)
+        if best_k is None or best_t < CHANGE_T:
+            break
+        starts = sorted(starts + [best_k])
+        scores[best_k] = best_t
+
+    # level: mean of the segment of each sample
+    level = []
+    bounds = starts + [width]
+    for (s, e) in zip(bounds, bounds[1:]):
+        level.extend([(p[e] - p[s]) / (q[e] - q[s]) if q[e] > q[s] else NAN] * (e - s))
+    changes = [(k, e - 1, level[k - 1], level[k], scores[k]) for (k, e) in zip(starts[1:], bounds[2:])]
+
+    residual = [v - lv for (v, lv) in zip(values, level) if v == v]
+    center = _median(residual)
+    scale = _scale([abs(r - center) for r in residual])
+    points = []
+    if scale > 0:
+        for (j, v) in enumerate(values):
+            if v == v:
+                z = (v - level[j] - center) / scale
+                if abs(z) > OUTLIER_Z:
+                    points.append((j, v, level[j] + center, z))
+    return (changes, points)
+
+
+def _scales(deviations):
+    """_scale() of each row of a matrix of absolute deviations (NaN for no sample)."""
+    mad = numpy.nanmedian(deviations, axis=1)
+    mean_ad = numpy.nanmean(deviations, axis=1)
+    return numpy.nan_to_num(numpy.where(mad > 0, MAD_SD * mad, MEAN_AD_SD * mean_ad))
+
+
+def _bounds(starts, cols, width):
+    """First sample and end (exclusive) of the segment of each sample, for a series x samples matrix of segment starts."""
+    first = numpy.maximum.accumulate(numpy.where(starts, cols, 0), axis=1)
+    following = numpy.minimum.accumulate(numpy.where(starts, cols, width)[:, ::-1], axis=1)[:, ::-1]
+    end = numpy.concatenate([following[:, 1:], numpy.full((starts.shape[0], 1), width)], axis=1)
+    return (first, end)
+
+
+def _series_numpy(series, width):
+    """_series_python() of all series at once: ([(i, k, last, before, after, t)], [(i, j, value, baseline, z)])."""
+    m = len(series)
+    x = numpy.full((m, width), numpy.nan)
+    for (i, (name, values)) in enumerate(series):
+        x[i, :len(values)] = values
+    valid = ~numpy.isnan(x)
+    rows = numpy.arange(m)
+    cols = numpy.arange(width)
+    with warnings.catch_warnings():
+        # all-NaN rows of short series
+        warnings.simplefilter('ignore', RuntimeWarning)
+        diffs = numpy.diff(x, axis=1)
+        sigma = _scales(numpy.abs(diffs - numpy.nanmedian(diffs, axis=1)[:, None])) / sqrt(2)
+
+        half = MEDIAN_WINDOW // 2
+        padded = numpy.full((m, width + 2 * half), numpy.nan)
+        padded[:, half:half + width] = x
+        smooth = numpy.nanmedian(numpy.stack([padded[:, d:d + width] for d in range(MEDIAN_WINDOW)]), axis=0)
+
+    # prefix sums and counts of the valid samples, of the smoothed series for the splits
+    p = numpy.zeros((m, width + 1))
+    p[:, 1:] = numpy.cumsum(numpy.where(valid, x, 0.0), axis=1)
+    ps = numpy.zeros((m, width + 1))
+    ps[:, 1:] = numpy.cumsum(numpy.where(valid, smooth, 0.0), axis=1)
+    q = numpy.zeros((m, width + 1))
+    q[:, 1:] = numpy.cumsum(valid, axis=1)
+    (ps_k, q_k) = (ps[:, :width], q[:, :width])
+
+    # one more change point per series and round, best split over all its segments
+    starts = numpy.zeros((m, width), dtype=bool)
+    starts[:, 0] = True
+    scores = numpy.zeros((m, width))
+    for change in range(MAX_CHANGES):
+        (first, end) = _bounds(starts, cols, width)
+        nl = q_k - numpy.take_along_axis(q, first, axis=1)
+        nr = numpy.take_along_axis(q, end, axis=1) - q_k
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ml = (ps_k - numpy.take_along_axis(ps, first, axis=1)) / nl
+            mr = (numpy.take_along_axis(ps, end, axis=1) - ps_k) / nr
+            t = numpy.abs(ml - mr) / (sigma[:, None] * numpy.sqrt(1.0 / nl + 1.0 / nr))
+            ok = ~starts & (nl >= MIN_SEGMENT) & (nr >= MIN_SEGMENT) & (sigma[:, None] > 0) & \
+                 (numpy.abs(ml - mr) >= MIN_SHIFT * numpy.maximum(numpy.abs(ml), numpy.abs(mr)))
+        t = numpy.where(ok, t, 0.0)
+        best = numpy.argmax(t, axis=1)
+        best_t = t[rows, best]
+        accept = best_t >= CHANGE_T
+        if not accept.any():
+            break
+        starts[rows[accept], best[accept]] = True
+        scores[rows[accept], best[accept]] = best_t[accept]
+
+    (first, end) = _bounds(starts, cols, width)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        level = (numpy.take_along_axis(p, end, axis=1) - numpy.take_along_axis(p, first, axis=1)) / \
+                (numpy.take_along_axis(q, end, axis=1) - numpy.take_along_axis(q, first, axis=1))
+    changes = [(int(i), int(k), int(end[i, k]) - 1, float(level[i, k - 1]), float(level[i, k]), float(scores[i, k]))
+               for (i, k) in zip(*numpy.nonzero(starts[:, 1:])) for k in [k + 1]]
+
+    residual = x - level
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        center = numpy.nanmedian(residual, axis=1)
+        scale = _scales(numpy.abs(residual - center[:, None]))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        z = (residual - center[:, None]) / scale[:, None]
+    outlier = (numpy.abs(numpy.where(valid & (scale[:, None] > 0), z, 0.0)) > OUTLIER_Z)
+    points = [(int(i), int(j), float(x[i, j]), float(level[i, j] + center[i]), float(z[i, j]))
+              for (i, j) in zip(*numpy.nonzero(outlier))]
+    return (changes, points)
+
+
+class AnomalyAnalysis(object):
+    """
+    Shifts and outliers of series sampled at the same times (sample j of
+    every series is the j-th interval of the collection), all series at once
+    as a series x samples matrix when numpy is installed:
+
+    shifts      [(name, first, last, before, after, t)]: the mean of the
+                series moves from before to after at sample first and stays
+                there through last (binary segmentation, see MAX_CHANGES,
+                MIN_SEGMENT, CHANGE_T, MIN_SHIFT); t is the move in units of
+                the sample-to-sample noise, largest first
+    outliers    [(name, first, last, peak, baseline, z)]: runs of samples
+                more than OUTLIER_Z robust sd (median/MAD) from the level of
+                the series after its shifts; peak is the sample furthest
+                off, z its robust z-score, largest |z| first
+    groups      [(first, last, [(name, 'up' or 'down')])]: shifts and
+                outlier runs of different series starting from first
+                through last, at most CO_MOVE_SAMPLES after first, in time
+                order
+
+    Series may differ in length and hold NaN for samples they lack.
+
+    Example:
+    anomalies = AnomalyAnalysis([('usr', usr), ('eth0 rxkB/s', rx)])
+    for (first, last, moved) in anomalies.groups:
+        print(first, last, ', '.join(name + ' ' + direction for (name, direction) in moved))
+    """
+
+    def __init__(self, series):
+        self.names = [name for (name, values) in series]
+        self.shifts = []
+        self.outliers = []
+        self.groups = []
+        series = [(name, values) for (name, values) in series if len(values)]
+        if not series:
+            return
+        width = max(len(values) for (name, values) in series)
+        if numpy is not None:
+            (changes, points) = _series_numpy(series, width)
+        else:
+            (changes, points) = ([], [])
+            for (i, (name, values)) in enumerate(series):
+                (series_changes, series_points) = _series_python(list(values) + [NAN] * (width - len(values)))
+                changes.extend((i,) + change for change in series_changes)
+                points.extend((i,) + point for point in series_points)
+
+        for (i, k, last, before, after, t) in changes:
+            self.shifts.append((series[i][0], k, last, before, after, t))
+        self.shifts.sort(key=lambda shift: -shift[5])
+
+        # consecutive outlying samples of a series are one run
+        run = None
+        for (i, j, value, baseline, z) in points:
+            if run is not None and run[0] == i and run[2] == j - 1:
+                run[2] = j
+                if abs(z) > abs(run[5]):
+                    run[3:6] = [value, baseline, z]
+                continue
+            if run is not None:
+                self.outliers.append((series[run[0]][0],) + tuple(run[1:]))
+            run = [i, j, j, value, baseline, z]
+        if run is not None:
+            self.outliers.append((series[run[0]][0],) + tuple(run[1:]))
+        self.outliers.sort(key=lambda outlier: -abs(outlier[5]))
+
+        events = [(first, name, 'up' if after > before else 'down') for (name, first, last, before, after, t) in self.shifts]
+        events += [(first, name, 'up' if peak > baseline else 'down')
+                   for (name, first, last, peak, baseline, z) in self.outliers]
+        group = []
+        for (first, name, direction) in sorted(events) + [(None, None, None)]:
+            if group and (first is None or first - group[0][0] > CO_MOVE_SAMPLES):
+                moved = []
+                for (start, member, member_direction) in group:
+                    if (member, member_direction) not in moved:
+                        moved.append((member, member_direction))
+                if len(set(member for (member, member_direction) in moved)) > 1:
+                    self.groups.append((group[0][0], group[-1][0], moved))
+                group = []
+            group.append((first, name, direction))
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import re
+from time import mktime, strptime
+
+from mod_stats import StreamStats
+from mod_vmstat import read_vmstat, vmstat_values
+from mod_sar import read_sadf
+from mod_sadc import read_sadc
+from mod_iostat import read_iostat, DeviceAnalysis
+from mod_meminfo import read_meminfo, memory_summary
+from mod_summary import SummaryWriter, read_summary
+from mod_procsample import read_procsample, PROC_FILE
+
+CATALOG_FILE = 'catalog.jsonl'
+
+# collection directories made by perf-collect.py
+RUN_FORMAT = '%Y-%m-%d_%H%M%S'
+RUN_NAME = re.compile(r'^\d{4}-\d{2}-\d{2}_\d{6}$')
+
+# sysstat banner of mpstat.out and iostat.out:
+# Linux 5.15.0 (host)  10/18/2026  _x86_64_  (8 CPU)
+re_banner = re.compile(r'^(\S+) (\S+) \((\S+)\)\s.*\((\d+) CPU\)')
+
+# adapter throughput read from the sadc file for the headline numbers
+NET_FIELDS = {'rxkB/s': 'IFACE', 'txkB/s': 'IFACE'}
+
+# comparisons of perf-list.py -f filters, e.g. cpu>80, host=web1, artifacts~tcpdump.pcap
+OPERATORS = ['>=', '<=', '!=', '>', '<', '=', '~']
+re_filter = re.compile(r'^(\w+)\s*(' + '|'.join(re.escape(op) for op in OPERATORS) + r')\s*(.*)$')
+
+# headline fields of a run, in the order perf-list.py prints them
+FIELDS = ['run', 'host', 'cpus', 'duration', 'cpu', 'cpu_p95', 'iowait', 'runq', 'net_rx', 'net_tx', 'net_if',
+          'disk_util', 'disk_await', 'disk', 'mem_used', 'swap_used', 'artifacts']
+
+
+def run_signature(path):
+    """
+    Digest of the name, size and mtime of every file in a collection's
+    cmds_out and reports_out, which changes when a file is added, removed or
+    rewritten in place (a directory mtime only catches the first two).
+    """
+    digest = hashlib.sha1()
+    for name in ['cmds_out', 'reports_out']:
+        out_dir = os.path.join(path, name)
+        if not os.path.isdir(out_dir):
+            continue
+        for file in sorted(os.listdir(out_dir)):
+            st = os.stat(os.path.join(out_dir, file))
+            digest.update('{0}/{1} {2} {3:.3f}\n'.format(name, file, st.st_size, st.st_mtime).encode())
+    return digest.hexdigest()
+
+
+def _banner(cmd_out_dir):
+    for name in ['mpstat.out', 'iostat.out']:
+        path = os.path.join(cmd_out_dir, name)
+        if os.path.exists(path):
+            with open(path) as fh:
+                m = re_banner.match(fh.readline())
+            if m:
+                return (m.group(3), int(m.group(4)))
+    return ('', None)
+
+
+def index_run(path):
+    """
+    Catalog record of one data/<timestamp> collection: when, where and how
+    long it ran, the headline CPU, network, disk and memory numbers, and the
+    files it collected.  Numbers from files the collection lacks are None.
+
+    run         directory name, start its time as epoch
+    host        host name and cpus from the mpstat/iostat banner (proc.bin
+                header of perf-collect.py -P)
+    duration    vmstat samples (seconds at the default 1s interval)
+    cpu         avg and p95 of us + sy (vmstat), iowait avg wa, runq avg r
+    net_rx      highest avg rxkB/s of an adapter other than lo (sar),
+                net_tx the same for txkB/s, net_if the adapter of net_rx
+    disk_util   highest avg %util of a device (iostat), disk_await its
+                highest p95 await, disk the busiest device
+    mem_used    highest MemUsed% and swap_used SwapUsed% of meminfo.out and
+                meminfo_end.out
+    artifacts   file names in cmds_out, plus reports_out/<name> for reports
+
+    proc.bin stands in for vmstat.out, the sar files and iostat.out when
+    they are missing.
+    """
+    name = os.path.basename(os.path.normpath(path))
+    cmd_out_dir = os.path.join(path, 'cmds_out')
+    record = dict((field, None) for field in FIELDS)
+    record['run'] = name
+    record['signature'] = run_signature(path)
+    record['start'] = mktime(strptime(name, RUN_FORMAT)) if RUN_NAME.match(name) else None
+    (record['host'], record['cpus']) = _banner(cmd_out_dir)
+    proc_data = None
+    file = os.path.join(cmd_out_dir, PROC_FILE)
+    if os.path.exists(file):
+        try:
+            proc_data = read_procsample(file)
+        except ValueError:
+            pass
+    if proc_data is not None and not record['host']:
+        # cpu, cpu0, cpu1, ...
+        (record['host'], record['cpus']) = (proc_data.header['host'], len(proc_data.header['cpus']) - 1)
+
+    artifacts = sorted(os.listdir(cmd_out_dir))
+    report_out_dir = os.path.join(path, 'reports_out')
+    if os.path.isdir(report_out_dir):
+        artifacts += ['reports_out/' + report for report in sorted(os.listdir(report_out_dir))]
+    record['artifacts'] = artifacts
+
+    file = os.path.join(cmd_out_dir, 'vmstat.out')
+    if os.path.exists(file) or proc_data is not None:
+        try:
+            vmstat_data = read_vmstat(file) if os.path.exists(file) else proc_data.vmstat_data()
+        except (IndexError, KeyError, ValueError):
+            # cut off by an interrupted collection
+            vmstat_data = {}
+        us = vmstat_values(vmstat_data, 'us')
+        sy = vmstat_values(vmstat_data, 'sy')
+        if us and sy:
+            acc = StreamStats([u + s for (u, s) in zip(us, sy)])
+            record.update(duration=acc.count, cpu=round(acc.mean, 1), cpu_p95=round(acc.quantile(0.95), 1))
+        for (field, column) in [('iowait', 'wa'), ('runq', 'r')]:
+            values = vmstat_values(vmstat_data, column)
+            if values:
+                record[field] = round(StreamStats(values).mean, 1)
+
+    sar_data = None
+    file = os.path.join(cmd_out_dir, 'sarA.bin')
+    if os.path.exists(file):
+        try:
+            sar_data = read_sadc(file, NET_FIELDS)
+        except ValueError:
+            pass
+    file = os.path.join(cmd_out_dir, 'sarA.data')
+    if sar_data is None and os.path.exists(file):
+        sar_data = read_sadf(file, NET_FIELDS)
+    if sar_data is None and proc_data is not None:
+        sar_data = proc_data.sar_data(NET_FIELDS)
+    if sar_data is not None:
+        for (field, column) in [('net_rx', 'rxkB/s'), ('net_tx', 'txkB/s')]:
+            for iface in sar_data.key_values('IFACE'):
+                values = sar_data.values(column, iface)
+                if iface == 'lo' or values is None or not len(values):
+                    continue
+                avg = round(StreamStats(values).mean, 1)
+                if record[field] is None or avg > record[field]:
+                    record[field] = avg
+                    if field == 'net_rx':
+                        record['net_if'] = iface
+
+    file = os.path.join(cmd_out_dir, 'iostat.out')
+    if os.path.exists(file) or proc_data is not None:
+        disks = DeviceAnalysis(read_iostat(file) if os.path.exists(file) else proc_data.iostat_data())
+        for device in disks.devices:
+            util = disks.stats[device].get('%util')
+            latency = disks.stats[device].get('await')
+            if util is not None and util.count and (record['disk_util'] is None or util.mean > record['disk_util']):
+                record.update(disk_util=round(util.mean, 1), disk=device)
+            if latency is not None and latency.count:
+                p95 = round(latency.quantile(0.95), 1)
+                record['disk_await'] = p95 if record['disk_await'] is None else max(record['disk_await'], p95)
+
+    for name in ['meminfo.out', 'meminfo_end.out']:
+        file = os.path.join(cmd_out_dir, name)
+        if not os.path.exists(file):
+            continue
+        mb = memory_summary(read_meminfo(file))
+        for (field, column) in [('mem_used', 'MemUsed%'), ('swap_used', 'SwapUsed%')]:
+            if column in mb:
+                value = round(mb[column], 1)
+                record[field] = value if record[field] is None else max(record[field], value)
+    return record
+
+
+class Catalog(object):
+    """
+    Catalog of the collections in a data directory: one index_run() record
+    per data/<timestamp>/cmds_out, kept in data/catalog.jsonl (a mod_summary
+    JSON lines file of 'run' records) so listing runs reads one small file.
+
+    update() only indexes collections that are new or whose cmds_out or
+    reports_out files changed since they were indexed (run_signature()),
+    and drops the ones that were deleted; the other records are taken over
+    as they are.  The symlink data/current and directories without cmds_out are
+    skipped.  add() indexes a single collection (perf-collect.py its own run)
+    without looking at the others.
+
+    Example:
+    catalog = Catalog('data')
+    catalog.update()
+    for record in catalog.runs:
+        print(record['run'], record['host'], record['cpu'])
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, CATALOG_FILE)
+        self.runs = []
+        if os.path.exists(self.path):
+            try:
+                self.runs = [record for record in read_summary(self.path) if record['record'] == 'run']
+            except ValueError:
+                # another version, rebuilt by update()
+                self.runs = []
+
+    def update(self, rebuild=False):
+        """Index new and changed collections and write the catalog; returns the names indexed."""
+        known = {} if rebuild else dict((record['run'], record) for record in self.runs)
+        runs = []
+        indexed = []
+        for name in sorted(os.listdir(self.data_dir)):
+            path = os.path.join(self.data_dir, name)
+            if os.path.islink(path) or not os.path.isdir(os.path.join(path, 'cmds_out')):
+                continue
+            record = known.get(name)
+            if record is None or record.get('signature') != run_signature(path):
+                record = index_run(path)
+                indexed.append(name)
+            runs.append(record)
+        changed = indexed or len(runs) != len(self.runs) or not os.path.exists(self.path)
+        self.runs = runs
+        if changed:
+            self.write()
+        return indexed
+
+    def add(self, path):
+        """Index one collection, replacing its earlier record, and write the catalog; returns the record."""
+        record = index_run(path)
+        runs = [run for run in self.runs if run['run'] != record['run']]
+        runs.append(record)
+        self.runs = sorted(runs, key=lambda run: run['run'])
+        self.write()
+        return record
+
+    def write(self):
+        catalog = SummaryWriter(self.path, source='mod_catalog', data_dir=os.path.abspath(self.data_dir))
+        for record in self.runs:
+            fields = dict(record)
+            fields.pop('record', None)
+            catalog.write('run', **fields)
+        catalog.close()
+
+
+def parse_filter(text):
+    """(field, operator, value) of a filter such as 'cpu>80'; ValueError for an unknown field or operator."""
+    m = re_filter.match(text.strip())
+    if not m or m.group(1) not in FIELDS + ['start']:
+        raise ValueError('bad filter {0}, expected <field><op><value> with a field of {1} and an op of {2}'.format(
+            text, ', '.join(FIELDS), ' '.join(OPERATORS)))
+    (field, op, value) = m.groups()
+    if op not in ('=', '!=', '~'):
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError('bad filter {0}, {1} needs a number'.format(text, op))
+    return (field, op, value)
+
+
+def matches(record, filters):
+    """True if a catalog record passes all parse_filter() filters (a missing number never does)."""
+    for (field, op, value) in filters:
+        actual = record.get(field)
+        if op == '~':
+            # substring, or a member of a list such as artifacts
+            if isinstance(actual, list):
+                if not any(value in item for item in actual):
+                    return False
+            elif actual is None or value not in str(actual):
+                return False
+        elif op in ('=', '!='):
+            if (str(actual) == value if actual is not None else value == '') != (op == '='):
+                return False
+        else:
+            if not isinstance(actual, (int, float)) or not {'>': actual > value, '<': actual < value,
+                                                            '>=': actual >= value, '<=': actual <= value}[op]:
+                return False
+    return True
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import os
+
+from mod_stats import DictDiffer, StreamStats, mann_whitney
+from mod_metrics import source_fields
+from mod_vmstat import read_vmstat, vmstat_values
+from mod_sar import read_sadf
+from mod_sadc import read_sadc
+from mod_mpstat import read_mpstat, KEY as CPU_KEY
+from mod_iostat import read_iostat, KEY as DEVICE_KEY
+from mod_procsample import read_procsample, PROC_FILE
+from netstat_analyser import get_ips, get_ips_ports, analyze_netstat
+
+# a change is reported when the Mann-Whitney p is below ALPHA and Cliff's
+# delta is at least 'small'; size labels after Romano et al. (2006)
+ALPHA = 0.01
+EFFECT_SIZES = [(0.474, 'large'), (0.33, 'medium'), (0.147, 'small'), (0.0, 'negligible')]
+
+# table of the registry metrics split by a key field, e.g. one row per IFACE
+KEY_LABELS = {'IFACE': 'adapter'}
+# per-CPU (mpstat.out) and per-device (iostat.out) series compared besides the registry
+CPU_FIELDS = ['%usr', '%sys', '%iowait', '%soft', '%steal', '%idle']
+DEVICE_FIELDS = ['iops', 'r_await', 'w_await', 'aqu-sz', '%util']
+
+# netstat_analyser.py connection counts compared per endpoint
+DIRECTIONS = ['inbound', 'local', 'remote', 'outbound']
+
+
+def effect_size(effect):
+    """'large', 'medium', 'small' or 'negligible' for a Cliff's delta."""
+    for (bound, label) in EFFECT_SIZES:
+        if abs(effect) >= bound:
+            return label
+    return EFFECT_SIZES[-1][1]
+
+
+def collection_dir(path, data_dir):
+    """
+    cmds_out directory of a collection given as a data/<timestamp> directory,
+    a timestamp under data_dir or a cmds_out directory; ValueError otherwise.
+    """
+    for candidate in [path, os.path.join(data_dir, path)]:
+        if os.path.isdir(os.path.join(candidate, 'cmds_out')):
+            return os.path.join(candidate, 'cmds_out')
+        if os.path.exists(os.path.join(candidate, 'vmstat.out')) or os.path.exists(os.path.join(candidate, PROC_FILE)):
+            return candidate
+    raise ValueError('{0} is not a collection directory (no cmds_out, vmstat.out or {1})'.format(path, PROC_FILE))
+
+
+def read_series(cmd_out_dir, metrics):
+    """
+    {(table, key value, name): [sample]} of one collection, per-second
+    samples as parsed for perf-analyze.py:
+
+    metric      unkeyed vmstat and sar metrics of the registry (key value '')
+    adapter     keyed sar metrics, one series per IFACE (KEY_LABELS)
+    cpu         CPU_FIELDS per CPU of mpstat.out ('all' included)
+    device      DEVICE_FIELDS per device of iostat.out
+
+    Files missing from the collection leave their series out; proc.bin of
+    perf-collect.py -P stands in for vmstat.out, sar, mpstat.out and
+    iostat.out.
+    """
+    series = {}
+    path = os.path.join(cmd_out_dir, PROC_FILE)
+    proc_data = read_procsample(path) if os.path.exists(path) else None
+    path = os.path.join(cmd_out_dir, 'vmstat.out')
+    if os.path.exists(path):
+        vmstat_data = read_vmstat(path)
+    else:
+        vmstat_data = proc_data.vmstat_data() if proc_data is not None else {}
+
+    # sadc binary when its format is known, otherwise sadf -d text if the
+    # collection converted it (nothing is written to an old collection)
+    sar_data = None
+    header2key = source_fields(metrics, 'sar')
+    path = os.path.join(cmd_out_dir, 'sarA.bin')
+    if os.path.exists(path):
+        try:
+            sar_data = read_sadc(path, header2key)
+        except ValueError:
+            pass
+    path = os.path.join(cmd_out_dir, 'sarA.data')
+    if sar_data is None and os.path.exists(path):
+        sar_data = read_sadf(path, header2key)
+    if sar_data is None and proc_data is not None:
+        sar_data = proc_data.sar_data(header2key)
+
+    for metric in metrics:
+        if metric.source == 'vmstat':
+            values = vmstat_values(vmstat_data, metric.field)
+            if values:
+                series[('metric', '', metric.name)] = list(values)
+        elif metric.source == 'sar' and sar_data is not None:
+            if not metric.key:
+                values = sar_data.values(metric.field)
+                if values is not None and len(values):
+                    series[('metric', '', metric.name)] = list(values)
+                continue
+            for key_val in sar_data.key_values(metric.key):
+                values = sar_data.values(metric.field, key_val)
+                if values is not None and len(values):
+                    series[(KEY_LABELS.get(metric.key, metric.key), key_val, metric.name)] = list(values)
+
+    for (table, name, key, fields, read) in [('cpu', 'mpstat.out', CPU_KEY, CPU_FIELDS, read_mpstat),
+                                             ('device', 'iostat.out', DEVICE_KEY, DEVICE_FIELDS, read_iostat)]:
+        path = os.path.join(cmd_out_dir, name)
+        if os.path.exists(path):
+            data = read(path)
+        elif proc_data is not None:
+            data = proc_data.mpstat_data() if table == 'cpu' else proc_data.iostat_data()
+        else:
+            continue
+        for key_val in data.key_values(key):
+            for field in fields:
+                values = data.values(field, key_val)
+                if values is not None and len(values):
+                    series[(table, key_val, field)] = list(values)
+    return series
+
+
+def read_endpoints(cmd_out_dir):
+    """
+    {(direction, ip:port): established connections} and {('state', TCP
+    state): count} of netstat_an.out (netstat_analyser.py), {} when the
+    collection has no netstat_an.out, ifconfig_a.out or uname.out.
+    """
+    texts = []
+    for name in ['netstat_an.out', 'ifconfig_a.out', 'uname.out']:
+        path = os.path.join(cmd_out_dir, name)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as fh:
+            texts.append(fh.read())
+    (netstat_output, ifconfig_output, kernel) = (texts[0], texts[1], texts[2].strip())
+    host_ips = get_ips(kernel, ifconfig_output)
+    host_ips_ports_idx = get_ips_ports(netstat_output, host_ips)
+    (tcp_counters, inbound, outbound, local, remote, tcp_unknown) = analyze_netstat(netstat_output, host_ips_ports_idx,
+                                                                                     host_ips)
+    endpoints = dict((('state', state), count) for (state, count) in tcp_counters.items())
+    for (direction, counts) in zip(DIRECTIONS, [inbound, local, remote, outbound]):
+        for (ip_port, count) in counts.items():
+            endpoints[(direction, ip_port)] = count
+    return endpoints
+
+
+class Comparison(object):
+    """
+    Two collections lined up series by series (read_series()) and endpoint
+    by endpoint (read_endpoints()):
+
+    changes     [(series key, before StreamStats, after StreamStats, p,
+                effect)] of every series in both, largest |effect| (Cliff's
+                delta of mann_whitney()) first; p tests whether the two
+                distributions of samples differ, not only their averages
+    added       series keys only in after (a new adapter, CPU or device),
+                removed the ones only in before
+    endpoints   [(endpoint key, before count, after count)] of the endpoints
+                and TCP states whose count changed, appeared (before 0) or
+                went away (after 0), largest change first.  netstat -an is
+                one snapshot per collection, so counts are not tested
+
+    Example:
+    comparison = Comparison(read_series(before_dir, metrics), read_series(after_dir, metrics))
+    for (key, before, after, p, effect) in comparison.significant():
+        print(key, before.mean, after.mean, effect_size(effect))
+    """
+
+    def __init__(self, before, after, before_endpoints=None, after_endpoints=None):
+        diff = DictDiffer(after, before)
+        self.added = sorted(diff.added())
+        self.removed = sorted(diff.removed())
+        self.changes = []
+        for key in diff.intersect:
+            result = mann_whitney(before[key], after[key])
+            if result is None:
+                continue
+            (u, p, effect) = result
+            self.changes.append((key, StreamStats(before[key]), StreamStats(after[key]), p, effect))
+        self.changes.sort(key=lambda change: (-abs(change[4]), change[3], change[0]))
+
+        before_endpoints = before_endpoints or {}
+        after_endpoints = after_endpoints or {}
+        diff = DictDiffer(after_endpoints, before_endpoints)
+        self.endpoints = [(key, 0, after_endpoints[key]) for key in diff.added()]
+        self.endpoints += [(key, before_endpoints[key], 0) for key in diff.removed()]
+        self.endpoints += [(key, before_endpoints[key], after_endpoints[key]) for key in diff.changed()]
+        self.endpoints.sort(key=lambda e: (-abs(e[2] - e[1]), e[0]))
+
+    def significant(self, alpha=ALPHA):
+        """The changes with p below alpha and at least a small effect."""
+        return [change for change in self.changes
+                if change[3] < alpha and effect_size(change[4]) != EFFECT_SIZES[-1][1]]
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+from time import localtime, strftime
+
+from mod_sadc import SadcFile
+from mod_sar import sadf_samples
+from mod_stats import StreamStats
+
+# daily sadc files: saDD, or saYYYYMMDD when sadc runs with -D
+SA_FILE = re.compile(r'^sa\d{2}(\d{6})?$')
+
+# hours are local time 'YYYY-MM-DD HH' strings, which sort in time order
+HOUR_FORMAT = '%Y-%m-%d %H'
+FIRST_HOUR = '0000-00-00 00'
+LAST_HOUR = '9999-99-99 99'
+
+CACHE_VERSION = 2
+
+
+def hour_of(ts):
+    """Local 'YYYY-MM-DD HH' hour of an epoch time."""
+    return strftime(HOUR_FORMAT, localtime(ts))
+
+
+def parse_hour(text, default_hour):
+    """'YYYY-MM-DD[ HH[:MM]]' (or with a T) as a 'YYYY-MM-DD HH' hour, default_hour if none is given."""
+    m = re.match(r'^(\d{4}-\d{2}-\d{2})(?:[ T](\d{1,2})(?::\d{2}){0,2})?$', text.strip())
+    if not m:
+        raise ValueError('bad time {0}, expected YYYY-MM-DD[ HH[:MM]]'.format(text))
+    return '{0} {1:02d}'.format(m.group(1), int(m.group(2)) if m.group(2) else default_hour)
+
+
+class Summary(object):
+    """StreamStats of one series plus its peak sample and when it happened."""
+    __slots__ = ['stats', 'peak', 'peak_ts']
+
+    def __init__(self, stats=None, peak=None, peak_ts=None):
+        self.stats = stats if stats is not None else StreamStats()
+        self.peak = peak
+        self.peak_ts = peak_ts
+
+    def add(self, ts, value):
+        self.stats.add(value)
+        if self.peak is None or value > self.peak:
+            self.peak = value
+            self.peak_ts = ts
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        if other.peak is not None and (self.peak is None or other.peak > self.peak):
+            self.peak = other.peak
+            self.peak_ts = other.peak_ts
+
+    def state(self):
+        return [self.stats.state(), self.peak, self.peak_ts]
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(StreamStats.from_state(state[0]), state[1], state[2])
+
+
+def summarize(samples):
+    """
+    {hour: {(field, key value): Summary}} of (timestamp, key name, key
+    values, {field: [value per key value]}) samples, see SadcFile.samples().
+    """
+    hours = {}
+    last_ts = None
+    for (ts, key_name, key_vals, values) in samples:
+        if ts != last_ts:
+            hour = hours.setdefault(hour_of(ts), {})
+            last_ts = ts
+        for (field, column) in values.items():
+            for (key_val, value) in zip(key_vals, column):
+                summary = hour.get((field, key_val))
+                if summary is None:
+                    summary = hour[(field, key_val)] = Summary()
+                summary.add(ts, value)
+    return hours
+
+
+class HistoryWindow(object):
+    """
+    Aggregates of the hourly summaries in a time window, per (field, key
+    value) series:
+
+    total        Summary over the whole window (stats and peak sample)
+    hour_of_day  StreamStats per local hour of day (0-23)
+    busiest      (mean, hour) of the hour with the highest mean
+    """
+
+    def __init__(self):
+        self.total = {}
+        self.hour_of_day = {}
+        self.busiest = {}
+        self.hours = set()
+        self.first = None
+        self.last = None
+        self.files = 0
+
+    def add_hour(self, hour, series):
+        self.hours.add(hour)
+        if self.first is None or hour < self.first:
+            self.first = hour
+        if self.last is None or hour > self.last:
+            self.last = hour
+        hod = int(hour[-2:])
+        for (name, summary) in series.items():
+            total = self.total.get(name)
+            if total is None:
+                total = self.total[name] = Summary()
+            total.merge(summary)
+            by_hour = self.hour_of_day.get(name)
+            if by_hour is None:
+                by_hour = self.hour_of_day[name] = [StreamStats() for h in range(24)]
+            by_hour[hod].merge(summary.stats)
+            busiest = self.busiest.get(name)
+            if busiest is None or summary.stats.mean > busiest[0]:
+                self.busiest[name] = (summary.stats.mean, hour)
+
+    def key_values(self, key_name, header2key):
+        """Key values of the series of key_name's fields, sorted."""
+        return sorted(set(key_val for (field, key_val) in self.total
+                          if key_val is not None and header2key.get(field) == key_name))
+
+
+class SaHistory(object):
+    """
+    Hourly summaries of the daily sadc files in sa_dir (e.g. /var/log/sa).
+
+    Each file is parsed once into per hour StreamStats and peaks of the
+    header2key fields, cached as JSON in cache_dir and listed with its first
+    and last hour in cache_dir/index.json.  A window query only loads the
+    files whose hours overlap the window (new files are placed by the time
+    in their header) and merges one file's hours at a time, so memory does
+    not grow with the length of the history.  A file is parsed again when
+    its size or mtime change (sa files are reused every month) or the
+    cache lacks a wanted field.
+
+    Example:
+    history = SaHistory('/var/log/sa', 'data/history', {'tps': '', 'rxpck/s': 'IFACE'})
+    window = history.query('2024-01-01 00', '2024-01-14 23')
+    """
+
+    def __init__(self, sa_dir, cache_dir, header2key):
+        self.sa_dir = sa_dir
+        self.cache_dir = cache_dir
+        self.header2key = header2key
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as fh:
+                index = json.load(fh)
+            if index.get('version') == CACHE_VERSION:
+                self.index = index['files']
+
+    def files(self):
+        return sorted(os.path.join(self.sa_dir, name) for name in os.listdir(self.sa_dir) if SA_FILE.match(name))
+
+    def _entry(self, path):
+        """Index entry of path if its cache is up to date."""
+        entry = self.index.get(os.path.abspath(path))
+        if entry is None:
+            return None
+        st = os.stat(path)
+        if entry['size'] != st.st_size or entry['mtime'] != st.st_mtime:
+            return None
+        for (field, key) in self.header2key.items():
+            if entry['fields'].get(field) != key:
+                return None
+        return entry
+
+    def span(self, path):
+        """(first hour, last hour) of a file, None if unknown before parsing it."""
+        entry = self._entry(path)
+        if entry is not None:
+            return (entry['first'], entry['last'])
+        try:
+            day = strftime('%Y-%m-%d', localtime(SadcFile(path, {}).start_time()))
+        except ValueError:
+            return None
+        return (day + ' 00', day + ' 23')
+
+    def load(self, path):
+        """{hour: {(field, key value): Summary}} of a file, from the cache or parsed now."""
+        entry = self._entry(path)
+        if entry is not None:
+            with open(os.path.join(self.cache_dir, entry['cache'])) as fh:
+                cache = json.load(fh)
+            hours = {}
+            for (hour, series) in cache.items():
+                hours[hour] = dict(((field, key_val), Summary.from_state(state))
+                                   for (field, key_val, state) in series)
+            return hours
+
+        st = os.stat(path)
+        try:
+            hours = summarize(SadcFile(path, self.header2key).samples())
+        except ValueError:
+            # older sysstat file formats go through sadf
+            try:
+                proc = subprocess.Popen(['sadf', '-U', '-d', path, '--', '-A'], stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+            except OSError as e:
+                print('Skipping {0}: cannot run sadf: {1}'.format(path, e))
+                return {}
+            hours = summarize(sadf_samples(proc.stdout, self.header2key))
+            proc.stdout.close()
+            if proc.wait() != 0:
+                print('Skipping {0}: sadf failed'.format(path))
+                return {}
+        if not hours:
+            return hours
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # sa01 of /var/log/sa and of an archived copy must not share a cache
+        cache_name = '{0}-{1}.json'.format(os.path.basename(path),
+                                           hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12])
+        cache = dict((hour, [[field, key_val, summary.state()] for ((field, key_val), summary) in series.items()])
+                     for (hour, series) in hours.items())
+        with open(os.path.join(self.cache_dir, cache_name), 'w') as fh:
+            json.dump(cache, fh)
+        self.index[os.path.abspath(path)] = {
+            'size': st.st_size, 'mtime': st.st_mtime, 'fields': self.header2key,
+            'first': min(hours), 'last': max(hours), 'cache': cache_name,
+        }
+        return hours
+
+    def query(self, start=FIRST_HOUR, end=LAST_HOUR):
+        """HistoryWindow of the hours from start to end ('YYYY-MM-DD HH', both included)."""
+        window = HistoryWindow()
+        for path in self.files():
+            span = self.span(path)
+            if span is not None and (span[1] < start or span[0] > end):
+                continue
+            hours = self.load(path)
+            used = False
+            for (hour, series) in hours.items():
+                if start <= hour <= end:
+                    window.add_hour(hour, series)
+                    used = True
+            window.files += used
+        self.save_index()
+        return window
+
+    def save_index(self):
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        with open(self.index_file, 'w') as fh:
+            json.dump({'version': CACHE_VERSION, 'files': self.index}, fh, indent=1, sort_keys=True)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+from mod_sar import SarData
+from mod_stats import StreamStats
+
+KEY = 'Device'
+
+# iostat -x columns kept per device, as named by sysstat 12.x; the derived
+# ones are filled in from other columns when a release does not print them
+FIELDS = ['r/s', 'w/s', 'iops', 'rkB/s', 'wkB/s', 'await', 'r_await', 'w_await', 'aqu-sz', '%util',
+          'rareq-sz', 'wareq-sz']
+# older names -> (name, scale): sysstat < 12 printed avgqu-sz, sysstat < 9
+# printed 512 byte sectors without -k
+ALIASES = {
+    'avgqu-sz': ('aqu-sz', 1.0),
+    'rsec/s': ('rkB/s', 0.5),
+    'wsec/s': ('wkB/s', 0.5),
+}
+
+# a device is saturated when it is at least SATURATED_UTIL %util with more
+# than QUEUE_THRESHOLD requests queued on average in SATURATED_SAMPLES of the
+# samples, and slow when its p95 await is AWAIT_THRESHOLD ms or more
+SATURATED_UTIL = 90.0
+QUEUE_THRESHOLD = 1.0
+SATURATED_SAMPLES = 0.5
+AWAIT_THRESHOLD = 20.0
+FLAG_LEGEND = 'SATURATED: %util >= {0:.0f} with aqu-sz > {1:.0f} in {2:.0f}% of samples, SLOW: await p95 >= {3:.0f} ms'.format(
+    SATURATED_UTIL, QUEUE_THRESHOLD, SATURATED_SAMPLES * 100, AWAIT_THRESHOLD)
+
+
+def _derive(values):
+    """Fill in the FIELDS a sysstat release leaves out (await, req sizes, iops) of one device sample."""
+    reads = values.get('r/s', 0.0)
+    writes = values.get('w/s', 0.0)
+    values['iops'] = reads + writes
+    if 'await' not in values and 'r_await' in values and 'w_await' in values:
+        # sysstat 12 dropped await, weigh r_await and w_await by their IOPS
+        ios = reads + writes
+        values['await'] = (reads * values['r_await'] + writes * values['w_await']) / ios if ios else 0.0
+    if 'rareq-sz' not in values and 'rkB/s' in values:
+        values['rareq-sz'] = values['rkB/s'] / reads if reads else 0.0
+    if 'wareq-sz' not in values and 'wkB/s' in values:
+        values['wareq-sz'] = values['wkB/s'] / writes if writes else 0.0
+    return values
+
+
+def _device_blocks(fh):
+    """Yield ([device], {field: [value per device]}) per Device header of iostat -x output."""
+    cols = None
+    devices = None
+    for line in fh:
+        row = line.split()
+        if row and row[0].rstrip(':') == KEY:
+            if devices is not None:
+                yield (devices, values)
+            devices = []
+            values = {}
+            width = len(row)
+            cols = []
+            for (i, h) in enumerate(row[1:], 1):
+                (name, scale) = ALIASES.get(h, (h, 1.0))
+                if name in FIELDS:
+                    cols.append((i, name, scale))
+            continue
+        if not row:
+            # a blank line ends the device block
+            cols = None
+            continue
+        if not cols or len(row) != width:
+            continue
+        try:
+            sample = _derive(dict((name, float(row[i].replace(',', '.')) * scale) for (i, name, scale) in cols))
+        except ValueError:
+            continue
+        devices.append(row[0])
+        for (name, value) in sample.items():
+            values.setdefault(name, []).append(value)
+    if devices is not None:
+        yield (devices, values)
+
+
+def iostat_samples(fh):
+    """
+    Yield ([device], {field: [value per device]}) per interval of iostat -x
+    output in fh.  Columns are found by name in each Device header, so the
+    layouts of different sysstat releases (and -t timestamps or avg-cpu
+    blocks in between) are read the same way.  The first interval is the
+    average since boot and is left out when there are more.
+    """
+    blocks = _device_blocks(fh)
+    first = next(blocks, None)
+    second = next(blocks, None)
+    if second is None:
+        if first is not None:
+            yield first
+        return
+    yield second
+    for block in blocks:
+        yield block
+
+
+def read_iostat(path):
+    """SarData of iostat -x output: a devices x samples matrix per field, key Device."""
+    io = SarData(dict((field, KEY) for field in FIELDS))
+    with open(path) as fh:
+        for (j, (devices, values)) in enumerate(iostat_samples(fh)):
+            io.add_keyed(j, KEY, devices, values)
+    return io.finish()
+
+
+class DeviceAnalysis(object):
+    """
+    Per-device summary of iostat data (read_iostat()):
+
+    devices     device names in order of appearance
+    stats       {device: {field: StreamStats}} over the samples the device
+                was listed in (iostat -z leaves out idle intervals)
+    saturated   {device: share of samples at least SATURATED_UTIL %util with
+                aqu-sz above QUEUE_THRESHOLD}
+    flags       {device: [flag]}: SATURATED when saturated in at least
+                SATURATED_SAMPLES of the samples, SLOW when the p95 await is
+                AWAIT_THRESHOLD ms or more
+
+    Example:
+    disks = DeviceAnalysis(read_iostat('iostat.out'))
+    for device in disks.devices:
+        print(device, disks.stats[device]['await'].quantile(0.95), disks.flags[device])
+    """
+
+    def __init__(self, io):
+        self.devices = io.key_values(KEY)
+        self.stats = {}
+        self.saturated = {}
+        self.flags = {}
+        for device in self.devices:
+            self.stats[device] = dict((field, StreamStats(io.values(field, device)))
+                                      for field in FIELDS if io.values(field, device) is not None)
+            util = io.values('%util', device)
+            queue = io.values('aqu-sz', device)
+            busy = 0
+            if util is not None and queue is not None:
+                busy = sum(1 for (u, q) in zip(util, queue) if u >= SATURATED_UTIL and q > QUEUE_THRESHOLD)
+            self.saturated[device] = float(busy) / len(util) if util is not None and len(util) else 0.0
+            flags = self.flags[device] = []
+            if self.saturated[device] >= SATURATED_SAMPLES:
+                flags.append('SATURATED')
+            latency = self.stats[device].get('await')
+            if latency is not None and latency.count and latency.quantile(0.95) >= AWAIT_THRESHOLD:
+                flags.append('SLOW')
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# /proc/meminfo fields counted in pages rather than kB
+COUNTS = ['HugePages_Total', 'HugePages_Free', 'HugePages_Rsvd', 'HugePages_Surp']
+
+
+def read_meminfo(path):
+    """{field: kB (a count for HugePages_*)} of a /proc/meminfo copy."""
+    fields = {}
+    with open(path) as fh:
+        for line in fh:
+            (name, sep, value) = line.partition(':')
+            words = value.split()
+            if not sep or not words:
+                continue
+            try:
+                fields[name.strip()] = float(words[0])
+            except ValueError:
+                continue
+    return fields
+
+
+def memory_summary(fields):
+    """
+    Memory sizes in MB (HugePages_* stay counts) of read_meminfo() fields,
+    plus derived fields for the metric registry (source meminfo):
+
+    MemUsed%     100 - MemAvailable % of MemTotal (MemAvailable is
+                 MemFree + Buffers + Cached before Linux 3.14)
+    SwapUsed     SwapTotal - SwapFree, SwapUsed% of SwapTotal
+    SUnreclaim%  unreclaimable slab % of MemTotal
+    HugePagesMB  HugePages_Total x Hugepagesize, HugePagesUsedMB the pages
+                 not free
+    Commit%      Committed_AS % of CommitLimit (over 100 can only be
+                 allocated with overcommit)
+    """
+    mb = dict((name, value if name in COUNTS else value / 1024) for (name, value) in fields.items())
+    if 'MemAvailable' not in mb and 'MemFree' in mb:
+        mb['MemAvailable'] = mb['MemFree'] + mb.get('Buffers', 0) + mb.get('Cached', 0)
+    total = mb.get('MemTotal')
+    if total:
+        mb['MemUsed%'] = 100.0 - 100.0 * mb.get('MemAvailable', 0) / total
+        if 'SUnreclaim' in mb:
+            mb['SUnreclaim%'] = 100.0 * mb['SUnreclaim'] / total
+    if 'SwapTotal' in mb and 'SwapFree' in mb:
+        mb['SwapUsed'] = mb['SwapTotal'] - mb['SwapFree']
+        mb['SwapUsed%'] = 100.0 * mb['SwapUsed'] / mb['SwapTotal'] if mb['SwapTotal'] else 0.0
+    if 'HugePages_Total' in mb and 'Hugepagesize' in mb:
+        mb['HugePagesMB'] = mb['HugePages_Total'] * mb['Hugepagesize']
+        mb['HugePagesUsedMB'] = (mb['HugePages_Total'] - mb.get('HugePages_Free', 0)) * mb['Hugepagesize']
+    if mb.get('CommitLimit') and 'Committed_AS' in mb:
+        mb['Commit%'] = 100.0 * mb['Committed_AS'] / mb['CommitLimit']
+    return mb
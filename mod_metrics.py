@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import csv
+
+from mod_stats import StreamStats, fmtRed
+
+METRIC_FIELDS = ['name', 'source', 'field', 'key', 'decimals', 'threshold', 'description']
+SOURCES = ['vmstat', 'sar', 'meminfo']
+
+
+class Metric(object):
+    """One metric of the registry (one line of metrics.conf)."""
+    __slots__ = METRIC_FIELDS
+
+    def __init__(self, name, source, field, key, decimals, threshold, description):
+        self.name = name
+        self.source = source
+        self.field = field
+        self.key = key
+        self.decimals = decimals
+        self.threshold = threshold
+        self.description = description
+
+    def stats(self, values):
+        """
+        [avg, sd, min, p95, p99, max] of the samples (a series or a
+        StreamStats of them), avg in red above the threshold.
+        """
+        acc = values if isinstance(values, StreamStats) else StreamStats(values)
+        row = [round(v, self.decimals) for v in (acc.sd(), acc.min, acc.quantile(0.95),
+                                                 acc.quantile(0.99), acc.max)]
+        return [self.value(acc.mean)] + row
+
+    def record(self, values):
+        """{avg, sd, min, p95, p99, max, threshold, verdict} of the samples (a series or a StreamStats) for the JSON summary."""
+        acc = values if isinstance(values, StreamStats) else StreamStats(values)
+        record = dict((name, round(v, self.decimals)) for (name, v) in
+                      [('avg', acc.mean), ('sd', acc.sd()), ('min', acc.min), ('p95', acc.quantile(0.95)),
+                       ('p99', acc.quantile(0.99)), ('max', acc.max)])
+        record.update(name=self.name, source=self.source, field=self.field, samples=acc.count,
+                      threshold=self.threshold, verdict=self.verdict(acc.mean))
+        return record
+
+    def value(self, value):
+        """value rounded to the metric's decimals, in red above the threshold."""
+        value = round(value, self.decimals)
+        if self.verdict(value) == 'high':
+            return fmtRed(value)
+        return value
+
+    def verdict(self, value):
+        """'high' above the threshold, 'ok' at or below it, None without a threshold."""
+        if self.threshold is None:
+            return None
+        return 'high' if round(value, self.decimals) > self.threshold else 'ok'
+
+
+def load_metrics(path):
+    """
+    Read the metric registry: comma separated name, source, field, key,
+    decimals, threshold, description per line, '#' lines are comments.
+    Returns the metrics in file order.
+    """
+    metrics = []
+    with open(path) as fh:
+        for (line_num, row) in enumerate(csv.reader(fh), 1):
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) != len(METRIC_FIELDS):
+                raise ValueError('{0} line {1}: expected {2} fields, found {3}'.format(
+                    path, line_num, len(METRIC_FIELDS), len(row)))
+            (name, source, field, key, decimals, threshold, description) = [value.strip() for value in row]
+            if source not in SOURCES:
+                raise ValueError('{0} line {1}: unknown source {2}'.format(path, line_num, source))
+            try:
+                decimals = int(decimals)
+                threshold = float(threshold) if threshold else None
+            except ValueError:
+                raise ValueError('{0} line {1}: decimals and threshold must be numbers'.format(path, line_num))
+            metrics.append(Metric(name, source, field, key, decimals, threshold, description))
+    return metrics
+
+
+def source_fields(metrics, source):
+    """{field: key} of the metrics read from source (key '' for unkeyed fields)."""
+    return dict((metric.field, metric.key) for metric in metrics if metric.source == source)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+from mod_sar import SarData
+from mod_stats import StreamStats
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# mpstat -P ALL columns kept per CPU (older sysstat releases use the alias names)
+FIELDS = ['%usr', '%nice', '%sys', '%iowait', '%irq', '%soft', '%steal', '%guest', '%gnice', '%idle']
+ALIASES = {'%user': '%usr', '%system': '%sys'}
+KEY = 'CPU'
+ALL = 'all'
+
+# a CPU is hot when it is at least SATURATED_BUSY % busy (100 - %idle) in
+# SATURATED_SAMPLES of the samples, and high steal is an avg %steal of
+# STEAL_THRESHOLD or more
+SATURATED_BUSY = 95.0
+SATURATED_SAMPLES = 0.5
+STEAL_THRESHOLD = 10.0
+
+
+def mpstat_samples(fh):
+    """
+    Yield ([CPU], {field: [value per CPU]}) per interval of mpstat -P ALL
+    output in fh ('all' is a CPU too), skipping the Average: lines.  An
+    interval ends when a CPU shows up again, so the header may be printed
+    once or per interval.
+    """
+    cols = []
+    cpus = []
+    values = {}
+    seen = set()
+    for line in fh:
+        row = line.split()
+        if not row or row[0].startswith('Average'):
+            continue
+        if KEY in row and row[-1].startswith('%'):
+            header = [ALIASES.get(h, h) for h in row[row.index(KEY) + 1:]]
+            # values are taken from the end of the row, the time may be one or two words
+            cols = [(i - len(header), h) for (i, h) in enumerate(header) if h in FIELDS]
+            continue
+        if not cols or len(row) <= len(header):
+            continue
+        cpu = row[-len(header) - 1]
+        try:
+            sample = [(h, float(row[i])) for (i, h) in cols]
+        except ValueError:
+            continue
+        if cpu in seen:
+            yield (cpus, values)
+            cpus = []
+            values = {}
+            seen = set()
+        seen.add(cpu)
+        cpus.append(cpu)
+        for (h, value) in sample:
+            values.setdefault(h, []).append(value)
+    if cpus:
+        yield (cpus, values)
+
+
+def read_mpstat(path):
+    """SarData of mpstat -P ALL output: a CPUs x samples matrix per % field, key CPU."""
+    mp = SarData(dict((field, KEY) for field in FIELDS))
+    with open(path) as fh:
+        for (j, (cpus, values)) in enumerate(mpstat_samples(fh)):
+            mp.add_keyed(j, KEY, cpus, values)
+    return mp.finish()
+
+
+class CpuAnalysis(object):
+    """
+    Per-CPU summary of mpstat data (read_mpstat()):
+
+    cpus        CPU ids in numeric order ('all' left out)
+    avg         {cpu: {field: avg}}, 'all' included
+    busy        {cpu: StreamStats of busy % (100 - %idle)}, 'all' included
+    saturated   {cpu: share of samples at least SATURATED_BUSY % busy}, 'all' included
+    hot         [(cpu, field with the highest avg)] of the CPUs saturated in
+                at least SATURATED_SAMPLES of the samples
+    steal       CPUs ('all' for the host) with avg %steal >= STEAL_THRESHOLD
+    imbalance   0 when all CPUs are equally busy, 1 when one CPU does all the
+                work: per sample (max - mean) / (max - max / CPUs) of busy %,
+                summed over the samples before dividing so idle samples
+                carry little weight
+
+    Example:
+    cpu = CpuAnalysis(read_mpstat('mpstat.out'))
+    for (cpu_id, field) in cpu.hot:
+        print(cpu_id, field, cpu.busy[cpu_id].mean)
+    """
+
+    def __init__(self, mp):
+        cpus = [cpu for cpu in mp.key_values(KEY) if cpu != ALL]
+        self.cpus = sorted(cpus, key=lambda cpu: int(cpu) if cpu.isdigit() else -1)
+        self.avg = {}
+        self.busy = {}
+        self.saturated = {}
+        self.hot = []
+        self.steal = []
+        self.imbalance = 0.0
+
+        fields = [field for field in FIELDS if field in mp.matrix]
+        for cpu in mp.key_values(KEY):
+            self.avg[cpu] = dict((field, StreamStats(mp.values(field, cpu)).mean) for field in fields)
+        if '%idle' not in fields:
+            return
+
+        # busy % as CPUs x samples (NaN where a CPU was offline), rows in self.cpus order
+        rows = mp.keys[KEY]
+        idle = mp.matrix['%idle']
+        if numpy is not None:
+            busy = 100.0 - idle[[rows[cpu] for cpu in self.cpus]]
+            valid = ~numpy.isnan(busy)
+            saturated = (numpy.where(valid, busy, 0.0) >= SATURATED_BUSY).sum(axis=1) / numpy.maximum(valid.sum(axis=1), 1)
+            if len(self.cpus) > 1 and busy.shape[1]:
+                n = valid.sum(axis=0)
+                top = numpy.where(valid, busy, -1.0).max(axis=0)
+                mean = numpy.where(valid, busy, 0.0).sum(axis=0) / numpy.maximum(n, 1)
+                used = (n > 1) & (top > 0)
+                spread = (top - top / numpy.maximum(n, 1))[used].sum()
+                self.imbalance = float((top - mean)[used].sum() / spread) if spread > 0 else 0.0
+            for (r, cpu) in enumerate(self.cpus):
+                self.busy[cpu] = StreamStats(busy[r])
+                self.saturated[cpu] = float(saturated[r])
+        else:
+            busy = [[100.0 - v for v in idle[rows[cpu]]] for cpu in self.cpus]
+            for (r, cpu) in enumerate(self.cpus):
+                self.busy[cpu] = acc = StreamStats(busy[r])
+                self.saturated[cpu] = (sum(1 for v in busy[r] if v >= SATURATED_BUSY) / float(acc.count)
+                                       if acc.count else 0.0)
+            if len(self.cpus) > 1:
+                (excess, spread) = (0.0, 0.0)
+                for column in zip(*busy):
+                    column = [v for v in column if v == v]
+                    top = max(column) if column else 0.0
+                    if len(column) > 1 and top > 0:
+                        excess += top - sum(column) / len(column)
+                        spread += top - top / len(column)
+                self.imbalance = excess / spread if spread > 0 else 0.0
+
+        if ALL in rows:
+            host = [100.0 - v for v in mp.values('%idle', ALL)]
+            self.busy[ALL] = StreamStats(host)
+            self.saturated[ALL] = sum(1 for v in host if v >= SATURATED_BUSY) / float(len(host)) if host else 0.0
+
+        for cpu in self.cpus:
+            if self.saturated[cpu] >= SATURATED_SAMPLES:
+                usage = [(avg, field) for (field, avg) in self.avg[cpu].items() if field != '%idle']
+                self.hot.append((cpu, max(usage)[1]))
+        if '%steal' in fields:
+            self.steal = [cpu for cpu in [ALL] + self.cpus
+                          if cpu in self.avg and self.avg[cpu]['%steal'] >= STEAL_THRESHOLD]
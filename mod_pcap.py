@@ -0,0 +1,974 @@
+#!/usr/bin/env python3
+
+import bz2
+import gzip
+import lzma
+import mmap
+import multiprocessing
+import os
+import re
+import socket
+import struct
+import subprocess
+import threading
+from time import localtime, strftime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from mod_stats import RateSeries, SpaceSaving
+from mod_tcp import TcpLatency
+
+# libpcap file magic (first 4 bytes of the file) -> (byte order, timestamp scale)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAP_HEADER_LEN = 24
+PCAP_RECORD_LEN = 16
+
+# pcapng block types and section header byte-order magic
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER = {
+    b'\x4d\x3c\x2b\x1a': '<',
+    b'\x1a\x2b\x3c\x4d': '>',
+}
+PCAPNG_OPT_TSRESOL = 9
+PCAPNG_OPT_TSOFFSET = 14
+
+# compressed captures are recognized by their leading bytes
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bzip2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+
+# bytes read from a (decompressed) capture stream at a time
+STREAM_CHUNK = 4 * 1024 * 1024
+
+# sharding: consecutive valid headers needed to trust a resync point, the
+# longest capture a record timestamp may be from the first one, and the
+# smallest byte range worth handing to a worker process
+RESYNC_RECORDS = 8
+MAX_CAPTURE_SEC = 7 * 86400
+MIN_SHARD_SIZE = 4 * 1024 * 1024
+
+# snaplen that keeps link, IP (with IPv6 extension headers) and TCP headers
+HEADER_SNAPLEN = 128
+
+# packet counts tcpdump prints to stderr when it exits
+TCPDUMP_STATS = re.compile(r'^(\d+) packets? (captured|received by filter|dropped by kernel|dropped by interface)',
+                           re.MULTILINE)
+
+# link layer types written by tcpdump on Linux
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IP = 0x0800
+ETHERTYPE_IP6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+
+# names match the protocol column tcpdump -nn prints for non-IP frames
+ETHERTYPE_NAMES = {
+    0x0806: 'ARP',
+    0x8035: 'RARP',
+    0x88cc: 'LLDP',
+    0x888e: 'EAPOL',
+    0x8809: 'LACP',
+    0x8847: 'MPLS',
+    0x8848: 'MPLS',
+}
+
+# IP packets are counted by transport protocol for both versions; the text
+# decoder (tcpdump-analyze.py -t) counts IPv6 as 'IP6' and other IPv4 as 'TCP'
+IP_PROTO_NAMES = {
+    1: 'ICMP',
+    2: 'IGMP',
+    6: 'TCP',
+    17: 'UDP',
+    47: 'GRE',
+    50: 'ESP',
+    51: 'AH',
+    58: 'ICMP6',
+    112: 'VRRP',
+    132: 'SCTP',
+}
+
+# IPv6 extension headers that have to be skipped to find the transport header
+IP6_EXT_HEADERS = (0, 43, 44, 51, 60)
+
+# TCP flag bytes counted per talker, same classification as the tcpdump
+# text parser ([.], [P.], [S], [S.], [R], [F.], [none]); a packet counts only
+# when its flags are exactly one of these, other combinations only in count
+TCP_ACK = 0x10
+TCP_PUSH = 0x18
+TCP_SYN = 0x02
+TCP_SYNA = 0x12
+TCP_RST = 0x04
+TCP_FIN = 0x11
+TCP_NONE = 0x00
+FLAG_LEGEND = ('flags: syn SYN, syna SYN+ACK, fin FIN+ACK, rst RST, ack ACK only, push PSH+ACK, '
+               'none no flags set; other combinations are only in count')
+
+u16 = struct.Struct('!H')
+u32x2 = struct.Struct('!II')
+NO_PORT = b'\x00\x00'
+
+
+class Talker(object):
+    """Packet, byte and TCP flag counters for a pair of IPs."""
+    __slots__ = ('count', 'bytes', 'syn', 'syna', 'fin', 'rst', 'ack', 'none', 'push')
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.syn = 0
+        self.syna = 0
+        self.fin = 0
+        self.rst = 0
+        self.ack = 0
+        self.none = 0
+        self.push = 0
+
+    def merge(self, other):
+        for counter in self.__slots__:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+
+
+class Conversation(object):
+    """Packet and byte counters for a pair of IP:port endpoints."""
+    __slots__ = ('count', 'bytes')
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+
+    def merge(self, other):
+        self.count += other.count
+        self.bytes += other.bytes
+
+
+# Flow table keys are packed address bytes, normalized the same way as the
+# text keys ('ip1;ip2' and 'ip1:port1;ip2:port2'):
+#   talker       = ip1 + ip2
+#   conversation = ip1 + port1 + ip2 + port2 (ports as 2 byte big endian)
+# Strings are only built for the rows that get printed.
+
+def pack_ip(ip):
+    """Packed bytes for an address string (None if it is not an IP)."""
+    ip = ip.split('%')[0].split('/')[0]
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return socket.inet_pton(family, ip)
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def format_ip(addr):
+    return socket.inet_ntop(socket.AF_INET if len(addr) == 4 else socket.AF_INET6, addr)
+
+
+def format_talker(key):
+    """Printable talker ('ip1 ip2') from a packed or text key."""
+    if isinstance(key, str):
+        return key.replace(';', ' ')
+    half = len(key) // 2
+    return '{0} {1}'.format(format_ip(key[:half]), format_ip(key[half:]))
+
+
+def format_conversation(key):
+    """Printable conversation ('ip1:port1 ip2:port2') from a packed or text key."""
+    if isinstance(key, str):
+        return key.replace(';', ' ')
+    half = len(key) // 2
+    return '{0}:{1} {2}:{3}'.format(format_ip(key[:half - 2]), u16.unpack_from(key, half - 2)[0],
+                                    format_ip(key[half:-2]), u16.unpack_from(key, len(key) - 2)[0])
+
+
+class PacketSummary(object):
+    """
+    Talker, conversation, flag and protocol counters for a capture.
+
+    Counters are the same as the ones tcpdump-analyze.py builds from
+    tcpdump -nn -tt text output, so either path can feed the same report.
+    Decoded packets use packed keys (see format_talker/format_conversation).
+
+    With max_entries set, talkers and conversations are SpaceSaving tables
+    holding at most max_entries keys each instead of one dict entry per flow.
+
+    Frame lengths (on the wire) are summed per talker, conversation and
+    direction, and into a per-second RateSeries (plus a finer one when
+    fine_interval is set, e.g. 0.1 for 100ms).
+
+    With latency set, TCP segments are also fed to a TcpLatency engine for
+    handshake RTT, retransmissions and dup-ACKs per remote host (holding at
+    most max_entries flows and handshakes when max_entries is set).
+    """
+
+    def __init__(self, host_ips, max_entries=None, fine_interval=None, latency=False):
+        self.host_ips = set(pack_ip(ip) for ip in host_ips)
+        self.max_entries = max_entries
+        if max_entries:
+            self.talkers = SpaceSaving(max_entries, Talker)
+            self.conversations = SpaceSaving(max_entries, Conversation)
+        else:
+            self.talkers = {}
+            self.conversations = {}
+        self.proto_count = {}
+        self.ts_start = None
+        self.ts_end = None
+        self.count_total = 0
+        self.count_ingress = 0
+        self.count_egress = 0
+        self.count_internal = 0
+        self.count_unknown = 0
+        self.count_rst = 0
+        self.count_fin = 0
+        self.count_syn = 0
+        self.count_syna = 0
+        self.bytes_total = 0
+        self.bytes_ingress = 0
+        self.bytes_egress = 0
+        self.bytes_internal = 0
+        self.bytes_unknown = 0
+        self.series = RateSeries(1.0)
+        self.fine_series = RateSeries(fine_interval) if fine_interval else None
+        self.tcp = TcpLatency(self.host_ips, max_entries) if latency else None
+        # tcpdump's own packet counts (see parse_tcpdump_stats) when known
+        self.capture_stats = None
+
+    def duration(self):
+        if self.ts_start is None:
+            return 0.0
+        return float(self.ts_end) - float(self.ts_start)
+
+    def add(self, ts, linktype, buf, off, caplen, wirelen):
+        """Decode one captured frame starting at buf[off] and update the counters."""
+        self.count_total += 1
+        self.bytes_total += wirelen
+        if self.ts_start is None:
+            self.ts_start = ts
+        self.ts_end = ts
+        self.series.add(ts, wirelen)
+        if self.fine_series is not None:
+            self.fine_series.add(ts, wirelen)
+        end = off + caplen
+
+        # link layer
+        if linktype == LINKTYPE_ETHERNET:
+            if caplen < 14:
+                self._count_proto('truncated')
+                return
+            ethertype = u16.unpack_from(buf, off + 12)[0]
+            off += 14
+            while ethertype in ETHERTYPE_VLAN and off + 4 <= end:
+                ethertype = u16.unpack_from(buf, off + 2)[0]
+                off += 4
+            if ethertype < 0x0600:
+                # 802.3 length field, LLC follows (0x42 = spanning tree)
+                self._count_proto('STP' if off < end and buf[off] == 0x42 else 'LLC')
+                return
+        elif linktype == LINKTYPE_LINUX_SLL:
+            if caplen < 16:
+                self._count_proto('truncated')
+                return
+            ethertype = u16.unpack_from(buf, off + 14)[0]
+            off += 16
+        elif linktype == LINKTYPE_LINUX_SLL2:
+            if caplen < 20:
+                self._count_proto('truncated')
+                return
+            ethertype = u16.unpack_from(buf, off)[0]
+            off += 20
+        elif linktype == LINKTYPE_NULL:
+            if caplen < 4:
+                self._count_proto('truncated')
+                return
+            family = buf[off] or buf[off + 3]
+            ethertype = ETHERTYPE_IP if family == socket.AF_INET else ETHERTYPE_IP6
+            off += 4
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            if caplen < 1:
+                self._count_proto('truncated')
+                return
+            ethertype = ETHERTYPE_IP if buf[off] >> 4 == 4 else ETHERTYPE_IP6
+        else:
+            self._count_proto('linktype {0}'.format(linktype))
+            return
+
+        # network layer
+        if ethertype == ETHERTYPE_IP:
+            if off + 20 > end:
+                self._count_proto('truncated')
+                return
+            ihl = (buf[off] & 0x0f) * 4
+            ip_proto = buf[off + 9]
+            fragment = u16.unpack_from(buf, off + 6)[0] & 0x1fff
+            l4_len = u16.unpack_from(buf, off + 2)[0] - ihl
+            src = buf[off + 12:off + 16]
+            dst = buf[off + 16:off + 20]
+            off += ihl
+        elif ethertype == ETHERTYPE_IP6:
+            if off + 40 > end:
+                self._count_proto('truncated')
+                return
+            ip_proto = buf[off + 6]
+            fragment = 0
+            l4_len = u16.unpack_from(buf, off + 4)[0]
+            src = buf[off + 8:off + 24]
+            dst = buf[off + 24:off + 40]
+            off += 40
+            while ip_proto in IP6_EXT_HEADERS and off + 8 <= end:
+                if ip_proto == 44:
+                    fragment = u16.unpack_from(buf, off + 2)[0] & 0xfff8
+                    ext_len = 8
+                elif ip_proto == 51:
+                    ext_len = (buf[off + 1] + 2) * 4
+                else:
+                    ext_len = (buf[off + 1] + 1) * 8
+                ip_proto = buf[off]
+                off += ext_len
+                l4_len -= ext_len
+        else:
+            self._count_proto(ETHERTYPE_NAMES.get(ethertype, 'ethertype 0x{0:04x}'.format(ethertype)))
+            return
+
+        proto = IP_PROTO_NAMES.get(ip_proto)
+        if proto is None:
+            proto = 'ip-proto-{0}'.format(ip_proto)
+        self._count_proto(proto)
+
+        # transport layer (non-first fragments and ICMP have no ports)
+        port_src = port_dest = NO_PORT
+        flags = None
+        if not fragment and off + 4 <= end and (ip_proto == 6 or ip_proto == 17 or ip_proto == 132):
+            port_src = buf[off:off + 2]
+            port_dest = buf[off + 2:off + 4]
+            if ip_proto == 6 and off + 14 <= end:
+                flags = buf[off + 13]
+
+        # Figure out direction and normalize conversations for counting
+        host_ips = self.host_ips
+        if src in host_ips and dst in host_ips:
+            self.count_internal += 1
+            self.bytes_internal += wirelen
+            swap = src <= dst
+        elif src in host_ips:
+            self.count_egress += 1
+            self.bytes_egress += wirelen
+            swap = False
+        elif dst in host_ips:
+            self.count_ingress += 1
+            self.bytes_ingress += wirelen
+            swap = True
+        else:
+            self.count_unknown += 1
+            self.bytes_unknown += wirelen
+            swap = src <= dst
+        if swap:
+            talker = dst + src
+            conversation = dst + port_dest + src + port_src
+        else:
+            talker = src + dst
+            conversation = src + port_src + dst + port_dest
+
+        conv = self.conversations.get(conversation)
+        if conv is None:
+            if self.max_entries:
+                conv = self.conversations.insert(conversation)
+            else:
+                conv = self.conversations[conversation] = Conversation()
+        conv.count += 1
+        conv.bytes += wirelen
+
+        talker_rec = self.talkers.get(talker)
+        if talker_rec is None:
+            if self.max_entries:
+                talker_rec = self.talkers.insert(talker)
+            else:
+                talker_rec = self.talkers[talker] = Talker()
+        talker_rec.count += 1
+        talker_rec.bytes += wirelen
+
+        if flags is None:
+            return
+        if self.tcp is not None and off + 16 <= end:
+            (seq, ack) = u32x2.unpack_from(buf, off + 4)
+            payload_len = l4_len - (buf[off + 12] >> 4) * 4
+            self.tcp.add(ts, src, port_src, dst, port_dest, flags, seq, ack, payload_len if payload_len > 0 else 0)
+        if flags == TCP_ACK:
+            talker_rec.ack += 1
+        elif flags == TCP_PUSH:
+            talker_rec.push += 1
+        elif flags == TCP_SYN:
+            talker_rec.syn += 1
+            self.count_syn += 1
+        elif flags == TCP_SYNA:
+            talker_rec.syna += 1
+            self.count_syna += 1
+        elif flags == TCP_RST:
+            talker_rec.rst += 1
+            self.count_rst += 1
+        elif flags == TCP_FIN:
+            talker_rec.fin += 1
+            self.count_fin += 1
+        elif flags == TCP_NONE:
+            talker_rec.none += 1
+
+    def _count_proto(self, proto):
+        self.proto_count[proto] = self.proto_count.get(proto, 0) + 1
+
+    def merge(self, other):
+        """Add the counters of another PacketSummary (e.g. from another shard) to this one."""
+        if self.max_entries:
+            self.talkers.merge(other.talkers)
+            self.conversations.merge(other.conversations)
+        else:
+            for talker, rec in other.talkers.items():
+                talker_rec = self.talkers.get(talker)
+                if talker_rec is None:
+                    self.talkers[talker] = rec
+                else:
+                    talker_rec.merge(rec)
+            for conversation, rec in other.conversations.items():
+                conv = self.conversations.get(conversation)
+                if conv is None:
+                    self.conversations[conversation] = rec
+                else:
+                    conv.merge(rec)
+        for proto, count in other.proto_count.items():
+            self.proto_count[proto] = self.proto_count.get(proto, 0) + count
+        # shards can finish in any order, so use the earliest start and latest end
+        if other.ts_start is not None:
+            if self.ts_start is None or other.ts_start < self.ts_start:
+                self.ts_start = other.ts_start
+            if self.ts_end is None or other.ts_end > self.ts_end:
+                self.ts_end = other.ts_end
+        self.count_total += other.count_total
+        self.count_ingress += other.count_ingress
+        self.count_egress += other.count_egress
+        self.count_internal += other.count_internal
+        self.count_unknown += other.count_unknown
+        self.count_rst += other.count_rst
+        self.count_fin += other.count_fin
+        self.count_syn += other.count_syn
+        self.count_syna += other.count_syna
+        self.bytes_total += other.bytes_total
+        self.bytes_ingress += other.bytes_ingress
+        self.bytes_egress += other.bytes_egress
+        self.bytes_internal += other.bytes_internal
+        self.bytes_unknown += other.bytes_unknown
+        self.series.merge(other.series)
+        if self.fine_series is not None:
+            self.fine_series.merge(other.fine_series)
+        # live intervals share the TcpLatency engine of their total
+        if self.tcp is not None and other.tcp is not self.tcp:
+            self.tcp.merge(other.tcp)
+
+
+class PcapFile(object):
+    """
+    Memory-mapped libpcap capture file.
+
+    Example:
+    pcap = PcapFile('tcpdump.pcap')
+    summary = PacketSummary(host_ips)
+    pcap.feed(summary)
+    pcap.close()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fh = open(path, 'rb')
+        try:
+            self.buf = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            self.fh.close()
+            raise ValueError('{0} is not a libpcap file'.format(path))
+        magic = self.buf[0:4]
+        if magic not in PCAP_MAGIC or len(self.buf) < PCAP_HEADER_LEN:
+            self.close()
+            raise ValueError('{0} is not a libpcap file'.format(path))
+        (endian, self.ts_scale) = PCAP_MAGIC[magic]
+        self.record = struct.Struct(endian + 'IIII')
+        (self.snaplen, self.linktype) = struct.unpack_from(endian + 'II', self.buf, 16)
+        self.size = len(self.buf)
+
+    def close(self):
+        self.buf.close()
+        self.fh.close()
+
+    def feed(self, summary, start=PCAP_HEADER_LEN, end=None):
+        """
+        Decode every record that starts in [start, end) into summary.
+        Returns the number of records read.
+        """
+        if end is None:
+            end = self.size
+        buf = self.buf
+        size = self.size
+        unpack_record = self.record.unpack_from
+        ts_scale = self.ts_scale
+        linktype = self.linktype
+        add = summary.add
+        count = 0
+        off = start
+        while off < end and off + PCAP_RECORD_LEN <= size:
+            (ts_sec, ts_frac, caplen, wirelen) = unpack_record(buf, off)
+            off += PCAP_RECORD_LEN
+            if off + caplen > size:
+                # capture was cut short (tcpdump killed mid-write)
+                break
+            add(ts_sec + ts_frac * ts_scale, linktype, buf, off, caplen, wirelen)
+            off += caplen
+            count += 1
+        return count
+
+    def valid_record(self, off, first_sec):
+        """Check if a plausible record header starts at off."""
+        if off + PCAP_RECORD_LEN > self.size:
+            return False
+        (ts_sec, ts_frac, caplen, wirelen) = self.record.unpack_from(self.buf, off)
+        return (caplen <= wirelen and caplen <= max(self.snaplen, 65535) and
+                ts_frac < 1.0 / self.ts_scale and
+                first_sec <= ts_sec <= first_sec + MAX_CAPTURE_SEC and
+                off + PCAP_RECORD_LEN + caplen <= self.size)
+
+    def find_record(self, off):
+        """
+        Find the first record header at or after byte offset off.
+        libpcap has no sync markers, so a candidate is accepted when it and
+        the following RESYNC_RECORDS headers chained after it all look valid.
+        """
+        if self.size <= PCAP_HEADER_LEN + PCAP_RECORD_LEN:
+            return self.size
+        first_sec = self.record.unpack_from(self.buf, PCAP_HEADER_LEN)[0]
+        while off < self.size:
+            pos = off
+            for _i in range(RESYNC_RECORDS):
+                if pos == self.size:
+                    break
+                if not self.valid_record(pos, first_sec):
+                    break
+                pos += PCAP_RECORD_LEN + self.record.unpack_from(self.buf, pos)[2]
+            else:
+                return off
+            if pos == self.size:
+                return off
+            off += 1
+        return self.size
+
+    def split(self, shards, min_size=MIN_SHARD_SIZE):
+        """Split the file into at most shards record-aligned (start, end) byte ranges."""
+        data_len = self.size - PCAP_HEADER_LEN
+        shards = max(1, min(shards, data_len // min_size))
+        bounds = [PCAP_HEADER_LEN]
+        for i in range(1, shards):
+            off = self.find_record(PCAP_HEADER_LEN + data_len * i // shards)
+            if off > bounds[-1]:
+                bounds.append(off)
+        bounds.append(self.size)
+        return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+
+def analyze_range(path, host_ips, start, end, max_entries=None, fine_interval=None, latency=False):
+    """Decode one byte range of a pcap file (process pool worker)."""
+    summary = PacketSummary(host_ips, max_entries, fine_interval, latency)
+    pcap = PcapFile(path)
+    pcap.feed(summary, start, end)
+    pcap.close()
+    return summary
+
+
+def analyze_parallel(path, host_ips, jobs, max_entries=None, fine_interval=None, latency=False):
+    """
+    Decode a pcap file in up to jobs processes and merge the shard summaries.
+    TCP handshakes that straddle a shard boundary are not sampled.
+    """
+    pcap = PcapFile(path)
+    ranges = pcap.split(jobs)
+    pcap.close()
+    summary = PacketSummary(host_ips, max_entries, fine_interval, latency)
+    if len(ranges) <= 1:
+        for (start, end) in ranges:
+            summary.merge(analyze_range(path, host_ips, start, end, max_entries, fine_interval, latency))
+        return summary
+    pool = multiprocessing.Pool(len(ranges))
+    try:
+        results = pool.starmap(analyze_range, [(path, host_ips, start, end, max_entries, fine_interval, latency)
+                                               for (start, end) in ranges])
+    finally:
+        pool.close()
+        pool.join()
+    for shard in results:
+        summary.merge(shard)
+    return summary
+
+
+class PipeStream(object):
+    """Read the stdout of a decompression command as a binary stream."""
+
+    def __init__(self, cmd):
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+    def read(self, size=-1):
+        return self.process.stdout.read(size)
+
+    def close(self):
+        self.process.stdout.close()
+        self.process.wait()
+
+
+def compression(path):
+    """Name of the compression used by a file (None if not compressed)."""
+    with open(path, 'rb') as fh:
+        head = fh.read(6)
+    for (magic, name) in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_capture(path):
+    """
+    Open a capture as a binary stream, decompressing gzip, bzip2, xz or zstd
+    on the fly (never to a temporary file).  zstd uses the zstandard module
+    when it is installed and the zstd command otherwise.
+    """
+    kind = compression(path)
+    if kind == 'gzip':
+        return gzip.open(path, 'rb')
+    if kind == 'bzip2':
+        return bz2.open(path, 'rb')
+    if kind == 'xz':
+        return lzma.open(path, 'rb')
+    if kind == 'zstd':
+        if zstandard is not None:
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return PipeStream(['zstd', '-dcq', path])
+    return open(path, 'rb')
+
+
+def read_exact(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def feed_pcap_stream(summary, stream, head):
+    """Decode a libpcap stream (after its first 4 bytes, head) into summary."""
+    header = head + read_exact(stream, PCAP_HEADER_LEN - len(head))
+    if len(header) < PCAP_HEADER_LEN:
+        return 0
+    (endian, ts_scale) = PCAP_MAGIC[head]
+    linktype = struct.unpack_from(endian + 'I', header, 20)[0]
+    unpack_record = struct.Struct(endian + 'IIII').unpack_from
+    add = summary.add
+    count = 0
+    buf = b''
+    while True:
+        chunk = stream.read(STREAM_CHUNK)
+        if not chunk:
+            break
+        buf += chunk
+        size = len(buf)
+        off = 0
+        while off + PCAP_RECORD_LEN <= size:
+            (ts_sec, ts_frac, caplen, wirelen) = unpack_record(buf, off)
+            if off + PCAP_RECORD_LEN + caplen > size:
+                break
+            add(ts_sec + ts_frac * ts_scale, linktype, buf, off + PCAP_RECORD_LEN, caplen, wirelen)
+            off += PCAP_RECORD_LEN + caplen
+            count += 1
+        # keep the partial record for the next chunk
+        buf = buf[off:]
+    return count
+
+
+def pcapng_interface(block, endian, total_len):
+    """(linktype, snaplen, ts_scale, ts_offset) from an Interface Description Block."""
+    (linktype, _reserved, snaplen) = struct.unpack_from(endian + 'HHI', block, 8)
+    ts_scale = 1e-6
+    ts_offset = 0
+    off = 16
+    while off + 4 <= total_len - 4:
+        (code, length) = struct.unpack_from(endian + 'HH', block, off)
+        if code == 0:
+            break
+        if code == PCAPNG_OPT_TSRESOL and length >= 1:
+            resol = block[off + 4]
+            if resol & 0x80:
+                ts_scale = 2.0 ** -(resol & 0x7f)
+            else:
+                ts_scale = 10.0 ** -resol
+        elif code == PCAPNG_OPT_TSOFFSET and length >= 8:
+            ts_offset = struct.unpack_from(endian + 'q', block, off + 4)[0]
+        off += 4 + (length + 3) // 4 * 4
+    return (linktype, snaplen, ts_scale, ts_offset)
+
+
+def feed_pcapng_stream(summary, stream, head):
+    """
+    Decode a pcapng stream (after its first 4 bytes, head) into summary.
+    Handles multiple sections and interfaces, each with its own link type and
+    timestamp resolution.  Simple packet blocks carry no timestamp and get the
+    time of the previous packet.
+    """
+    add = summary.add
+    count = 0
+    endian = '<'
+    interfaces = []
+    ts = 0.0
+    buf = head
+    eof = False
+    while not eof:
+        chunk = stream.read(STREAM_CHUNK)
+        if not chunk:
+            eof = True
+        buf += chunk
+        size = len(buf)
+        off = 0
+        while off + 12 <= size:
+            block_type = struct.unpack_from('<I', buf, off)[0]
+            if block_type == PCAPNG_SHB:
+                # a new section can switch byte order and resets the interfaces
+                endian = PCAPNG_BYTE_ORDER.get(bytes(buf[off + 8:off + 12]))
+                if endian is None:
+                    raise ValueError('bad pcapng section header')
+                interfaces = []
+            else:
+                block_type = struct.unpack_from(endian + 'I', buf, off)[0]
+            total_len = struct.unpack_from(endian + 'I', buf, off + 4)[0]
+            if total_len < 12:
+                raise ValueError('bad pcapng block length {0}'.format(total_len))
+            if off + total_len > size:
+                break
+            if block_type == PCAPNG_EPB or block_type == PCAPNG_OPB:
+                if block_type == PCAPNG_EPB:
+                    (iface, ts_high, ts_low, caplen, wirelen) = struct.unpack_from(endian + 'IIIII', buf, off + 8)
+                else:
+                    (iface, _drops, ts_high, ts_low, caplen, wirelen) = struct.unpack_from(endian + 'HHIIII', buf, off + 8)
+                (linktype, _snaplen, ts_scale, ts_offset) = interfaces[iface]
+                ts = ((ts_high << 32) | ts_low) * ts_scale + ts_offset
+                add(ts, linktype, buf, off + 28, caplen, wirelen)
+                count += 1
+            elif block_type == PCAPNG_SPB:
+                (linktype, snaplen, _ts_scale, _ts_offset) = interfaces[0]
+                wirelen = struct.unpack_from(endian + 'I', buf, off + 8)[0]
+                caplen = min(wirelen, snaplen) if snaplen else wirelen
+                add(ts, linktype, buf, off + 12, caplen, wirelen)
+                count += 1
+            elif block_type == PCAPNG_IDB:
+                interfaces.append(pcapng_interface(buf[off:off + total_len], endian, total_len))
+            off += total_len
+        buf = buf[off:]
+    return count
+
+
+def feed_capture(summary, path):
+    """
+    Decode a libpcap or pcapng capture, optionally compressed, into summary
+    in one streaming pass.  Returns the number of packets read.
+    """
+    stream = open_capture(path)
+    try:
+        head = read_exact(stream, 4)
+        if head in PCAP_MAGIC:
+            return feed_pcap_stream(summary, stream, head)
+        if len(head) == 4 and struct.unpack('<I', head)[0] == PCAPNG_SHB:
+            return feed_pcapng_stream(summary, stream, head)
+        raise ValueError('{0} is not a pcap or pcapng capture'.format(path))
+    finally:
+        stream.close()
+
+
+def capture_format(path):
+    """'pcap', 'pcapng' or None for a capture file, looking through compression."""
+    stream = open_capture(path)
+    try:
+        head = read_exact(stream, 4)
+    finally:
+        stream.close()
+    if head in PCAP_MAGIC:
+        return 'pcap'
+    if len(head) == 4 and struct.unpack('<I', head)[0] == PCAPNG_SHB:
+        return 'pcapng'
+    return None
+
+
+class LiveCapture(object):
+    """
+    Run tcpdump writing libpcap to a pipe (-w -) and read it as a stream.
+
+    Reads return whatever the pipe holds instead of waiting for a full chunk,
+    so packets are decoded as they arrive.  With save_file the raw stream is
+    also copied to a pcap file; with duration tcpdump is stopped after that
+    many seconds and with byte_budget once that many bytes were read.
+    tcpdump_args (e.g. ['-s', '128', '-c', '1000', 'tcp']) are added to the
+    tcpdump command line.  After close, stats holds tcpdump's packet counts,
+    stderr what it printed there and returncode its exit status.
+    """
+
+    def __init__(self, interface, save_file=None, duration=None, tcpdump_args=(), byte_budget=None):
+        cmd = ['tcpdump', '-i', interface, '-nn', '-U', '-w', '-'] + list(tcpdump_args)
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.save = open(save_file, 'wb') if save_file else None
+        self.byte_budget = byte_budget
+        self.nbytes = 0
+        self.stats = {}
+        self.stderr = ''
+        self.returncode = None
+        self.timer = None
+        if duration:
+            self.timer = threading.Timer(duration, self.stop)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def read(self, size=-1):
+        data = self.process.stdout.read1(size)
+        if self.save is not None:
+            self.save.write(data)
+        self.nbytes += len(data)
+        if self.byte_budget and self.nbytes >= self.byte_budget:
+            self.stop()
+        return data
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.stop()
+        self.process.stdout.close()
+        self.stderr = self.process.stderr.read().decode('utf-8', 'replace')
+        self.stats = parse_tcpdump_stats(self.stderr)
+        self.process.stderr.close()
+        self.returncode = self.process.wait()
+        if self.save is not None:
+            self.save.close()
+
+
+class LiveSummary(object):
+    """
+    Rolling per-interval summaries of a live capture.
+
+    Packets are decoded into a PacketSummary for the current interval.  When
+    a packet of a later interval arrives, the finished interval is written to
+    out as one line (packets, Mbit/s, direction, TCP flags, top protocols and
+    talkers) and merged into total, which ends up the same as a PacketSummary
+    of the whole capture.  Intervals share the TcpLatency engine of total so
+    handshakes spanning a boundary are still timed.
+    """
+
+    def __init__(self, host_ips, out, interval=1.0, max_entries=None, fine_interval=None, latency=False, top=3):
+        self.host_ips = host_ips
+        self.out = out
+        self.interval = interval
+        self.max_entries = max_entries
+        self.fine_interval = fine_interval
+        self.top = top
+        self.total = PacketSummary(host_ips, max_entries, fine_interval, latency)
+        self.current = None
+        self.current_bin = None
+        self.out.write('{0:<8} {1:>8} {2:>8} {3:>8} {4:>8} {5:>6} {6:>6} {7:>6} {8:>6}  {9}\n'.format(
+            'time', 'packets', 'Mbit/s', 'ingress', 'egress', 'syn', 'syna', 'fin', 'rst',
+            'top protocols / talkers (packets)'))
+
+    def add(self, ts, linktype, buf, off, caplen, wirelen):
+        interval_bin = int(ts / self.interval)
+        if interval_bin != self.current_bin:
+            self.flush()
+            self.current_bin = interval_bin
+            self.current = PacketSummary(self.host_ips, self.max_entries, self.fine_interval)
+            self.current.tcp = self.total.tcp
+        self.current.add(ts, linktype, buf, off, caplen, wirelen)
+
+    def flush(self):
+        """Write the current interval and merge it into total."""
+        summary = self.current
+        if summary is None:
+            return
+        self.current = None
+        protos = sorted(summary.proto_count.items(), key=lambda item: item[1], reverse=True)[:self.top]
+        talkers = sorted(summary.talkers.items(), key=lambda item: item[1].count, reverse=True)[:self.top]
+        self.out.write('{0:<8} {1:>8} {2:>8.2f} {3:>8} {4:>8} {5:>6} {6:>6} {7:>6} {8:>6}  {9} / {10}\n'.format(
+            strftime('%H:%M:%S', localtime(self.current_bin * self.interval)), summary.count_total,
+            summary.bytes_total * 8 / 1e6 / self.interval, summary.count_ingress, summary.count_egress,
+            summary.count_syn, summary.count_syna, summary.count_fin, summary.count_rst,
+            ' '.join('{0}:{1}'.format(proto, count) for (proto, count) in protos),
+            ', '.join('{0} ({1})'.format(format_talker(key), rec.count) for (key, rec) in talkers)))
+        self.out.flush()
+        self.total.merge(summary)
+
+
+def analyze_live(interface, host_ips, out, save_file=None, duration=None, max_entries=None, fine_interval=None,
+                 latency=False, tcpdump_args=(), byte_budget=None):
+    """
+    Capture on interface with tcpdump and decode the packets as they arrive,
+    writing one summary line per second to out.  Only the aggregate is kept
+    unless save_file is given.  Runs until duration seconds have passed, the
+    byte budget is used up, tcpdump exits (e.g. -c) or Ctrl-C; returns the
+    PacketSummary of the whole capture.  ValueError with tcpdump's messages
+    if it wrote no libpcap stream (bad interface, filter or permissions).
+    """
+    live = LiveSummary(host_ips, out, 1.0, max_entries, fine_interval, latency)
+    capture = LiveCapture(interface, save_file, duration, tcpdump_args, byte_budget)
+    head = None
+    try:
+        head = read_exact(capture, 4)
+        if head in PCAP_MAGIC:
+            feed_pcap_stream(live, capture, head)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.close()
+    if head is not None and head not in PCAP_MAGIC:
+        raise ValueError('tcpdump on {0} failed (exit status {1}): {2}'.format(
+            interface, capture.returncode, capture.stderr.strip() or 'no output'))
+    live.flush()
+    live.total.capture_stats = capture.stats
+    return live.total
+
+
+def parse_tcpdump_stats(text):
+    """
+    Packet counts from the lines tcpdump prints when it exits, e.g.
+    {'captured': 1000, 'received by filter': 1200, 'dropped by kernel': 200}.
+    """
+    return dict((match.group(2), int(match.group(1))) for match in TCPDUMP_STATS.finditer(text))
+
+
+def stats_file(path):
+    """tcpdump stats file written next to a capture (tcpdump.pcap3.gz -> tcpdump_stats.out)."""
+    (base, ext) = os.path.splitext(path)
+    if ext in ('.gz', '.bz2', '.xz', '.zst'):
+        base = os.path.splitext(base)[0]
+    return base + '_stats.out'
+
+
+def is_pcap(path):
+    """True for an uncompressed libpcap file (the one format PcapFile can mmap)."""
+    with open(path, 'rb') as fh:
+        return fh.read(4) in PCAP_MAGIC
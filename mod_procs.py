@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+from mod_sar import SarData
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# top -b fields kept per PID and iotop -b fields kept per TID (KB/s, io = read + write)
+TOP_FIELDS = ['%CPU', 'RES']
+IOTOP_FIELDS = ['read', 'write', 'io']
+
+# RES/VIRT are KiB unless top scaled them to fit the column
+MEM_SCALE = {'k': 1.0, 'm': 1024.0, 'g': 1024.0 ** 2, 't': 1024.0 ** 3, 'p': 1024.0 ** 4}
+# iotop bandwidth units -> KB/s
+IO_SCALE = {'B': 1.0 / 1024, 'K': 1.0, 'M': 1024.0, 'G': 1024.0 ** 2}
+
+# RSS grows steadily when it is listed in at least GROWTH_SAMPLES samples,
+# grows by at least GROWTH_KB over them, and a straight line fits with an
+# r2 of at least GROWTH_R2
+GROWTH_SAMPLES = 4
+GROWTH_KB = 1024.0
+GROWTH_R2 = 0.8
+
+
+def _kib(text):
+    """KiB of a top memory column: 13148, 1.2g, 512.0m."""
+    scale = MEM_SCALE.get(text[-1].lower())
+    if scale is None:
+        return float(text)
+    return float(text[:-1]) * scale
+
+
+def _seconds(clock):
+    """Seconds since midnight of hh:mm:ss."""
+    (h, m, s) = clock.split(':')
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+class ProcessData(object):
+    """
+    Per process (or thread) series of top -b or iotop -b samples.
+
+    data        SarData with a processes x samples matrix per field, key
+                PID (top) or TID (iotop), NaN where a process is not listed
+    times       seconds of each sample since the first one
+    commands    {pid: command}, users {pid: user} (the last one seen, a
+                reused PID keeps one series)
+    states      {pid: one state letter per sample, '-' when not listed} (top)
+
+    Example:
+    procs = read_top('top.out')
+    for pid in procs.data.key_values('PID'):
+        print(pid, procs.commands[pid], procs.data.values('RES', pid))
+    """
+
+    def __init__(self, key, fields):
+        self.key = key
+        self.data = SarData(dict((field, key) for field in fields))
+        self.times = []
+        self.commands = {}
+        self.users = {}
+        self.states = {}
+
+    def add(self, seconds, pids, values, users, commands, states=None):
+        """Add one sample: values is {field: [value per pid]}."""
+        j = len(self.times)
+        if self.times and seconds < self.times[-1]:
+            # past midnight
+            seconds += 86400
+        self.times.append(seconds)
+        self.data.add_keyed(j, self.key, pids, values)
+        self.users.update(zip(pids, users))
+        self.commands.update(zip(pids, commands))
+        if states is not None:
+            all_states = self.states
+            for (pid, state) in zip(pids, states):
+                series = all_states.get(pid)
+                if series is None:
+                    series = all_states[pid] = []
+                if len(series) < j:
+                    series.extend('-' * (j - len(series)))
+                series.append(state)
+
+    def finish(self):
+        if self.times:
+            first = self.times[0]
+            self.times = [t - first for t in self.times]
+        for series in self.states.values():
+            if len(series) < len(self.times):
+                series.extend('-' * (len(self.times) - len(series)))
+        self.data.finish()
+        return self
+
+
+def top_samples(fh):
+    """
+    Yield (seconds since midnight, [pid], {field: [value per pid]}, [user],
+    [command], [state]) per snapshot of top -b output in fh.  Columns are
+    found by name in the task header and each task line is split once, so
+    snapshots of tens of thousands of tasks stay cheap.
+    """
+    seconds = None
+    cols = None
+    pids = []
+    for line in fh:
+        if line.startswith('top - '):
+            if cols is not None:
+                yield (seconds, pids, {'%CPU': cpu, 'RES': res}, users, commands, states)
+            seconds = _seconds(line.split()[2])
+            cols = None
+            continue
+        if cols is None:
+            header = line.split()
+            if 'PID' in header and 'COMMAND' in header:
+                width = len(header)
+                cols = [header.index(h) for h in ['PID', 'USER', '%CPU', 'RES', 'S']]
+                (i_pid, i_user, i_cpu, i_res, i_state) = cols
+                i_cmd = header.index('COMMAND')
+                (pids, cpu, res, users, commands, states) = ([], [], [], [], [], [])
+            continue
+        row = line.split(None, width - 1)
+        if len(row) < width:
+            continue
+        try:
+            (task_cpu, task_res) = (float(row[i_cpu].replace(',', '.')), _kib(row[i_res].replace(',', '.')))
+        except ValueError:
+            continue
+        pids.append(row[i_pid])
+        users.append(row[i_user])
+        cpu.append(task_cpu)
+        res.append(task_res)
+        states.append(row[i_state])
+        commands.append(row[i_cmd].rstrip())
+    if cols is not None:
+        yield (seconds, pids, {'%CPU': cpu, 'RES': res}, users, commands, states)
+
+
+def read_top(path):
+    """ProcessData of top -b output (key PID, fields %CPU and RES in KiB)."""
+    procs = ProcessData('PID', TOP_FIELDS)
+    with open(path) as fh:
+        for (seconds, pids, values, users, commands, states) in top_samples(fh):
+            procs.add(seconds, pids, values, users, commands, states)
+    return procs.finish()
+
+
+def iotop_samples(fh):
+    """
+    Yield ([tid], {'read': [KB/s], 'write': [KB/s], 'io': [KB/s]}, [user], [command]) per
+    sample of iotop -b output in fh.  Samples start at the 'Total DISK READ'
+    line; the SWAPIN and IO columns may be ?unavailable? without delay
+    accounting.
+    """
+    tids = None
+    for line in fh:
+        if line.startswith('Total DISK READ'):
+            if tids is not None:
+                yield (tids, {'read': reads, 'write': writes, 'io': [r + w for (r, w) in zip(reads, writes)]},
+                       users, commands)
+            (tids, reads, writes, users, commands) = ([], [], [], [], [])
+            continue
+        row = line.split(None, 7)
+        if tids is None or len(row) < 8 or not row[0].isdigit():
+            continue
+        try:
+            read = float(row[3]) * IO_SCALE[row[4][0]]
+            write = float(row[5]) * IO_SCALE[row[6][0]]
+        except (KeyError, ValueError):
+            continue
+        rest = row[7]
+        if rest.startswith('?unavailable?'):
+            command = rest.split(None, 1)[1:]
+        else:
+            # SWAPIN % IO % COMMAND
+            command = rest.split(None, 4)[4:]
+        tids.append(row[0])
+        users.append(row[2])
+        reads.append(read)
+        writes.append(write)
+        commands.append(command[0].rstrip() if command else '')
+    if tids is not None:
+        yield (tids, {'read': reads, 'write': writes, 'io': [r + w for (r, w) in zip(reads, writes)]}, users, commands)
+
+
+def read_iotop(path, interval=1):
+    """ProcessData of iotop -b output (key TID, read/write/io KB/s), samples interval seconds apart."""
+    procs = ProcessData('TID', IOTOP_FIELDS)
+    with open(path) as fh:
+        for (j, (tids, values, users, commands)) in enumerate(iotop_samples(fh)):
+            procs.add(j * interval, tids, values, users, commands)
+    return procs.finish()
+
+
+def rss_growth(procs):
+    """
+    [(pid, KB/s, r2, growth KB)] of the processes whose RES grows steadily
+    (see GROWTH_*), fastest first: a least squares line of RES over the
+    sample times of each process, all processes at once with numpy.
+    """
+    data = procs.data
+    rows = data.keys.get(procs.key, {})
+    matrix = data.matrix.get('RES')
+    if matrix is None or len(procs.times) < GROWTH_SAMPLES:
+        return []
+    pids = list(rows)
+    growing = []
+    if numpy is not None:
+        valid = ~numpy.isnan(matrix)
+        n = valid.sum(axis=1)
+        x = numpy.where(valid, numpy.array(procs.times, dtype=float), 0.0)
+        y = numpy.where(valid, matrix, 0.0)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            mx = x.sum(axis=1) / n
+            my = y.sum(axis=1) / n
+            dx = numpy.where(valid, x - mx[:, None], 0.0)
+            dy = numpy.where(valid, y - my[:, None], 0.0)
+            sxx = (dx * dx).sum(axis=1)
+            syy = (dy * dy).sum(axis=1)
+            sxy = (dx * dy).sum(axis=1)
+            slope = sxy / sxx
+            r2 = sxy * sxy / (sxx * syy)
+        first = numpy.where(valid, y, numpy.inf).min(axis=1)
+        last = numpy.where(valid, y, -numpy.inf).max(axis=1)
+        growth = slope * (numpy.where(valid, x, -numpy.inf).max(axis=1) - numpy.where(valid, x, numpy.inf).min(axis=1))
+        keep = (n >= GROWTH_SAMPLES) & (sxx > 0) & (syy > 0) & (slope > 0) & (r2 >= GROWTH_R2) & \
+               (growth >= GROWTH_KB) & (last - first >= GROWTH_KB)
+        for r in numpy.nonzero(keep)[0]:
+            growing.append((pids[r], float(slope[r]), float(r2[r]), float(growth[r])))
+    else:
+        for (r, pid) in enumerate(pids):
+            points = [(t, v) for (t, v) in zip(procs.times, matrix[r]) if v == v]
+            n = len(points)
+            if n < GROWTH_SAMPLES:
+                continue
+            mx = sum(t for (t, v) in points) / n
+            my = sum(v for (t, v) in points) / n
+            sxx = sum((t - mx) ** 2 for (t, v) in points)
+            syy = sum((v - my) ** 2 for (t, v) in points)
+            sxy = sum((t - mx) * (v - my) for (t, v) in points)
+            if sxx <= 0 or syy <= 0 or sxy <= 0:
+                continue
+            slope = sxy / sxx
+            r2 = sxy * sxy / (sxx * syy)
+            growth = slope * (points[-1][0] - points[0][0])
+            values = [v for (t, v) in points]
+            if r2 >= GROWTH_R2 and growth >= GROWTH_KB and max(values) - min(values) >= GROWTH_KB:
+                growing.append((pid, slope, r2, growth))
+    return sorted(growing, key=lambda g: -g[1])
+
+
+def top_consumers(procs, field, n, by_max=False):
+    """[(pid, avg, max, samples)] of the n processes with the highest avg (or max) field over the samples they are listed in."""
+    data = procs.data
+    rows = data.keys.get(procs.key, {})
+    matrix = data.matrix.get(field)
+    if matrix is None or not rows:
+        return []
+    pids = list(rows)
+    if numpy is not None:
+        valid = ~numpy.isnan(matrix)
+        count = valid.sum(axis=1)
+        total = numpy.where(valid, matrix, 0.0).sum(axis=1)
+        avg = total / numpy.maximum(count, 1)
+        peak = numpy.where(valid, matrix, -numpy.inf).max(axis=1)
+        order = numpy.argsort(-(peak if by_max else avg), kind='stable')[:n]
+        return [(pids[r], float(avg[r]), float(peak[r]), int(count[r])) for r in order if count[r]]
+    summary = []
+    for (r, pid) in enumerate(pids):
+        values = [v for v in matrix[r] if v == v]
+        if values:
+            summary.append((pid, sum(values) / len(values), max(values), len(values)))
+    summary.sort(key=lambda s: -(s[2] if by_max else s[1]))
+    return summary[:n]
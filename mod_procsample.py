@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import struct
+import sys
+from array import array
+from time import monotonic, sleep, time
+
+from mod_sar import SarData
+from mod_vmstat import minor2major
+from mod_mpstat import FIELDS as MPSTAT_FIELDS, KEY as CPU_KEY, ALL
+from mod_iostat import FIELDS as IOSTAT_FIELDS, KEY as DEVICE_KEY
+
+PROC_FILE = 'proc.bin'
+PROC_MAGIC = b'PRSM'
+PROC_VERSION = 1
+# each record: timestamp, then one int64 per header field
+RECORD = struct.Struct('<d')
+
+# /proc/stat cpu line columns
+CPU_COLUMNS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal', 'guest', 'guest_nice']
+# /proc/vmstat counters kept; a field sums every key starting with one of
+# its prefixes (per-zone keys of older kernels), except the excluded keys
+VMSTAT_PREFIXES = {
+    'pgpgin': ['pgpgin'],
+    'pgpgout': ['pgpgout'],
+    'pswpin': ['pswpin'],
+    'pswpout': ['pswpout'],
+    'pgfault': ['pgfault'],
+    'pgmajfault': ['pgmajfault'],
+    'pgfree': ['pgfree'],
+    'pgscan_kswapd': ['pgscan_kswapd'],
+    'pgscan_direct': ['pgscan_direct'],
+    'pgsteal': ['pgsteal_kswapd', 'pgsteal_direct'],
+}
+VMSTAT_EXCLUDE = ['pgscan_direct_throttle']
+# /proc/diskstats columns (after major, minor, name) and /proc/net/dev
+# columns (after 'iface:') kept, by position
+DISK_COLUMNS = [(3, 'reads'), (5, 'rd_sectors'), (6, 'rd_ticks'), (7, 'writes'), (9, 'wr_sectors'), (10, 'wr_ticks'),
+                (12, 'io_ticks'), (13, 'time_in_queue')]
+NET_COLUMNS = [(0, 'rx_bytes'), (1, 'rx_packets'), (2, 'rx_errs'), (3, 'rx_drop'), (6, 'rx_compressed'),
+               (7, 'rx_multicast'), (8, 'tx_bytes'), (9, 'tx_packets'), (10, 'tx_errs'), (11, 'tx_drop'),
+               (13, 'tx_colls'), (15, 'tx_compressed')]
+
+
+class _ProcFile(object):
+    """A /proc file kept open and re-read from the start into one reused buffer."""
+
+    def __init__(self, path, size=16384):
+        self.path = path
+        self.fh = open(path, 'rb', buffering=0)
+        self.buf = bytearray(size)
+
+    def read(self):
+        """Contents as bytes; the buffer doubles (and the file is read again) when it is too small."""
+        while True:
+            self.fh.seek(0)
+            view = memoryview(self.buf)
+            n = 0
+            while n < len(self.buf):
+                got = self.fh.readinto(view[n:])
+                if not got:
+                    break
+                n += got
+            view.release()
+            if n < len(self.buf):
+                return bytes(self.buf[:n])
+            self.buf = bytearray(2 * len(self.buf))
+
+    def close(self):
+        self.fh.close()
+
+
+class ProcSampler(object):
+    """
+    In-process sampler of /proc/stat, /proc/vmstat, /proc/diskstats,
+    /proc/net/dev and /proc/loadavg: the files stay open and are re-read
+    into reused buffers each tick, and one binary record per tick goes to
+    the output (see run() and read_procsample()).  Counters are written as
+    the change since the previous tick, gauges (procs_running,
+    procs_blocked, load averages x 100, threads) as they are; the first
+    record holds the counters since boot.
+
+    Fields are fixed by the first read: CPUs, devices and interfaces that
+    show up later are not sampled.  Devices are the whole disks of
+    /sys/block (as iostat without -p); partitions are left out.
+
+    Example:
+    ProcSampler().run('proc.bin', 1, 60)
+    """
+
+    def __init__(self, proc_dir='/proc', block_dir='/sys/block'):
+        self.proc_dir = proc_dir
+        self.block_dir = block_dir
+        self.files = dict((name, _ProcFile(os.path.join(proc_dir, name)))
+                          for name in ['stat', 'vmstat', 'diskstats', 'net/dev', 'loadavg'])
+        self.fields = []
+        self.gauges = []
+        self.cpus = []
+        self.devices = []
+        self.ifaces = []
+        # per file: {line key: [(column, slot)]}
+        self.layout = {}
+        self._build_layout()
+        n = len(self.fields)
+        self.zeros = array('q', bytes(8 * n))
+        self.values = array('q', self.zeros)
+        self.previous = array('q', self.zeros)
+        self.delta = array('q', self.zeros)
+        self.counters = [i for i in range(n) if i not in set(self.gauges)]
+
+    def _slot(self, name, gauge=False):
+        self.fields.append(name)
+        if gauge:
+            self.gauges.append(len(self.fields) - 1)
+        return len(self.fields) - 1
+
+    def _build_layout(self):
+        layout = self.layout['stat'] = {}
+        for line in self.files['stat'].read().splitlines():
+            cols = line.split()
+            if not cols:
+                continue
+            key = cols[0].decode()
+            if key.startswith('cpu'):
+                cpu = key[3:] or ALL
+                self.cpus.append(cpu)
+                layout[cols[0]] = [(i + 1, self._slot('cpu.{0}.{1}'.format(cpu, column)))
+                                   for (i, column) in enumerate(CPU_COLUMNS) if i + 1 < len(cols)]
+            elif key in ('intr', 'ctxt', 'processes'):
+                layout[cols[0]] = [(1, self._slot(key))]
+            elif key in ('procs_running', 'procs_blocked'):
+                layout[cols[0]] = [(1, self._slot(key, gauge=True))]
+
+        layout = self.layout['vmstat'] = {}
+        slots = dict((field, self._slot(field)) for field in sorted(VMSTAT_PREFIXES))
+        for line in self.files['vmstat'].read().splitlines():
+            cols = line.split()
+            key = cols[0].decode() if cols else ''
+            for (field, prefixes) in VMSTAT_PREFIXES.items():
+                if key not in VMSTAT_EXCLUDE and any(key.startswith(prefix) for prefix in prefixes):
+                    layout[cols[0]] = [(1, slots[field])]
+
+        layout = self.layout['diskstats'] = {}
+        whole = os.path.isdir(self.block_dir)
+        for line in self.files['diskstats'].read().splitlines():
+            cols = line.split()
+            if len(cols) < 14:
+                continue
+            device = cols[2].decode()
+            if whole and not os.path.exists(os.path.join(self.block_dir, device.replace('/', '!'))):
+                continue
+            self.devices.append(device)
+            layout[cols[2]] = [(i, self._slot('disk.{0}.{1}'.format(device, column))) for (i, column) in DISK_COLUMNS]
+
+        layout = self.layout['net/dev'] = {}
+        for line in self.files['net/dev'].read().splitlines():
+            (iface, sep, rest) = line.partition(b':')
+            if not sep or len(rest.split()) < 16:
+                continue
+            self.ifaces.append(iface.strip().decode())
+            layout[iface.strip()] = [(i, self._slot('net.{0}.{1}'.format(self.ifaces[-1], column)))
+                                     for (i, column) in NET_COLUMNS]
+
+        # 0.52 0.58 0.59 2/1070 12345: load x 100, running/threads
+        self.layout['loadavg'] = [self._slot(name, gauge=True)
+                                  for name in ['ldavg-1', 'ldavg-5', 'ldavg-15', 'running', 'threads']]
+
+    def sample(self):
+        """Read all files into self.values (absolute counters and gauges)."""
+        values = self.values
+        values[:] = self.zeros
+        for name in ['stat', 'vmstat', 'diskstats']:
+            layout = self.layout[name]
+            key_col = 2 if name == 'diskstats' else 0
+            for line in self.files[name].read().splitlines():
+                cols = line.split()
+                spec = layout.get(cols[key_col]) if len(cols) > key_col else None
+                if spec is not None:
+                    for (i, slot) in spec:
+                        values[slot] += int(cols[i])
+        layout = self.layout['net/dev']
+        for line in self.files['net/dev'].read().splitlines():
+            (iface, sep, rest) = line.partition(b':')
+            spec = layout.get(iface.strip()) if sep else None
+            if spec is not None:
+                cols = rest.split()
+                for (i, slot) in spec:
+                    values[slot] += int(cols[i])
+        cols = self.files['loadavg'].read().split()
+        (running, threads) = cols[3].split(b'/')
+        for (slot, value) in zip(self.layout['loadavg'], [round(float(cols[0]) * 100), round(float(cols[1]) * 100),
+                                                         round(float(cols[2]) * 100), int(running), int(threads)]):
+            values[slot] = value
+
+    def header(self, interval):
+        with open(os.path.join(self.proc_dir, 'uptime')) as fh:
+            uptime = float(fh.read().split()[0])
+        return {'version': PROC_VERSION, 'fields': self.fields, 'gauges': self.gauges, 'cpus': self.cpus,
+                'devices': self.devices, 'ifaces': self.ifaces, 'interval': interval, 'uptime': uptime,
+                'hz': os.sysconf('SC_CLK_TCK'), 'page_kb': os.sysconf('SC_PAGE_SIZE') // 1024,
+                'host': os.uname()[1], 'byteorder': sys.byteorder}
+
+    def write_header(self, fh, interval):
+        header = json.dumps(self.header(interval)).encode()
+        fh.write(PROC_MAGIC + struct.pack('<HI', PROC_VERSION, len(header)) + header)
+
+    def write_record(self, fh, ts):
+        """Sample now and write ts and the change of each counter since the previous record."""
+        values = self.values
+        previous = self.previous
+        delta = self.delta
+        self.sample()
+        delta[:] = values
+        for i in self.counters:
+            delta[i] = values[i] - previous[i]
+        previous[:] = values
+        fh.write(RECORD.pack(ts))
+        delta.tofile(fh)
+        fh.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def run(self, path, interval, count):
+        """
+        Write count + 1 records interval seconds apart to path: the header,
+        then a timestamp and the deltas per tick.  Ticks are scheduled from
+        the start time, so a late tick does not shift the ones after it,
+        and each record carries the time it was actually read.
+        """
+        start = monotonic()
+        with open(path, 'wb') as fh:
+            self.write_header(fh, interval)
+            for tick in range(count + 1):
+                wait = start + tick * interval - monotonic()
+                if wait > 0:
+                    sleep(wait)
+                self.write_record(fh, time())
+        self.close()
+
+
+def read_procsample(path):
+    """ProcSamples of a ProcSampler file; ValueError if it is not one."""
+    with open(path, 'rb') as fh:
+        head = fh.read(10)
+        if len(head) < 10 or head[:4] != PROC_MAGIC:
+            raise ValueError('{0}: not a proc sample file'.format(path))
+        (version, length) = struct.unpack('<HI', head[4:])
+        if version != PROC_VERSION:
+            raise ValueError('{0}: proc sample version {1}, expected {2}'.format(path, version, PROC_VERSION))
+        header = json.loads(fh.read(length).decode())
+        n = len(header['fields'])
+        size = 8 + 8 * n
+        times = []
+        records = []
+        while True:
+            buf = fh.read(size)
+            if len(buf) < size:
+                # a cut-off last record of an interrupted collection is left out
+                break
+            times.append(RECORD.unpack(buf[:8])[0])
+            row = array('q')
+            row.frombytes(buf[8:])
+            if header['byteorder'] != sys.byteorder:
+                row.byteswap()
+            records.append(row)
+    return ProcSamples(header, times, records)
+
+
+class ProcSamples(object):
+    """
+    Samples of a ProcSampler file as the parsers of the forked collectors
+    return them, so perf-analyze.py reads a collection made with
+    perf-collect.py -P the same way:
+
+    vmstat_data()   read_vmstat() columns r b si so bi bo in cs us sy id wa
+                    st, first line since boot as vmstat prints it (memory
+                    columns need /proc/meminfo and are left out)
+    sar_data()      SarData of the sar fields computed from these files
+                    (paging, task, interrupt, load, sar -b I/O and IFACE
+                    network fields)
+    mpstat_data()   read_mpstat() SarData, CPU 'all' and per CPU
+    iostat_data()   read_iostat() SarData per whole disk, idle intervals
+                    left out as with iostat -z
+
+    Example:
+    proc = read_procsample('proc.bin')
+    vmstat_data = proc.vmstat_data()
+    """
+
+    def __init__(self, header, times, records):
+        self.header = header
+        self.times = times
+        self.records = records
+        self.index = dict((name, i) for (i, name) in enumerate(header['fields']))
+
+    def _interval(self, j):
+        """Seconds covered by record j (uptime for the first one, which holds the counters since boot)."""
+        if j == 0:
+            return self.header['uptime'] or 1.0
+        return (self.times[j] - self.times[j - 1]) or 1.0
+
+    def _get(self, row, name):
+        i = self.index.get(name)
+        return row[i] if i is not None else 0
+
+    def _cpu(self, row, cpu):
+        """{column: % of the CPU time} of one CPU line; guest time is counted in user already."""
+        ticks = dict((column, max(self._get(row, 'cpu.{0}.{1}'.format(cpu, column)), 0)) for column in CPU_COLUMNS)
+        total = float(sum(ticks[column] for column in CPU_COLUMNS[:8])) or 1.0
+        return dict((column, 100.0 * value / total) for (column, value) in ticks.items())
+
+    def _counter(self, row, name, j):
+        """/s of a counter, 0 when it went backwards (wrapped or reset)."""
+        return max(self._get(row, name), 0) / self._interval(j)
+
+    def vmstat_data(self):
+        data = dict((major, {}) for major in set(minor2major.values()))
+        columns = ['r', 'b', 'si', 'so', 'bi', 'bo', 'in', 'cs', 'us', 'sy', 'id', 'wa', 'st']
+        for minor in columns:
+            data[minor2major[minor]][minor] = []
+        page_kb = self.header['page_kb']
+        for (j, row) in enumerate(self.records):
+            cpu = self._cpu(row, ALL)
+            values = {
+                # without the sampler itself, as vmstat leaves itself out
+                'r': max(self._get(row, 'procs_running') - 1, 0),
+                'b': self._get(row, 'procs_blocked'),
+                'si': self._counter(row, 'pswpin', j) * page_kb,
+                'so': self._counter(row, 'pswpout', j) * page_kb,
+                'bi': self._counter(row, 'pgpgin', j),
+                'bo': self._counter(row, 'pgpgout', j),
+                'in': self._counter(row, 'intr', j),
+                'cs': self._counter(row, 'ctxt', j),
+                'us': cpu['user'] + cpu['nice'],
+                'sy': cpu['system'] + cpu['irq'] + cpu['softirq'],
+                'id': cpu['idle'],
+                'wa': cpu['iowait'],
+                'st': cpu['steal'],
+            }
+            for minor in columns:
+                data[minor2major[minor]][minor].append(int(round(values[minor])))
+        return data
+
+    def sar_data(self, header2key):
+        sar = SarData(header2key)
+        devices = self.header['devices']
+        ifaces = self.header['ifaces']
+        for j in range(1, len(self.records)):
+            row = self.records[j]
+            ts = int(self.times[j])
+            (scan_k, scan_d, steal) = [self._counter(row, name, j) for name in ['pgscan_kswapd', 'pgscan_direct', 'pgsteal']]
+            values = {
+                'pswpin/s': self._counter(row, 'pswpin', j),
+                'pswpout/s': self._counter(row, 'pswpout', j),
+                'pgpgin/s': self._counter(row, 'pgpgin', j),
+                'pgpgout/s': self._counter(row, 'pgpgout', j),
+                'fault/s': self._counter(row, 'pgfault', j),
+                'majflt/s': self._counter(row, 'pgmajfault', j),
+                'pgfree/s': self._counter(row, 'pgfree', j),
+                'pgscank/s': scan_k,
+                'pgscand/s': scan_d,
+                'pgsteal/s': steal,
+                '%vmeff': 100.0 * steal / (scan_k + scan_d) if scan_k + scan_d else 0.0,
+                'proc/s': self._counter(row, 'processes', j),
+                'cswch/s': self._counter(row, 'ctxt', j),
+                'intr/s': self._counter(row, 'intr', j),
+                # sar leaves itself out of the run queue too
+                'runq-sz': max(self._get(row, 'running') - 1, 0),
+                'plist-sz': self._get(row, 'threads'),
+                'ldavg-1': self._get(row, 'ldavg-1') / 100.0,
+                'ldavg-5': self._get(row, 'ldavg-5') / 100.0,
+                'ldavg-15': self._get(row, 'ldavg-15') / 100.0,
+                'blocked': self._get(row, 'procs_blocked'),
+            }
+            for (field, column) in [('rtps', 'reads'), ('wtps', 'writes'), ('bread/s', 'rd_sectors'),
+                                    ('bwrtn/s', 'wr_sectors')]:
+                values[field] = sum(self._counter(row, 'disk.{0}.{1}'.format(device, column), j) for device in devices)
+            values['tps'] = values['rtps'] + values['wtps']
+            sar.add(ts, values)
+
+            net = {}
+            for (field, column, scale) in [('rxpck/s', 'rx_packets', 1), ('txpck/s', 'tx_packets', 1),
+                                           ('rxkB/s', 'rx_bytes', 1024.0), ('txkB/s', 'tx_bytes', 1024.0),
+                                           ('rxcmp/s', 'rx_compressed', 1), ('txcmp/s', 'tx_compressed', 1),
+                                           ('rxmcst/s', 'rx_multicast', 1), ('rxerr/s', 'rx_errs', 1),
+                                           ('txerr/s', 'tx_errs', 1), ('coll/s', 'tx_colls', 1),
+                                           ('rxdrop/s', 'rx_drop', 1), ('txdrop/s', 'tx_drop', 1)]:
+                net[field] = [self._counter(row, 'net.{0}.{1}'.format(iface, column), j) / scale for iface in ifaces]
+            sar.add_keyed(ts, 'IFACE', ifaces, net)
+        return sar.finish()
+
+    def mpstat_data(self):
+        mp = SarData(dict((field, CPU_KEY) for field in MPSTAT_FIELDS))
+        cpus = self.header['cpus']
+        for j in range(1, len(self.records)):
+            row = self.records[j]
+            values = dict((field, []) for field in MPSTAT_FIELDS)
+            for cpu in cpus:
+                pct = self._cpu(row, cpu)
+                for (field, value) in [('%usr', pct['user'] - pct['guest']), ('%nice', pct['nice'] - pct['guest_nice']),
+                                       ('%sys', pct['system']), ('%iowait', pct['iowait']), ('%irq', pct['irq']),
+                                       ('%soft', pct['softirq']), ('%steal', pct['steal']), ('%guest', pct['guest']),
+                                       ('%gnice', pct['guest_nice']), ('%idle', pct['idle'])]:
+                    values[field].append(max(value, 0.0))
+            mp.add_keyed(j - 1, CPU_KEY, cpus, values)
+        return mp.finish()
+
+    def iostat_data(self):
+        io = SarData(dict((field, DEVICE_KEY) for field in IOSTAT_FIELDS))
+        for j in range(1, len(self.records)):
+            row = self.records[j]
+            seconds = self._interval(j)
+            devices = []
+            values = dict((field, []) for field in IOSTAT_FIELDS)
+            for device in self.header['devices']:
+                d = dict((column, max(self._get(row, 'disk.{0}.{1}'.format(device, column)), 0))
+                         for (i, column) in DISK_COLUMNS)
+                if not (d['reads'] or d['writes'] or d['io_ticks']):
+                    continue
+                devices.append(device)
+                (reads, writes) = (d['reads'], d['writes'])
+                sample = {
+                    'r/s': reads / seconds,
+                    'w/s': writes / seconds,
+                    'iops': (reads + writes) / seconds,
+                    'rkB/s': d['rd_sectors'] / 2.0 / seconds,
+                    'wkB/s': d['wr_sectors'] / 2.0 / seconds,
+                    'r_await': float(d['rd_ticks']) / reads if reads else 0.0,
+                    'w_await': float(d['wr_ticks']) / writes if writes else 0.0,
+                    'await': float(d['rd_ticks'] + d['wr_ticks']) / (reads + writes) if reads + writes else 0.0,
+                    'aqu-sz': d['time_in_queue'] / 1000.0 / seconds,
+                    '%util': min(d['io_ticks'] / 10.0 / seconds, 100.0),
+                    'rareq-sz': d['rd_sectors'] / 2.0 / reads if reads else 0.0,
+                    'wareq-sz': d['wr_sectors'] / 2.0 / writes if writes else 0.0,
+                }
+                for field in IOSTAT_FIELDS:
+                    values[field].append(sample[field])
+            io.add_keyed(j - 1, DEVICE_KEY, devices, values)
+        return io.finish()
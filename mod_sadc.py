@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+import struct
+
+from mod_sar import SarData
+
+# sadc data files start with the sysstat magic (either byte order) and a
+# format magic that changes with the file layout; 0x2175 is written by
+# sysstat 11.7.1 and later (all 12.x releases)
+SYSSTAT_MAGIC = 0xd596
+FORMAT_MAGIC = 0x2175
+
+# file_magic: sysstat_magic, format_magic, version (4 bytes), 48 bytes of
+# padding, header_size, upgraded, hdr_types_nr[3]
+FILE_MAGIC = '2H4B48x5I'
+
+# record types
+R_STATS = 1
+R_RESTART = 2
+R_COMMENT = 4
+MAX_COMMENT_LEN = 64
+
+MAX_IFACE_LEN = 16
+
+# activity ids
+A_PCSW = 2
+A_IRQ = 3
+A_SWAP = 4
+A_PAGE = 5
+A_IO = 6
+A_KTABLES = 8
+A_QUEUE = 9
+A_NET_DEV = 12
+A_NET_EDEV = 13
+A_NET_NFSD = 15
+
+# Item structures are unsigned long long, then unsigned long, then unsigned
+# int members, followed by any char members (e.g. the interface name).
+# Fields are (group, index) in those members with ULL, UL, U the groups and
+# ANY counting across all of them (for structures that changed member type
+# between releases).
+ULL = 0
+UL = 1
+U = 2
+ANY = 3
+
+# activity id -> (key column, {sadf header: (kind, member[, member])})
+# kinds: rate = per second change, kb = per second change / 1024, level =
+# current value, ratio = % of the change of member over the change of the
+# sum of the other members
+ACTIVITIES = {
+    A_PCSW: ('', {
+        'proc/s': ('rate', (UL, 0)),
+        'cswch/s': ('rate', (ULL, 0)),
+    }),
+    A_IRQ: ('', {
+        'intr/s': ('rate', (ULL, 0)),
+    }),
+    A_SWAP: ('', {
+        'pswpin/s': ('rate', (UL, 0)),
+        'pswpout/s': ('rate', (UL, 1)),
+    }),
+    A_PAGE: ('', {
+        'pgpgin/s': ('rate', (UL, 0)),
+        'pgpgout/s': ('rate', (UL, 1)),
+        'fault/s': ('rate', (UL, 2)),
+        'majflt/s': ('rate', (UL, 3)),
+        'pgfree/s': ('rate', (UL, 4)),
+        'pgscank/s': ('rate', (UL, 5)),
+        'pgscand/s': ('rate', (UL, 6)),
+        'pgsteal/s': ('rate', (UL, 7)),
+        '%vmeff': ('ratio', (UL, 7), (UL, 5), (UL, 6)),
+    }),
+    A_IO: ('', {
+        'tps': ('rate', (ULL, 0)),
+        'rtps': ('rate', (ULL, 1)),
+        'wtps': ('rate', (ULL, 2)),
+        'bread/s': ('rate', (ULL, 3)),
+        'bwrtn/s': ('rate', (ULL, 4)),
+    }),
+    A_KTABLES: ('', {
+        'file-nr': ('level', (ANY, 0)),
+        'inode-nr': ('level', (ANY, 1)),
+        'dentunusd': ('level', (ANY, 2)),
+        'pty-nr': ('level', (ANY, 3)),
+    }),
+    A_QUEUE: ('', {
+        'runq-sz': ('level', (UL, 0)),
+        'blocked': ('level', (UL, 1)),
+        'plist-sz': ('level', (U, 3)),
+    }),
+    A_NET_DEV: ('IFACE', {
+        'rxpck/s': ('rate', (ULL, 0)),
+        'txpck/s': ('rate', (ULL, 1)),
+        'rxkB/s': ('kb', (ULL, 2)),
+        'txkB/s': ('kb', (ULL, 3)),
+        'rxcmp/s': ('rate', (ULL, 4)),
+        'txcmp/s': ('rate', (ULL, 5)),
+        'rxmcst/s': ('rate', (ULL, 6)),
+    }),
+    A_NET_EDEV: ('IFACE', {
+        'coll/s': ('rate', (ULL, 0)),
+        'rxerr/s': ('rate', (ULL, 1)),
+        'txerr/s': ('rate', (ULL, 2)),
+        'rxdrop/s': ('rate', (ULL, 3)),
+        'txdrop/s': ('rate', (ULL, 4)),
+        'rxfifo/s': ('rate', (ULL, 5)),
+        'txfifo/s': ('rate', (ULL, 6)),
+        'rxfram/s': ('rate', (ULL, 7)),
+        'txcarr/s': ('rate', (ULL, 8)),
+    }),
+    A_NET_NFSD: ('', {
+        'scall/s': ('rate', (U, 0)),
+        'badcall/s': ('rate', (U, 1)),
+        'packet/s': ('rate', (U, 2)),
+        'udp/s': ('rate', (U, 3)),
+        'tcp/s': ('rate', (U, 4)),
+    }),
+}
+
+
+class Activity(object):
+    """One entry of the activity list: where its items are and how to read the wanted fields."""
+
+    def __init__(self, act_id, nr, nr2, has_nr, size, types_nr):
+        self.id = act_id
+        self.nr = nr
+        self.nr2 = nr2
+        self.has_nr = has_nr
+        self.size = size
+        self.types_nr = types_nr
+        self.key = ''
+        self.fields = {}
+        self.item = None
+        # member position in an unpacked item of each group (ANY starts at 0)
+        self.offsets = [0, types_nr[0], types_nr[0] + types_nr[1], 0]
+
+    def select(self, header2key, endian, sizeof_long):
+        """Keep the wanted fields this activity's item layout provides."""
+        (key, fields) = ACTIVITIES.get(self.id, ('', {}))
+        (ull_nr, ul_nr, u_nr) = self.types_nr
+        members = ull_nr + ul_nr + u_nr
+        fmt = endian + 'Q' * ull_nr + ('Q' if sizeof_long == 8 else 'L') * ul_nr + 'I' * u_nr
+        # an item (with its nr2 sub-items) ends with the key value for keyed activities
+        stride = self.size * self.nr2
+        trailer = stride - struct.calcsize(fmt)
+        if trailer < 0 or (key and trailer < MAX_IFACE_LEN):
+            return
+        group_nr = list(self.types_nr) + [members]
+        for (field, spec) in fields.items():
+            if header2key.get(field) != key:
+                continue
+            positions = []
+            for (group, index) in spec[1:]:
+                if index >= group_nr[group]:
+                    break
+                positions.append(self.offsets[group] + index)
+            else:
+                self.fields[field] = (spec[0], positions)
+        if self.fields:
+            self.key = key
+            self.item = struct.Struct(fmt + ('{0}s' if key else '{0}x').format(trailer))
+
+    def read_items(self, buf):
+        """{key value (None if unkeyed): unpacked members} of the items in buf."""
+        if self.key:
+            return dict((item[-1].split(b'\0', 1)[0].decode('ascii', 'replace'), item)
+                        for item in self.item.iter_unpack(buf))
+        if not buf:
+            return {}
+        # the first item is the whole system (e.g. the sum over all interrupts)
+        return {None: self.item.unpack_from(buf)}
+
+    def values(self, prev, curr, itv):
+        """
+        Key values found in both samples and {sadf header: [value per key
+        value]} between them, itv in 1/100 s.
+        """
+        keys = [k for k in curr if k in prev]
+        c = [curr[k] for k in keys]
+        pairs = list(zip(c, [prev[k] for k in keys]))
+        scale = 100.0 / itv
+        values = {}
+        for (field, (kind, positions)) in self.fields.items():
+            p = positions[0]
+            if kind == 'level':
+                values[field] = [float(a[p]) for a in c]
+            elif kind == 'ratio':
+                others = positions[1:]
+                column = []
+                for (a, b) in pairs:
+                    scanned = sum(max(a[o] - b[o], 0) for o in others)
+                    column.append(100.0 * max(a[p] - b[p], 0) / scanned if scanned else 0.0)
+                values[field] = column
+            else:
+                k = scale / 1024 if kind == 'kb' else scale
+                values[field] = [(a[p] - b[p]) * k if a[p] > b[p] else 0.0 for (a, b) in pairs]
+        return (keys, values)
+
+
+class SadcFile(object):
+    """
+    Reader of a sadc binary data file (e.g. sarA.bin or /var/log/sa/saDD)
+    for sysstat 11.7.1 and later, byte order taken from the file.
+
+    Only the activities with fields in header2key are decoded; the others
+    are skipped over.  Raises ValueError for other file formats so callers
+    can fall back to sadf.
+
+    Example:
+    sar = SadcFile('sarA.bin', {'tps': '', 'rxpck/s': 'IFACE'}).read()
+    """
+
+    def __init__(self, path, header2key):
+        self.path = path
+        self.header2key = header2key
+
+    def read(self):
+        """SarData of the wanted fields, one sample per pair of consecutive records."""
+        sar = SarData(self.header2key)
+        for (ts, key_name, keys, values) in self.samples():
+            if key_name:
+                sar.add_keyed(ts, key_name, keys, values)
+            else:
+                sar.add(ts, dict((field, column[0]) for (field, column) in values.items()))
+        return sar.finish()
+
+    def samples(self):
+        """
+        Yield (timestamp, key name, key values, {field: [value per key
+        value]}) per activity for each pair of consecutive records, with key
+        name '' and key values [None] for unkeyed activities.
+        """
+        with open(self.path, 'rb') as fh:
+            self._read_headers(fh)
+            prev = None
+            while True:
+                rec = fh.read(self.rec_size)
+                if len(rec) < self.rec_size:
+                    break
+                (uptime_cs, ust_time, extra_next) = self.rec_header.unpack_from(rec)
+                rtype = rec[self.rec_type_at]
+                if extra_next:
+                    raise ValueError('{0}: extra record structures are not supported'.format(self.path))
+                if rtype == R_RESTART:
+                    # the new number of CPUs follows; counters start again
+                    fh.read(4)
+                    prev = None
+                    continue
+                if rtype == R_COMMENT:
+                    fh.read(MAX_COMMENT_LEN)
+                    continue
+                if rtype != R_STATS:
+                    raise ValueError('{0}: unknown record type {1}'.format(self.path, rtype))
+                curr = self._read_stats(fh)
+                if curr is None:
+                    break
+                if prev is not None and uptime_cs > prev[0]:
+                    itv = uptime_cs - prev[0]
+                    for (act, items) in curr.items():
+                        (keys, values) = act.values(prev[1].get(act, {}), items, itv)
+                        if keys:
+                            yield (ust_time, act.key, keys, values)
+                prev = (uptime_cs, curr)
+
+    def start_time(self):
+        """Time (epoch seconds) in the file header, when the file was started."""
+        with open(self.path, 'rb') as fh:
+            self._read_headers(fh)
+        return self.ust_time
+
+    def _read_headers(self, fh):
+        magic = fh.read(struct.calcsize('<' + FILE_MAGIC))
+        if len(magic) < 4:
+            raise ValueError('{0} is not a sadc data file'.format(self.path))
+        for endian in '<>':
+            if struct.unpack_from(endian + 'H', magic)[0] == SYSSTAT_MAGIC:
+                break
+        else:
+            raise ValueError('{0} is not a sadc data file'.format(self.path))
+        self.endian = endian
+        (sysstat_magic, format_magic) = struct.unpack_from(endian + '2H', magic)
+        if format_magic != FORMAT_MAGIC or len(magic) < struct.calcsize(endian + FILE_MAGIC):
+            raise ValueError('{0}: unsupported sadc file format {1:#x} (sysstat {2})'.format(
+                self.path, format_magic, '.'.join(str(b) for b in bytearray(magic[4:8]))))
+        fields = struct.unpack(endian + FILE_MAGIC, magic)
+        self.version = '.'.join(str(v) for v in fields[2:6])
+        (header_size, upgraded) = fields[6:8]
+        hdr_types_nr = fields[8:11]
+
+        # file_header: sa_ust_time and sa_hz, then 12 unsigned int from
+        # sa_cpu_nr to extra_next, then sa_day, sa_month, sa_sizeof_long
+        header = fh.read(header_size)
+        wide = hdr_types_nr[0] + hdr_types_nr[1]
+        if len(header) < header_size or wide < 2 or hdr_types_nr[2] < 12:
+            raise ValueError('{0}: bad sadc file header'.format(self.path))
+        self.ust_time = struct.unpack_from(endian + 'Q', header)[0]
+        uints = struct.unpack_from(endian + '12I', header, 8 * wide)
+        (self.cpu_nr, act_nr) = uints[0:2]
+        act_types_nr = uints[3:6]
+        rec_types_nr = uints[6:9]
+        (act_size, self.rec_size, extra_next) = uints[9:12]
+        sizeof_long = bytearray(header)[8 * wide + 4 * hdr_types_nr[2] + 2]
+        if sizeof_long not in (4, 8) or extra_next:
+            raise ValueError('{0}: unsupported sadc file header'.format(self.path))
+
+        # record_header: uptime_cs, ust_time, extra_next, then record_type
+        if rec_types_nr[0] < 2 or rec_types_nr[2] < 1:
+            raise ValueError('{0}: unsupported sadc record header'.format(self.path))
+        self.rec_header = struct.Struct(endian + '2Q{0}xI'.format(
+            8 * (rec_types_nr[0] - 2) + sizeof_long * rec_types_nr[1]))
+        self.rec_type_at = 8 * rec_types_nr[0] + sizeof_long * rec_types_nr[1] + 4 * rec_types_nr[2]
+
+        # file_activity: id, magic, nr_ini, nr2, has_nr, size, types_nr[3]
+        if act_types_nr[2] < 9 or act_types_nr[0] or act_types_nr[1]:
+            raise ValueError('{0}: unsupported sadc activity list'.format(self.path))
+        self.activities = []
+        for n in range(act_nr):
+            buf = fh.read(act_size)
+            if len(buf) < act_size:
+                raise ValueError('{0}: truncated sadc activity list'.format(self.path))
+            (act_id, act_magic, nr, nr2, has_nr, size, ull_nr, ul_nr, u_nr) = struct.unpack_from(endian + '9I', buf)
+            act = Activity(act_id, nr, nr2, has_nr, size, (ull_nr, ul_nr, u_nr))
+            act.select(self.header2key, endian, sizeof_long)
+            self.activities.append(act)
+
+    def _read_stats(self, fh):
+        """{activity: items} of one statistics record, None at a truncated record."""
+        stats = {}
+        for act in self.activities:
+            nr = act.nr
+            if act.has_nr:
+                buf = fh.read(4)
+                if len(buf) < 4:
+                    return None
+                nr = struct.unpack(self.endian + 'i', buf)[0]
+            length = max(nr, 0) * act.nr2 * act.size
+            if act.item is None:
+                fh.seek(length, 1)
+                continue
+            buf = fh.read(length)
+            if len(buf) < length:
+                return None
+            stats[act] = act.read_items(buf)
+        return stats
+
+
+def read_sadc(path, header2key):
+    """SarData of the header2key fields in a sadc binary file."""
+    return SadcFile(path, header2key).read()
+
+
+def sadc_readable(path):
+    """True if path is a sadc file in a format read_sadc knows."""
+    try:
+        with open(path, 'rb') as fh:
+            SadcFile(path, {})._read_headers(fh)
+    except (IOError, ValueError):
+        return False
+    return True
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+
+
+class SarData(object):
+    """
+    Columnar samples from sadf -d output (sarA.data) or, through add() and
+    add_keyed(), a sadc binary file (mod_sadc).
+
+    header2key maps each wanted field to the column that splits its samples
+    (e.g. 'rxpck/s': 'IFACE') or '' for fields kept as one series.  Column
+    indexes are resolved once per header section, and values are stored as
+    floats in typed arrays instead of one object per value:
+
+    - unkeyed fields: one array('d') of all samples
+    - keyed fields: a key values x samples matrix (e.g. interfaces x
+      timestamps), NaN where a key value has no sample; a numpy 2-D array
+      when numpy is installed, otherwise a list of equal length array('d') rows
+
+    Example:
+    sar = read_sadf('sarA.data', {'tps': '', 'rxpck/s': 'IFACE'})
+    sar.values('tps')
+    for iface in sar.key_values('IFACE'):
+        sar.values('rxpck/s', iface)
+    """
+
+    def __init__(self, header2key):
+        self.header2key = header2key
+        self.columns = {}
+        self.matrix = {}
+        # key name -> {key value: row}, {timestamp: sample} in order of appearance
+        self.keys = {}
+        self.samples = {}
+
+    def read(self, fh):
+        """Add the samples of a sadf -d file object."""
+        header2key = self.header2key
+        cols = []
+        key_idx = -1
+        for line in fh:
+            if line.startswith('#'):
+                header = [h.strip() for h in line.split(';')]
+                (cols, key_idx, ts_idx, key_rows, key_samples) = self._section(header)
+                continue
+            if not cols:
+                continue
+            row = line.rstrip('\n').split(';')
+            if key_idx < 0:
+                for (i, column) in cols:
+                    column.append(float(row[i]))
+                continue
+            key_val = row[key_idx]
+            r = key_rows.get(key_val)
+            if r is None:
+                r = key_rows[key_val] = len(key_rows)
+            ts = row[ts_idx]
+            j = key_samples.get(ts)
+            if j is None:
+                j = key_samples[ts] = len(key_samples)
+            for (i, rows) in cols:
+                while len(rows) <= r:
+                    rows.append(array('d'))
+                values = rows[r]
+                if len(values) > j:
+                    # same timestamp twice: keep the last sample
+                    values[j] = float(row[i])
+                    continue
+                if len(values) < j:
+                    values.extend([NAN] * (j - len(values)))
+                values.append(float(row[i]))
+
+    def add(self, ts, values):
+        """Add one sample of {field: value} of unkeyed fields."""
+        header2key = self.header2key
+        for (field, value) in values.items():
+            if header2key.get(field) == '':
+                self.columns.setdefault(field, array('d')).append(value)
+
+    def add_keyed(self, ts, key_name, key_vals, values):
+        """Add one sample per key value of key_name: values is {field: [value per key value]}."""
+        header2key = self.header2key
+        key_rows = self.keys.setdefault(key_name, {})
+        key_samples = self.samples.setdefault(key_name, {})
+        j = key_samples.setdefault(ts, len(key_samples))
+        rs = [key_rows.setdefault(key_val, len(key_rows)) for key_val in key_vals]
+        for (field, column) in values.items():
+            if header2key.get(field) != key_name:
+                continue
+            rows = self.matrix.setdefault(field, [])
+            while len(rows) < len(key_rows):
+                rows.append(array('d'))
+            for (r, value) in zip(rs, column):
+                series = rows[r]
+                n = len(series)
+                if n == j:
+                    series.append(value)
+                elif n > j:
+                    # same timestamp twice: keep the last sample
+                    series[j] = value
+                else:
+                    series.extend([NAN] * (j - n))
+                    series.append(value)
+
+    def _section(self, header):
+        """Column indexes and storage for the wanted fields of one header line."""
+        header2key = self.header2key
+        wanted = [(i, h) for (i, h) in enumerate(header) if h in header2key]
+        key_name = ''
+        for (i, h) in wanted:
+            if header2key[h]:
+                key_name = header2key[h]
+        if not key_name:
+            return ([(i, self.columns.setdefault(h, array('d'))) for (i, h) in wanted], -1, -1, None, None)
+        if key_name not in header or 'timestamp' not in header:
+            return ([], -1, -1, None, None)
+        cols = [(i, self.matrix.setdefault(h, [])) for (i, h) in wanted if header2key[h] == key_name]
+        return (cols, header.index(key_name), header.index('timestamp'),
+                self.keys.setdefault(key_name, {}), self.samples.setdefault(key_name, {}))
+
+    def finish(self):
+        """Pad keyed series to full key values x samples matrices (numpy arrays if available)."""
+        for (field, rows) in self.matrix.items():
+            key_name = self.header2key[field]
+            num_rows = len(self.keys[key_name])
+            num_samples = len(self.samples[key_name])
+            while len(rows) < num_rows:
+                rows.append(array('d'))
+            for values in rows:
+                if len(values) < num_samples:
+                    values.extend([NAN] * (num_samples - len(values)))
+            if numpy is not None:
+                if num_rows:
+                    self.matrix[field] = numpy.array(rows, dtype=float)
+                else:
+                    self.matrix[field] = numpy.zeros((0, num_samples))
+        return self
+
+    def key_values(self, key_name):
+        """Key values (e.g. interface names) in order of appearance."""
+        return list(self.keys.get(key_name, {}))
+
+    def values(self, field, key_val=None):
+        """Samples of a field (for one key value of a keyed field), None if not collected."""
+        if key_val is None:
+            return self.columns.get(field)
+        rows = self.matrix.get(field)
+        r = self.keys.get(self.header2key.get(field), {}).get(key_val)
+        if rows is None or r is None:
+            return None
+        if numpy is not None:
+            row = rows[r]
+            return row[~numpy.isnan(row)]
+        return array('d', [v for v in rows[r] if v == v])
+
+    def row(self, field, key_val):
+        """Samples of a keyed field for one key value with NaN where it has none, aligned with the other key values."""
+        rows = self.matrix.get(field)
+        r = self.keys.get(self.header2key.get(field), {}).get(key_val)
+        if rows is None or r is None:
+            return None
+        return rows[r]
+
+
+def read_sadf(path, header2key):
+    """SarData of the header2key fields in a sadf -d file."""
+    sar = SarData(header2key)
+    with open(path) as fh:
+        sar.read(fh)
+    return sar.finish()
+
+
+def sadf_samples(fh, header2key):
+    """
+    Yield (timestamp, key name, key values, {field: [value]}) per row of
+    sadf -U -d output in fh, like mod_sadc.SadcFile.samples().
+    """
+    cols = []
+    for line in fh:
+        if line.startswith('#'):
+            header = [h.strip() for h in line.split(';')]
+            cols = [(i, h) for (i, h) in enumerate(header) if h in header2key]
+            key_name = ''
+            for (i, h) in cols:
+                key_name = key_name or header2key[h]
+            if 'timestamp' not in header or (key_name and key_name not in header):
+                cols = []
+                continue
+            cols = [(i, h) for (i, h) in cols if header2key[h] == key_name]
+            ts_idx = header.index('timestamp')
+            key_idx = header.index(key_name) if key_name else -1
+            continue
+        if not cols:
+            continue
+        row = line.rstrip('\n').split(';')
+        key_vals = [row[key_idx] if key_idx >= 0 else None]
+        yield (int(row[ts_idx]), key_name, key_vals, dict((h, [float(row[i])]) for (i, h) in cols))
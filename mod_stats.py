@@ -1,29 +1,79 @@
 #!/usr/bin/env python3
 
-from math import sqrt
+import heapq
+from array import array
+from math import ceil, erfc, log, sqrt
 
 def calc_avg_sd(lst,decimal):
 
-    """Calculates the standard deviation for a list of numbers."""
-    num_items = len(lst)
-    #if num_items == 0:
-    #    return (0, 0, 0, 0)
-    mean = sum(lst) / num_items
-    xmin = min(lst)
-    xmax = max(lst)
-    differences = [x - mean for x in lst]
-    sq_differences = [d ** 2 for d in differences]
-    ssd = sum(sq_differences)
-    variance = ssd / num_items
-    sd = sqrt(variance)
-
-    # print('debug types: mean={0}, sd={1}, xmin={2}, xmax={3}, dec={4}'.format(type(mean), type(sd), type(xmin), type(xmax), decimal))
-    # print('debug vals: mean={0}, sd={1}, xmin={2}, xmax={3}, dec={4}'.format(mean, sd, xmin, xmax, decimal))
-    mean = round(float(mean), decimal)
-    sd = round(float(sd), decimal)
-    xmin = round(float(xmin), decimal)
-    xmax = round(float(xmax), decimal)
-    return (mean, sd, xmin, xmax)
+    """Calculates (mean, sd, min, max) for a list of numbers in one pass (Welford's method, NaN skipped)."""
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    xmin = xmax = None
+    for x in lst:
+        x = float(x)
+        if x != x:
+            continue
+        count += 1
+        delta = x - mean
+        mean += delta / count
+        m2 += delta * (x - mean)
+        if xmin is None or x < xmin:
+            xmin = x
+        if xmax is None or x > xmax:
+            xmax = x
+    sd = sqrt(m2 / count) if count else 0.0
+    return (round(mean, decimal), round(sd, decimal), round(xmin, decimal), round(xmax, decimal))
+
+def percentile(lst, pct):
+    """Percentile (0-100) of a list of numbers, interpolating between ranks."""
+    if not lst:
+        return 0
+    ordered = sorted(lst)
+    pos = (len(ordered) - 1) * pct / 100.0
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+def mann_whitney(before, after):
+    """
+    Mann-Whitney U test of two series (NaN samples skipped): (U of after,
+    two-sided p, effect), None if a series is empty.
+
+    p comes from the normal approximation with tie and continuity
+    correction, fine from about 10 samples per series.  effect is Cliff's
+    delta, P(after > before) - P(after < before): 0 when the distributions
+    overlap, +1 (-1) when every after sample is higher (lower) than every
+    before sample, whatever the metric's unit.
+    """
+    x = [float(v) for v in before if v == v]
+    y = [float(v) for v in after if v == v]
+    (n1, n2) = (len(x), len(y))
+    if not n1 or not n2:
+        return None
+    pooled = sorted([(v, 0) for v in x] + [(v, 1) for v in y])
+    n = n1 + n2
+    rank_sum = 0.0
+    ties = 0.0
+    i = 0
+    while i < n:
+        # values equal to pooled[i] share the average of their ranks
+        j = i
+        while j + 1 < n and pooled[j + 1][0] == pooled[i][0]:
+            j += 1
+        rank = (i + j) / 2.0 + 1
+        rank_sum += rank * sum(side for (v, side) in pooled[i:j + 1])
+        t = j - i + 1
+        ties += t * t * t - t
+        i = j + 1
+    u = rank_sum - n2 * (n2 + 1) / 2.0
+    effect = 2.0 * u / (n1 * n2) - 1
+    variance = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1))) if n > 1 else 0.0
+    if variance <= 0:
+        return (u, 1.0, effect)
+    z = max(abs(u - n1 * n2 / 2.0) - 0.5, 0.0) / sqrt(variance)
+    return (u, min(erfc(z / sqrt(2)), 1.0), effect)
 
 def divide(numerator, denominator, decimal):
     if denominator == 0:
@@ -68,6 +118,325 @@ class DictDiffer(object):
         return set(o for o in self.intersect
                    if self.past_dict[o] == self.current_dict[o])
 
+class SpaceSaving(object):
+    """
+    Space-Saving heavy hitters: counts at most capacity keys in fixed memory.
+
+    Records are objects with a count attribute and a merge(other) method,
+    made by new_record().  When the table is full a new key takes over the
+    record with the smallest count and inherits that count as its error, so
+    for every tracked key count - error <= true count <= count, and any key
+    that is not tracked has a true count <= min_count().  Other fields of the
+    record start again at zero for the new key.
+
+    Example:
+    talkers = SpaceSaving(10000, new_talker)
+    rec = talkers.get(key)
+    if rec is None:
+        rec = talkers.insert(key)
+    rec.count += 1
+    """
+
+    def __init__(self, capacity, new_record):
+        self.capacity = capacity
+        self.new_record = new_record
+        self.records = {}
+        self.errors = {}
+        self.heap = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def items(self):
+        return self.records.items()
+
+    def error(self, key):
+        return self.errors.get(key, 0)
+
+    def insert(self, key):
+        """Start tracking key, evicting the smallest record if the table is full."""
+        records = self.records
+        heap = self.heap
+        rec = self.new_record()
+        if len(records) >= self.capacity:
+            # counts only grow, so heap entries may be stale; refresh until
+            # the smallest entry matches its record
+            while True:
+                (count, old_key) = heapq.heappop(heap)
+                old_rec = records.get(old_key)
+                if old_rec is None:
+                    continue
+                if old_rec.count != count:
+                    heapq.heappush(heap, (old_rec.count, old_key))
+                    continue
+                break
+            del records[old_key]
+            self.errors.pop(old_key, None)
+            rec.count = count
+            self.errors[key] = count
+            if len(heap) > 2 * self.capacity:
+                self._rebuild_heap()
+        records[key] = rec
+        heapq.heappush(heap, (rec.count, key))
+        return rec
+
+    def min_count(self):
+        """Upper bound on the count of any key that is not tracked."""
+        if len(self.records) < self.capacity:
+            return 0
+        return min(rec.count for rec in self.records.values())
+
+    def merge(self, other):
+        """
+        Combine another SpaceSaving table into this one.  A key missing from
+        one table may have been counted there up to that table's min_count(),
+        which is added to both its count and its error.
+        """
+        min_self = self.min_count()
+        min_other = other.min_count()
+        for key, rec in self.records.items():
+            other_rec = other.records.get(key)
+            if other_rec is None:
+                rec.count += min_other
+                self.errors[key] = self.errors.get(key, 0) + min_other
+            else:
+                rec.merge(other_rec)
+                self.errors[key] = self.errors.get(key, 0) + other.errors.get(key, 0)
+        for key, other_rec in other.records.items():
+            if key not in self.records:
+                other_rec.count += min_self
+                self.records[key] = other_rec
+                self.errors[key] = other.errors.get(key, 0) + min_self
+        if len(self.records) > self.capacity:
+            keep = heapq.nlargest(self.capacity, self.records, key=lambda k: self.records[k].count)
+            self.records = dict((key, self.records[key]) for key in keep)
+        self.errors = dict((key, err) for key, err in self.errors.items() if err and key in self.records)
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self.heap = [(rec.count, key) for key, rec in self.records.items()]
+        heapq.heapify(self.heap)
+
+class RateSeries(object):
+    """
+    Packet and byte counts per fixed interval (e.g. per second) kept in two
+    array('Q') columns indexed from the first interval seen.
+
+    Example:
+    series = RateSeries(1.0)
+    series.add(ts, frame_len)
+    (start_ts, pps, bytes_per_sec) = series.peak()
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.base = None
+        self.packets = array('Q')
+        self.bytes = array('Q')
+
+    def __len__(self):
+        return len(self.packets)
+
+    def add(self, ts, nbytes, npackets=1):
+        # nudge timestamps sitting exactly on an interval edge past float rounding
+        idx = int(ts / self.interval + 1e-9)
+        if self.base is None:
+            self.base = idx
+        pos = idx - self.base
+        if pos >= len(self.packets):
+            self._grow(pos + 1 - len(self.packets))
+        elif pos < 0:
+            # out of order packet before the first interval
+            self._grow(-pos, front=True)
+            pos = 0
+        self.packets[pos] += npackets
+        self.bytes[pos] += nbytes
+
+    def _grow(self, count, front=False):
+        zeros = array('Q', bytes(8 * count))
+        if front:
+            self.packets = zeros + self.packets
+            self.bytes = zeros + self.bytes
+            self.base -= count
+        else:
+            self.packets.extend(zeros)
+            self.bytes.extend(zeros)
+
+    def merge(self, other):
+        """Add another series with the same interval, aligning on absolute time."""
+        if other.base is None:
+            return
+        if self.base is None:
+            self.base = other.base
+        if other.base < self.base:
+            self._grow(self.base - other.base, front=True)
+        offset = other.base - self.base
+        need = offset + len(other.packets) - len(self.packets)
+        if need > 0:
+            self._grow(need)
+        for i in range(len(other.packets)):
+            self.packets[offset + i] += other.packets[i]
+            self.bytes[offset + i] += other.bytes[i]
+
+    def peak(self, column='bytes'):
+        """(interval start time, packets/s, bytes/s) of the busiest interval."""
+        values = self.bytes if column == 'bytes' else self.packets
+        if not values:
+            return (0, 0, 0)
+        pos = max(range(len(values)), key=values.__getitem__)
+        return ((self.base + pos) * self.interval,
+                self.packets[pos] / self.interval, self.bytes[pos] / self.interval)
+
+class StreamStats(object):
+    """
+    Streaming summary of a series: count, mean and variance (Welford's
+    method), min, max and a quantile sketch, without keeping the samples.
+
+    The sketch counts values in logarithmic buckets (as in DDSketch), so a
+    quantile is within accuracy (1%) of a value at that rank, and memory
+    grows with the log of the value range rather than with the sample count.
+    NaN samples (gaps in a series) are skipped.
+
+    merge() combines summaries of parts of a series (file chunks, processes,
+    days, hosts) into the summary of the whole: the moments as computed in
+    one pass and the sketch bucket counts exactly.
+
+    Example:
+    acc = StreamStats(values)
+    acc.merge(StreamStats(more_values))
+    (avg, sd, p95) = (acc.mean, acc.sd(), acc.quantile(0.95))
+    """
+
+    # smaller magnitudes are counted as zero
+    MIN_VALUE = 1e-9
+
+    def __init__(self, values=(), accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = log(self.gamma)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.zeros = 0
+        self.positive = {}
+        self.negative = {}
+        self.extend(values)
+
+    def add(self, x):
+        self.extend((x,))
+
+    def extend(self, values):
+        """Add a series of samples."""
+        count = self.count
+        mean = self.mean
+        m2 = self.m2
+        xmin = self.min
+        xmax = self.max
+        positive = self.positive
+        log_gamma = self.log_gamma
+        min_value = self.MIN_VALUE
+        for x in values:
+            x = float(x)
+            if x != x:
+                continue
+            count += 1
+            delta = x - mean
+            mean += delta / count
+            m2 += delta * (x - mean)
+            if xmin is None or x < xmin:
+                xmin = x
+            if xmax is None or x > xmax:
+                xmax = x
+            if x > min_value:
+                key = int(ceil(log(x) / log_gamma))
+                positive[key] = positive.get(key, 0) + 1
+            elif x < -min_value:
+                key = int(ceil(log(-x) / log_gamma))
+                self.negative[key] = self.negative.get(key, 0) + 1
+            else:
+                self.zeros += 1
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = xmin
+        self.max = xmax
+
+    def merge(self, other):
+        """Add the samples summarized by another StreamStats with the same accuracy."""
+        if other.gamma != self.gamma:
+            raise ValueError('cannot merge sketches of accuracy {0} and {1}'.format(self.accuracy, other.accuracy))
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        self.zeros += other.zeros
+        for (mine, theirs) in ((self.positive, other.positive), (self.negative, other.negative)):
+            for (key, n) in theirs.items():
+                mine[key] = mine.get(key, 0) + n
+
+    def variance(self):
+        """Population variance (as calc_avg_sd)."""
+        return self.m2 / self.count if self.count else 0.0
+
+    def sd(self):
+        return sqrt(self.variance())
+
+    def quantile(self, q):
+        """Value at quantile q (0-1), None without samples."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return self._clamp(-self._bucket_value(key))
+        seen += self.zeros
+        if seen > rank:
+            return self._clamp(0.0)
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._clamp(self._bucket_value(key))
+        return self.max
+
+    def state(self):
+        """JSON-able state, for from_state()."""
+        return {'accuracy': self.accuracy, 'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min, 'max': self.max, 'zeros': self.zeros,
+                'positive': sorted(self.positive.items()), 'negative': sorted(self.negative.items())}
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls(accuracy=state['accuracy'])
+        for name in ('count', 'mean', 'm2', 'min', 'max', 'zeros'):
+            setattr(acc, name, state[name])
+        acc.positive = dict((int(key), n) for (key, n) in state['positive'])
+        acc.negative = dict((int(key), n) for (key, n) in state['negative'])
+        return acc
+
+    def _bucket_value(self, key):
+        # the value with the same relative error to both bucket bounds
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def _clamp(self, x):
+        return min(max(x, self.min), self.max)
+
 # Color definitions
 def fmtRed(text): return "\033[91m {}\033[00m".format(text)
 def fmtGreen(text): return "\033[92m {}\033[00m".format(text)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from time import time
+
+SUMMARY_VERSION = 1
+SUMMARY_FILE = 'summary.jsonl'
+
+
+def _jsonable(value):
+    """json.dumps default: numpy scalars (numpy.int64 counts) as Python numbers."""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+
+class SummaryWriter(object):
+    """
+    Versioned JSON Lines summary of an analysis, one JSON object per line.
+
+    The first line is the header, {"record": "summary", "version": ...,
+    "created": epoch, ...header fields}, and every later line is one table row
+    with a "record" type (metric, adapter, device, talker, ...) written as
+    soon as it is computed, so a large table is never held twice.  Lines go
+    to path.tmp, which is renamed to path by close(), so a reader never sees
+    a cut-off summary.
+
+    Example:
+    summary = SummaryWriter('reports_out/summary.jsonl', source='perf-analyze.py')
+    summary.write('metric', name='usr', avg=37.0, verdict='ok')
+    summary.close()
+    """
+
+    def __init__(self, path, **header):
+        self.path = path
+        self.records = 0
+        self.fh = open(path + '.tmp', 'w')
+        header['version'] = SUMMARY_VERSION
+        header['created'] = round(time(), 3)
+        self.write('summary', **header)
+
+    def write(self, record, **fields):
+        fields['record'] = record
+        self.fh.write(json.dumps(fields, sort_keys=True, default=_jsonable))
+        self.fh.write('\n')
+        self.records += 1
+
+    def copy(self, path):
+        """Append the records of another summary (e.g. tcpdump-analyze.py -J), without its header."""
+        for record in read_summary(path):
+            if record['record'] != 'summary':
+                self.fh.write(json.dumps(record, sort_keys=True))
+                self.fh.write('\n')
+                self.records += 1
+
+    def close(self):
+        self.fh.close()
+        os.rename(self.path + '.tmp', self.path)
+
+
+def read_summary(path):
+    """Yield the records of a summary file, header first; ValueError for an unknown format or version."""
+    with open(path) as fh:
+        for (line_num, line) in enumerate(fh, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError('{0} line {1}: not JSON'.format(path, line_num))
+            if line_num == 1 and (record.get('record') != 'summary' or record.get('version') != SUMMARY_VERSION):
+                raise ValueError('{0}: not a version {1} summary'.format(path, SUMMARY_VERSION))
+            yield record
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+
+SEQ_MASK = 0xffffffff
+SEQ_HALF = 0x80000000
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# dup-ACK runs this long trigger a fast retransmit
+DUPACK_RUN = 3
+
+# handshakes still open this many seconds after the SYN (longer than
+# Linux's default SYN retries) are dropped, so SYN floods and scans do not
+# pile up
+HANDSHAKE_TIMEOUT = 120.0
+
+
+def seq_after(a, b):
+    """True if sequence number a is after b (modulo 2**32)."""
+    return a != b and ((a - b) & SEQ_MASK) < SEQ_HALF
+
+
+class Handshake(object):
+    """Timestamps of a connection being set up (keyed by client->server flow)."""
+    __slots__ = ('syn', 'synack', 'isn', 'retransmitted')
+
+    def __init__(self, ts, isn):
+        self.syn = ts
+        self.synack = None
+        self.isn = isn
+        self.retransmitted = False
+
+
+class FlowState(object):
+    """Sequence/ack tracking for one direction of a TCP connection."""
+    __slots__ = ('seq_end', 'last_ack', 'dup_run')
+
+    def __init__(self):
+        self.seq_end = None
+        self.last_ack = None
+        self.dup_run = 0
+
+
+class HostLatency(object):
+    """Handshake RTT samples and loss indicators for one remote host."""
+    __slots__ = ('rtts', 'syn_retrans', 'data_segs', 'retrans', 'dupacks', 'dupack_runs')
+
+    def __init__(self):
+        self.rtts = []
+        self.syn_retrans = 0
+        self.data_segs = 0
+        self.retrans = 0
+        self.dupacks = 0
+        self.dupack_runs = 0
+
+    def merge(self, other):
+        self.rtts.extend(other.rtts)
+        self.syn_retrans += other.syn_retrans
+        self.data_segs += other.data_segs
+        self.retrans += other.retrans
+        self.dupacks += other.dupacks
+        self.dupack_runs += other.dupack_runs
+
+
+class TcpLatency(object):
+    """
+    Handshake RTT, retransmission and dup-ACK analysis per remote host.
+
+    RTT is taken from the leg of the SYN -> SYN-ACK -> ACK exchange that
+    crosses the network as seen from this host: SYN -> SYN-ACK when the host
+    opened the connection, SYN-ACK -> ACK when a remote client did, and the
+    whole handshake when neither end is local.  Handshakes with a
+    retransmitted SYN or SYN-ACK are not sampled (Karn's algorithm).
+
+    A data segment that ends at or before the highest sequence already seen
+    in its direction counts as a retransmission; a pure ACK repeating the
+    previous ack number in its direction counts as a dup-ACK.
+
+    Flows are keyed by packed src + sport + dst + dport bytes, hosts by packed
+    address, the same packing PacketSummary uses.  A flow's state is dropped
+    at its FIN or RST and open handshakes after HANDSHAKE_TIMEOUT; with
+    max_entries set, at most max_entries flows and handshakes each are kept
+    and the oldest one makes room for a new one.
+    """
+
+    def __init__(self, host_ips, max_entries=None):
+        self.host_ips = host_ips
+        self.max_entries = max_entries
+        if max_entries:
+            self.handshakes = OrderedDict()
+            self.flows = OrderedDict()
+        else:
+            self.handshakes = {}
+            self.flows = {}
+        self.hosts = {}
+        # capture time of the last sweep for expired handshakes
+        self.swept = None
+
+    def host(self, addr):
+        rec = self.hosts.get(addr)
+        if rec is None:
+            rec = self.hosts[addr] = HostLatency()
+        return rec
+
+    def _insert(self, table, key, value):
+        if self.max_entries and len(table) >= self.max_entries and key not in table:
+            table.popitem(last=False)
+        table[key] = value
+        return value
+
+    def expire(self, ts):
+        """Drop the handshakes whose SYN is more than HANDSHAKE_TIMEOUT before ts."""
+        cutoff = ts - HANDSHAKE_TIMEOUT
+        for key in [key for (key, handshake) in self.handshakes.items() if handshake.syn < cutoff]:
+            del self.handshakes[key]
+        self.swept = ts
+
+    def add(self, ts, src, port_src, dst, port_dest, flags, seq, ack, payload_len):
+        if self.swept is None:
+            self.swept = ts
+        elif ts - self.swept > HANDSHAKE_TIMEOUT:
+            self.expire(ts)
+        flow_key = src + port_src + dst + port_dest
+        # remote end of the connection for reporting (server when both are remote)
+        if src in self.host_ips:
+            remote = dst
+        elif dst in self.host_ips:
+            remote = src
+        elif flags & TCP_SYN and not flags & TCP_ACK:
+            remote = dst
+        else:
+            remote = None
+
+        if flags & TCP_SYN:
+            if flags & TCP_ACK:
+                # SYN-ACK answers the handshake keyed by the reverse flow
+                handshake = self.handshakes.get(dst + port_dest + src + port_src)
+                if handshake is not None:
+                    if handshake.synack is not None:
+                        handshake.retransmitted = True
+                    handshake.synack = ts
+            else:
+                handshake = self.handshakes.get(flow_key)
+                if handshake is not None and handshake.isn == seq and handshake.synack is None:
+                    handshake.retransmitted = True
+                    self.host(remote).syn_retrans += 1
+                else:
+                    self._insert(self.handshakes, flow_key, Handshake(ts, seq))
+        elif flags & TCP_ACK:
+            handshake = self.handshakes.get(flow_key)
+            if handshake is not None and handshake.synack is not None:
+                # first ACK from the client completes the handshake
+                del self.handshakes[flow_key]
+                if not handshake.retransmitted:
+                    if src in self.host_ips and dst not in self.host_ips:
+                        rtt = handshake.synack - handshake.syn
+                    elif dst in self.host_ips and src not in self.host_ips:
+                        rtt = ts - handshake.synack
+                    else:
+                        rtt = ts - handshake.syn
+                    self.host(remote if remote is not None else dst).rtts.append(rtt)
+
+        if remote is None:
+            remote = dst if dst > src else src
+
+        state = self.flows.get(flow_key)
+        if state is None:
+            state = self._insert(self.flows, flow_key, FlowState())
+
+        # SYN and FIN use one sequence number each
+        seq_len = payload_len
+        if flags & (TCP_SYN | TCP_FIN):
+            seq_len += 1
+        if seq_len > 0 and not flags & TCP_RST:
+            seq_end = (seq + seq_len) & SEQ_MASK
+            if payload_len > 0:
+                host_rec = self.host(remote)
+                host_rec.data_segs += 1
+                if state.seq_end is not None and not seq_after(seq_end, state.seq_end):
+                    host_rec.retrans += 1
+            if state.seq_end is None or seq_after(seq_end, state.seq_end):
+                state.seq_end = seq_end
+
+        if flags & TCP_ACK:
+            if payload_len == 0 and not flags & (TCP_SYN | TCP_FIN | TCP_RST) and ack == state.last_ack:
+                host_rec = self.host(remote)
+                host_rec.dupacks += 1
+                state.dup_run += 1
+                if state.dup_run == DUPACK_RUN:
+                    host_rec.dupack_runs += 1
+            else:
+                state.dup_run = 0
+            # the ack carried by a SYN-ACK is not a baseline for dup-ACKs
+            state.last_ack = None if flags & TCP_SYN else ack
+
+        if flags & (TCP_FIN | TCP_RST):
+            self.handshakes.pop(flow_key, None)
+            self.flows.pop(flow_key, None)
+            if flags & TCP_RST:
+                # a reset ends both directions
+                self.flows.pop(dst + port_dest + src + port_src, None)
+
+    def merge(self, other):
+        """Combine host results from another shard (in-flight handshakes are dropped)."""
+        for addr, rec in other.hosts.items():
+            host_rec = self.hosts.get(addr)
+            if host_rec is None:
+                self.hosts[addr] = rec
+            else:
+                host_rec.merge(rec)
+
+    def __getstate__(self):
+        # per-flow state is only needed while decoding a shard
+        return {'host_ips': self.host_ips, 'max_entries': self.max_entries, 'handshakes': {}, 'flows': {},
+                'hosts': self.hosts, 'swept': None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import csv
+import re
+
+# ref: http://www.eurion.net/python-snippets/snippet/vmstat%20Reader.html
+
+# Create a map from minor to major header as the minor headers are easy to
+# associate to columns, which is not the case for major headers.
+minor2major = {
+    'r': 'procs',
+    'b': 'procs',
+    'swpd': 'memory',
+    'free': 'memory',
+    'buff': 'memory',
+    'cache': 'memory',
+    'inact': 'memory',  # to support the vmstat -a option if required
+    'active': 'memory', # to support the vmstat -a option if required
+    'si': 'swap',
+    'so': 'swap',
+    'bi': 'io',
+    'bo': 'io',
+    'in': 'system',
+    'cs': 'system',
+    'us': 'cpu',
+    'sy': 'cpu',
+    'id': 'cpu',
+    'wa': 'cpu',
+    'st': 'cpu'
+}
+
+# compile regex objects
+re_dates = re.compile(r"\d+:\d+:\d+")
+
+
+def read_vmstat(path):
+    """{major header: {minor header: [int per sample]}} of vmstat output, e.g. vmstat_data['cpu']['us']."""
+    minors = []
+    flag_found_minor = False
+
+    # Initialise the vmstat_data map by creating an empty sub-map against each
+    # unique major header
+    vmstat_data = dict([(h, {}) for h in set(minor2major.values())])
+
+    # Create the reader and specify the delimier to be a space; also set the
+    # skipinitialspace flag to true to ensure that several spaces are seen as a
+    # single delimiter and that initial spaces in a line are ignored
+    with open(path) as fh:
+        reader = csv.reader(fh, delimiter=' ', skipinitialspace=True)
+        for row in reader:
+            if re_dates.match(row[3]):
+                """
+                skip lines w/ dates (redhat likes these)
+                """
+            elif row[0] == "procs":
+                """
+                Ignore the first line as it contains major headers.
+                """
+            elif row[0] == "r":
+                if not flag_found_minor:
+                    """
+                    If we are on the first line, create the headers list from the first row.
+                    We also keep a copy of the minor headers, in the order that they appear
+                    in the file to ensure that we can map the values to the correct entry
+                    in the vmstat_data map.
+                    """
+                    minors = row
+                    for h in row:
+                        vmstat_data[minor2major[h]][h] = []
+                    flag_found_minor = True
+            elif row[0] != minors[0] and row[0] != minor2major[minors[0]]:
+                """
+                If the -n option was not specified when running the vmstat command,
+                major and minor headers are repeated so we need to ensure that we
+                ignore such lines and only deal with lines that contain actual data.
+                For each value in the row, we append it to the respective entry in
+                the vmstat_data dictionary. In addition, we transform the value to an int
+                before appending it as we know that the vmstat_data of the log should only
+                have integer values.
+                """
+                for i, v in enumerate(row):
+                    vmstat_data[minor2major[minors[i]]][minors[i]].append(int(v))
+    return vmstat_data
+
+
+def vmstat_values(vmstat_data, field):
+    """Samples of one vmstat column (minor header), None if it was not collected."""
+    return vmstat_data.get(minor2major.get(field), {}).get(field)
@@ -4,20 +4,39 @@ import os
 import sys
 import re
 import getopt
+import json
 import subprocess
 
+# modules in current directory
+from mod_summary import SummaryWriter
+
 opt_name_resolution = False
 
 data_dir = False
+json_file = None
+cache_dir = None
 max_results = 50
 
 ip_to_hostname_cache = {}
+# IP lookups kept between runs in cache_dir (-w)
+CACHE_FILE = 'netstat_dns_cache.json'
 
 # global regex to compile
 re_tcp = re.compile(r"^tcp")
 re_ip_port = re.compile(r"^(.*)[\.:](.*?)$")
 re_trim_ip = re.compile(r"^.*:")
 
+def usage(exit_code=0):
+    """Display help message if -h option used or invalid syntax."""
+    print(os.path.basename(__file__) + ' [-n] [-r <data_dir>] [-w <cache_dir>] [-J <json_file>]')
+    print("")
+    print("  -r  read netstat_an.out, ifconfig_a.out and uname.out from data_dir (default: run the commands)")
+    print("  -n  look up remote IPs in DNS")
+    print("  -w  with -n: keep the IP lookups in cache_dir/" + CACHE_FILE + " and reuse them in later runs")
+    print("  -J  also write the counters and connections as a JSON lines summary (mod_summary)")
+    print("")
+    sys.exit(exit_code)
+
 def get_data():
     if data_dir:
         f = os.path.join(data_dir, 'netstat_an.out')
@@ -363,11 +382,15 @@ def lookup_ip_in_dns(ip, kernel):
     global ip_to_hostname_cache
     # TODO - Probably just need get_data command to populate global ip_to_hostname_cache.
     if ip in ip_to_hostname_cache:
-        print("debug: found " + ip + " in dict cache")
         return ip_to_hostname_cache[ip]
 
     # Run host command to lookup IP.  Get output and return code.
-    pid = subprocess.Popen(('host', ip), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        pid = subprocess.Popen(('host', ip), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    except OSError:
+        # no host command (bind-utils), report IPs
+        ip_to_hostname_cache[ip] = ip
+        return ip
     lookup_output = pid.communicate()[0]
     rc = pid.returncode
 
@@ -396,15 +419,74 @@ def lookup_ip_in_dns(ip, kernel):
         return hostname
 
     else:
-        # DNS lookup failed, just return IP
+        # DNS lookup failed, just return IP (and do not ask again in this run)
+        ip_to_hostname_cache[ip] = ip
         return ip
 
+def write_summary(path, kernel, tcp_counters, inbound, outbound, local, remote):
+    """JSON lines summary: the TCP state counters and the top connections of each direction."""
+    summary = SummaryWriter(path, source='netstat_analyser.py')
+    summary.write('netstat_counters', **tcp_counters)
+    for (direction, counts) in [('inbound', inbound), ('local', local), ('remote', remote), ('outbound', outbound)]:
+        for key in sorted(counts, key=counts.get, reverse=True)[:max_results]:
+            (ip, port) = re_ip_port.match(key).group(1, 2)
+            if opt_name_resolution == True:
+                # print_report() looked up the same top connections already
+                ip = ip_to_hostname_cache.get(ip, ip)
+            summary.write('netstat_connection', direction=direction, ip=ip, port=port, count=counts[key])
+    summary.close()
+
+def load_cache():
+    """Fill ip_to_hostname_cache from the -w cache file, if there is one."""
+    path = os.path.join(cache_dir, CACHE_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path) as fh:
+                ip_to_hostname_cache.update(json.load(fh))
+        except ValueError:
+            # cut off by an interrupted run, written again by save_cache()
+            pass
+
+def save_cache():
+    """Write the resolved names of ip_to_hostname_cache to the -w cache file (failed lookups are tried again)."""
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    path = os.path.join(cache_dir, CACHE_FILE)
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(dict((ip, name) for (ip, name) in ip_to_hostname_cache.items() if name != ip), fh,
+                  indent=1, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
 def main():
+    global opt_name_resolution, data_dir, json_file, cache_dir
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hnr:w:J:")
+    except getopt.GetoptError:
+        usage(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            usage()
+        elif opt == '-n':
+            opt_name_resolution = True
+        elif opt == '-r':
+            data_dir = arg
+        elif opt == '-w':
+            cache_dir = arg
+        elif opt == '-J':
+            json_file = arg
+
+    use_cache = opt_name_resolution and cache_dir
+    if use_cache:
+        load_cache()
     (netstat_output, ifconfig_output, kernel) = get_data()
     host_ips = get_ips(kernel, ifconfig_output)
     host_ips_ports_idx = get_ips_ports(netstat_output, host_ips)
     (tcp_counters, inbound, outbound, local, remote, tcp_unknown) = analyze_netstat(netstat_output, host_ips_ports_idx, host_ips)
     print_report(kernel, tcp_counters, inbound, outbound, local, remote, tcp_unknown)
+    if json_file:
+        write_summary(json_file, kernel, tcp_counters, inbound, outbound, local, remote)
+    if use_cache:
+        save_cache()
 
 if __name__ == '__main__':
     main()
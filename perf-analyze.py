@@ -1,22 +1,48 @@
 #!/usr/bin/env python3
 
 # from time import time, strftime, localtime
+from time import time
 from subprocess import STDOUT, call, Popen, PIPE
+from concurrent.futures import ThreadPoolExecutor
 import os
 import sys
 import re
 import getopt
-import csv
-import decimal
-decimal.getcontext().prec = 4
+import glob
+import shutil
 
 # modules in current directory
 from tabulate import tabulate
 from mod_stats import *
+from mod_metrics import load_metrics, source_fields
+from mod_sar import SarData, read_sadf
+from mod_sadc import read_sadc
+from mod_vmstat import read_vmstat, vmstat_values
+from mod_mpstat import read_mpstat, CpuAnalysis, ALL, SATURATED_BUSY, SATURATED_SAMPLES, STEAL_THRESHOLD
+from mod_iostat import read_iostat, DeviceAnalysis, FLAG_LEGEND
+from mod_procs import read_top, read_iotop, rss_growth, top_consumers
+from mod_meminfo import read_meminfo, memory_summary
+from mod_summary import SummaryWriter, SUMMARY_FILE
+from mod_anomaly import AnomalyAnalysis, OUTLIER_Z, CO_MOVE_SAMPLES
+from mod_procsample import read_procsample, PROC_FILE
 
 # set default collection options
 duration = 60
 duration_str = str(duration)
+iotop_interval = 5
+
+# processes listed in each top consumer table
+top_n = 10
+# rows of each shift/outlier table and metrics named per co-moving group
+anomaly_n = 20
+# tcpdump-analyze.py processes for the capture (-j); by default one process
+# unless the capture is larger than parallel_pcap_size, below which pickling
+# and merging the shard flow tables costs more than the extra processes save
+tcpdump_jobs = None
+parallel_pcap_size = 256 * 1024 * 1024
+# TCP latency report of the capture (tcpdump-analyze.py -l); off by default
+# as tracking every flow's sequence numbers slows down the decode
+tcpdump_latency = False
 
 #############################################
 # Deal with directory structure and symlink #
@@ -27,34 +53,62 @@ data_dir = os.path.join(base_dir, 'data')
 date_dir = os.path.join(data_dir, 'current')
 cmd_out_dir = os.path.join(date_dir, 'cmds_out')
 report_out_dir = os.path.join(date_dir, 'reports_out')
-
-if not os.path.exists(report_out_dir):
-    os.makedirs(report_out_dir)
+output_dir = None
+metrics_file = os.path.join(base_dir, 'metrics.conf')
 
 re_start_slash = re.compile('^\/')
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "hd:o:", ["cmd_out_dir=", "output_dir="])
+    opts, args = getopt.getopt(sys.argv[1:], "hd:m:o:j:l", ["cmd_out_dir=", "metrics_file=", "output_dir=",
+                                                             "jobs=", "latency"])
     #opts, args = getopt.getopt(sys.argv[1:],"hd:o:")
 except getopt.GetoptError:
-    print('perf-analyze.py -d <cmd_out_dir> -o <output_dir>')
+    print('perf-analyze.py -d <cmd_out_dir> -o <output_dir> -m <metrics_file> -j <tcpdump_jobs> -l')
     sys.exit(2)
 for opt, arg in opts:
     if opt == '-h':
-        print('perf-analyze.py -d <cmd_out_dir> -o <output_dir>')
+        print('perf-analyze.py -d <cmd_out_dir> -o <output_dir> -m <metrics_file> -j <tcpdump_jobs> -l')
         sys.exit()
+    elif opt in ("-m", "--metrics_file"):
+        metrics_file = os.path.abspath(arg)
     elif opt in ("-d", "--cmd_out_dir"):
         if not re_start_slash.match(arg):
             arg = os.path.join(base_dir, arg)
         cmd_out_dir = arg
         date_dir = arg
+        # reports next to the collection: the sibling reports_out of a
+        # data/<timestamp>/cmds_out directory, otherwise inside the directory
+        if os.path.basename(os.path.normpath(arg)) == 'cmds_out':
+            report_out_dir = os.path.join(os.path.dirname(os.path.normpath(arg)), 'reports_out')
+        else:
+            report_out_dir = os.path.join(arg, 'reports_out')
     elif opt in ("-o", "--output_dir"):
-        date_dir = arg
+        output_dir = os.path.abspath(arg)
+    elif opt in ("-j", "--jobs"):
+        try:
+            tcpdump_jobs = max(1, int(arg))
+        except ValueError:
+            print('ERROR: -j requires a number of processes')
+            sys.exit(2)
+    elif opt in ("-l", "--latency"):
+        tcpdump_latency = True
+
+if output_dir is not None:
+    report_out_dir = output_dir
+if not os.path.exists(report_out_dir):
+    os.makedirs(report_out_dir)
 
 # if not os.path.exists(cmd_out_dir):
 #     print('Cannot find ./data/current symlink to date-stamped directory')
 #     os._exit(1)
 
+# fields to report on, their thresholds and descriptions
+try:
+    metrics = load_metrics(metrics_file)
+except (IOError, ValueError) as e:
+    print('ERROR: cannot load metric registry: {0}'.format(e))
+    sys.exit(1)
+
 # change to directory for the current sample collection
 os.chdir(date_dir)
 
@@ -66,409 +120,283 @@ os.chdir(date_dir)
 #            print(line.rstrip())
 
 
-########################################
-# Read any relevant host configuration #
-########################################
+###########################################
+# Start netstat and tcpdump sub-analyzers #
+###########################################
 
-# get ifconfig -a mapping of adapters
+# The sub-analyzers are separate processes that do not depend on each other
+# or on the vmstat/sar parsing below, so they run concurrently from here
+# (one thread waiting on each) and their reports are appended to report.out
+# in a fixed order at the end.
+analyze_start = time()
+stage_times = []
+stage_files = {}
+stage_json = {}
+stages = {}
 
-# get number of VCPUs
 
+def run_stage(cmd, outfile):
+    """Run a shell command with stdout to outfile, return its wall time."""
+    start = time()
+    call(cmd + ' > ' + outfile, shell=True)
+    return time() - start
 
-##################
-# Process vmstat #
-##################
 
-file = os.path.join(cmd_out_dir, 'vmstat.out')
+def copy_stage(src, dst):
+    start = time()
+    shutil.copyfile(src, dst)
+    return time() - start
 
-# ref: http://www.eurion.net/python-snippets/snippet/vmstat%20Reader.html
-
-# Create a map from minor to major header as the minor headers are easy to
-# associate to columns, which is not the case for major headers.
-minor2major = {
-    'r': 'procs',
-    'b': 'procs',
-    'swpd': 'memory',
-    'free': 'memory',
-    'buff': 'memory',
-    'cache': 'memory',
-    'inact': 'memory',  # to support the vmstat -a option if required
-    'active': 'memory', # to support the vmstat -a option if required
-    'si': 'swap',
-    'so': 'swap',
-    'bi': 'io',
-    'bo': 'io',
-    'in': 'system',
-    'cs': 'system',
-    'us': 'cpu',
-    'sy': 'cpu',
-    'id': 'cpu',
-    'wa': 'cpu',
-    'st': 'cpu'
-}
-minors = []
-flag_found_minor = False
-
-# Initialise the vmstat_data map by creating an empty sub-map against each
-# unique major header
-vmstat_data = dict([(h, {}) for h in set(minor2major.values())])
-
-# compile regex objects
-re_dates = re.compile(r"\d+:\d+:\d+")
-
-# Create the reader and specify the delimier to be a space; also set the
-# skipinitialspace flag to true to ensure that several spaces are seen as a
-# single delimiter and that initial spaces in a line are ignored
-reader = csv.reader(open(file), delimiter=' ', skipinitialspace=True)
-for row in reader:
-    if re_dates.match(row[3]):
-        """
-        skip lines w/ dates (redhat likes these)
-        """
-    elif row[0] == "procs":
-        """
-        Ignore the first line as it contains major headers.
-        """
-    elif row[0] == "r":
-        if not flag_found_minor:
-            """
-            If we are on the first line, create the headers list from the first row.
-            We also keep a copy of the minor headers, in the order that they appear
-            in the file to ensure that we can map the values to the correct entry
-            in the vmstat_data map.
-            """
-            minors = row
-            for h in row:
-                vmstat_data[minor2major[h]][h] = []
-            flag_found_minor = True
-    elif row[0] != minors[0] and row[0] != minor2major[minors[0]]:
-        """
-        If the -n option was not specified when running the vmstat command,
-        major and minor headers are repeated so we need to ensure that we
-        ignore such lines and only deal with lines that contain actual data.
-        For each value in the row, we append it to the respective entry in
-        the vmstat_data dictionary. In addition, we transform the value to an int
-        before appending it as we know that the vmstat_data of the log should only
-        have integer values.
-        """
-        for i, v in enumerate(row):
-            vmstat_data[minor2major[minors[i]]][minors[i]].append(int(v))
-
-
-# Initialize list for storing rows for the report and add header row
-stats = []
-s_row = ['metric', 'avg', 'sd', 'min', 'max', 'description']
-stats.append(s_row)
 
-# usr
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['cpu']['us'], 1)
-s_row = ['usr', s_avg, s_sd, s_min, s_max, '% CPU for user processes']
-stats.append(s_row)
+pool = ThreadPoolExecutor(max_workers=3)
 
-# sys
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['cpu']['sy'], 1)
-s_row = ['sys', s_avg, s_sd, s_min, s_max, '% CPU for system processes']
-stats.append(s_row)
+# netstat_analyser.py once with DNS lookups (netstat_an_dns.report) and once without (for report.out)
+cmd = os.path.join(base_dir, 'netstat_analyser.py')
+stage_files['netstat (DNS)'] = os.path.join(report_out_dir, 'netstat_an_dns.report')
+stages['netstat (DNS)'] = pool.submit(run_stage, cmd + " -n -r " + cmd_out_dir + " -w " + report_out_dir,
+                                      stage_files['netstat (DNS)'])
+stage_files['netstat'] = os.path.join(report_out_dir, 'netstat_an.report')
+stage_json['netstat'] = os.path.join(report_out_dir, 'netstat_an.jsonl')
+stages['netstat'] = pool.submit(run_stage, cmd + " -r " + cmd_out_dir + " -J " + stage_json['netstat'],
+                                stage_files['netstat'])
+
+# tcpdump-analyze.py on the capture
+cmd = os.path.join(base_dir, 'tcpdump-analyze.py')
+stage_files['tcpdump'] = os.path.join(report_out_dir, 'tcpdump.report')
+pcap_file = os.path.join(cmd_out_dir, 'tcpdump.pcap')
+# ring buffer captures (tcpdump-collect.py -C/-W) are tcpdump.pcap0, tcpdump.pcap1, ...
+pcap_files = [pcap_file]
+if not os.path.exists(pcap_file):
+    pcap_files = sorted(glob.glob(pcap_file + '[0-9]*')) or pcap_files
+live_report = os.path.join(cmd_out_dir, 'tcpdump.report')
+live_file = os.path.join(cmd_out_dir, 'tcpdump_live.out')
+if not os.path.exists(pcap_files[0]) and os.path.exists(live_report):
+    # aggregate-only live capture (perf-collect.py -a) was analyzed during collection
+    stages['tcpdump'] = pool.submit(copy_stage, live_report, stage_files['tcpdump'])
+    stage_json['tcpdump'] = os.path.join(cmd_out_dir, 'tcpdump.jsonl')
+else:
+    # decode a large capture with one process per CPU, unless -j says otherwise
+    jobs = tcpdump_jobs
+    if jobs is None:
+        size = sum(os.path.getsize(path) for path in pcap_files if os.path.exists(path))
+        jobs = (os.cpu_count() or 1) if size > parallel_pcap_size else 1
+    stage_json['tcpdump'] = os.path.join(report_out_dir, 'tcpdump.jsonl')
+    cmd = cmd + "".join(" -r " + path for path in pcap_files) + " -j " + str(jobs)
+    if tcpdump_latency:
+        cmd = cmd + " -l"
+    cmd = cmd + " -J " + stage_json['tcpdump']
+    stages['tcpdump'] = pool.submit(run_stage, cmd, stage_files['tcpdump'])
 
-# wait
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['cpu']['wa'], 1)
-s_row = ['wait', s_avg, s_sd, s_min, s_max, '% CPU wait']
-stats.append(s_row)
 
-# run queue
-# r: The number of runnable processes (running or waiting for run time).
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['procs']['r'], 1)
-#avg = fmtRed(avg)
-s_row = ['r', s_avg, s_sd, s_min, s_max, 'run queue']
-stats.append(s_row)
+########################################
+# Read any relevant host configuration #
+########################################
 
-# blocked queue
-# b: The number of processes in uninterruptible sleep.
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['procs']['b'], 1)
-s_row = ['b', s_avg, s_sd, s_min, s_max, 'processes in uninterruptible sleep']
-stats.append(s_row)
+# get ifconfig -a mapping of adapters
 
-# context switching
-# cs: The number of context switches per second.
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['system']['cs'], 0)
-#avg = fmtRed(avg)
-s_row = ['cs', s_avg, s_sd, s_min, s_max, 'CPU context switch/s']
-stats.append(s_row)
+# get number of VCPUs
 
-# interrupts
-# in: The number of interrupts per second, including the clock.
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['system']['in'], 0)
-s_row = ['in', s_avg, s_sd, s_min, s_max, 'interrupts/s']
-stats.append(s_row)
 
-# swap in
-# si: Amount of memory swapped in from disk (/s).
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['swap']['si'], 0)
-s_row = ['si', s_avg, s_sd, s_min, s_max, 'swap in from disk /s']
-stats.append(s_row)
+########################################
+# Read in-process /proc samples if any #
+########################################
 
-# swap out
-# so: Amount of memory swapped to disk (/s).
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['swap']['so'], 0)
-s_row = ['so', s_avg, s_sd, s_min, s_max, 'swap out to disk /s']
-stats.append(s_row)
+# perf-collect.py -P writes proc.bin instead of vmstat.out, sarA.bin,
+# mpstat.out and iostat.out; the stages below use it where those are missing
+stage_start = time()
+proc_file = os.path.join(cmd_out_dir, PROC_FILE)
+proc_data = None
+if os.path.exists(proc_file):
+    proc_data = read_procsample(proc_file)
+stage_times.append(('proc', time() - stage_start))
 
-# blocks in
-# bi: Blocks received from a block device (blocks/s).
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['io']['bi'], 0)
-s_row = ['bi', s_avg, s_sd, s_min, s_max, 'block read /s']
-stats.append(s_row)
 
-# blocks out
-# bo: Blocks sent to a block device (blocks/s).
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(vmstat_data['io']['bo'], 0)
-s_row = ['bo', s_avg, s_sd, s_min, s_max, 'block write /s']
-stats.append(s_row)
+##################
+# Process vmstat #
+##################
 
+stage_start = time()
+file = os.path.join(cmd_out_dir, 'vmstat.out')
+# {major header: {minor header: [samples]}}, e.g. vmstat_data['cpu']['us']
+vmstat_data = {}
+if os.path.exists(file):
+    vmstat_data = read_vmstat(file)
+elif proc_data is not None:
+    vmstat_data = proc_data.vmstat_data()
+stage_times.append(('vmstat', time() - stage_start))
 
 
 ##################
 # Process sar -A #
 ##################
-# todo - handle if sarA.data does not exist
-# look for binary and convert or find sarA.out and convert
-
-# Create a map of header fields to key fields per sample
-header2key = {
-    'pswpin/s': '',
-    'pswpout/s': '',
-    'pgpgin/s': '',
-    'pgpgout/s': '',
-    'fault/s': '',
-    'majflt/s': '',
-    'pgfree/s': '',
-    'pgscank/s': '',
-    'pgscand/s': '',
-    'pgsteal/s': '',
-    '%vmeff': '',
-    'file-nr': '',
-    'inode-nr': '',
-    'proc/s': '',
-    'cswch/s': '',
-    'intr/s': '',
-    'runq-sz': '',
-    'plist-sz': '',
-    'tps': '',
-    'rtps': '',
-    'wtps': '',
-    'bread/s': '',
-    'bwrtn/s': '',
-    'packet/s': '',
-    'udp/s': '',
-    'tcp/s': '',
-    'rxpck/s': 'IFACE',
-    'txpck/s': 'IFACE',
-    'rxkB/s': 'IFACE',
-    'txkB/s': 'IFACE',
-    'rxmcst/s': 'IFACE',
-    'rxerr/s': 'IFACE',
-    'txerr/s': 'IFACE',
-    'coll/s': 'IFACE',
-    'rxdrop/s': 'IFACE',
-    'txdrop/s': 'IFACE'
-}
-
-    # 'txcarr/s': 'IFACE',
-    # 'rxfram/s': 'IFACE',
-    # 'rxfifo/s': 'IFACE',
-    # 'txfifo/s': 'IFACE'
-
-# Initialise the sar_data map by creating an empty sub-map against each
-# unique major header
-sar_data = {}
-sar_data['IFACE'] = {}
-for h in set(header2key.keys()):
-    if header2key[h]:
-        # don't need to intialize entries w/ multiple key values because
-        # they'll be initalized later
-        continue
-    else:
-        # initialize entries that just need data collected
-        sar_data[h] = []
-
-
-re_header = re.compile('^#')
-
-file = os.path.join(cmd_out_dir, 'sarA.data')
-flag_read_data = False
-key_idx = -1
-key_name = ''
-
-reader = csv.reader(open(file), delimiter=';', skipinitialspace=True)
-for row in reader:
-    if re_header.match(row[0]):
-        flag_read_data = False
-        key_idx = -1
-        key_name = ''
-        for i, h in enumerate(row):
-            if h in header2key:
-                flag_read_data = True
-                header = row
-                # if additional key_name supplied for metric, cache key_name to use for aggregation
-                if header2key[h]:
-                    key_name = header2key[h]
-        # if key_name defined, enumerate row and get the index number for aggregating the rows of data
-        if key_name:
-            for i, h in enumerate(row):
-                if h == key_name:
-                    key_idx = i
-    elif flag_read_data:
-        if key_idx < 0:
-            for i, v in enumerate(row):
-                if header[i] in header2key:
-                    sar_data[header[i]].append(decimal.Decimal(v))
-        if key_idx >= 0:
-            key_val = row[key_idx]
-            for i, v in enumerate(row):
-                if header[i] in header2key:
-                    if key_val not in sar_data[key_name]:
-                        sar_data[key_name][key_val] = {}
-                    if header[i] not in sar_data[key_name][key_val]:
-                        sar_data[key_name][key_val][header[i]] = []
-                    sar_data[key_name][key_val][header[i]].append(decimal.Decimal(v))
-
-
-# TODO: Make these metric rows DRY
-
-# pswpin/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['pswpin/s'], 0)
-s_row = ['pswpin/s', s_avg, s_sd, s_min, s_max, 'swap pages in /s']
-stats.append(s_row)
-
-# pswpout/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['pswpout/s'], 0)
-s_row = ['pswpout/s', s_avg, s_sd, s_min, s_max, 'swap pages out /s']
-stats.append(s_row)
-
-# pgpgin/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['pgpgin/s'], 0)
-s_row = ['pgpgin/s', s_avg, s_sd, s_min, s_max, 'KB paged in from disk /s']
-stats.append(s_row)
-
-# pgpgout/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['pgpgout/s'], 0)
-s_row = ['pgpgout/s', s_avg, s_sd, s_min, s_max, 'KB paged out to disk /s']
-stats.append(s_row)
-
-# faults/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['fault/s'], 0)
-s_row = ['fault/s', s_avg, s_sd, s_min, s_max, 'major+minor page faults /s']
-stats.append(s_row)
-
-# majflt/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['majflt/s'], 0)
-s_row = ['majflt/s', s_avg, s_sd, s_min, s_max, 'page faults that required loading from disk /s']
-stats.append(s_row)
-
-# pgfree/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['pgfree/s'], 0)
-s_row = ['pgfree/s', s_avg, s_sd, s_min, s_max, 'pages placed on free list /s']
-stats.append(s_row)
-
-# pgscank/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['pgscank/s'], 0)
-s_row = ['pgscank/s', s_avg, s_sd, s_min, s_max, 'pages scanned by kswapd /s']
-stats.append(s_row)
-
-# pgscand/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['pgscand/s'], 0)
-s_row = ['pgscand/s', s_avg, s_sd, s_min, s_max, 'pages scanned directly /s']
-stats.append(s_row)
 
-# pgsteal/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['pgsteal/s'], 0)
-s_row = ['pgsteal/s', s_avg, s_sd, s_min, s_max, 'pages reclaimed from cache to satisfy demand']
-stats.append(s_row)
-
-# %vmeff
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['%vmeff'], 1)
-s_row = ['%vmeff', s_avg, s_sd, s_min, s_max, 'pgsteal/pgscan=virtual memory efficiency']
-stats.append(s_row)
-
-# file-nr
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['file-nr'], 0)
-s_row = ['file-nr', s_avg, s_sd, s_min, s_max, 'number of file handles']
-stats.append(s_row)
-
-# inode-nr
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['inode-nr'], 0)
-s_row = ['inode-nr', s_avg, s_sd, s_min, s_max, 'number of inode handlers']
-stats.append(s_row)
-
-# proc/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['proc/s'], 1)
-s_row = ['proc/s', s_avg, s_sd, s_min, s_max, 'tasks created /s']
-stats.append(s_row)
-
-# cswch/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['cswch/s'], 1)
-s_row = ['cswch/s', s_avg, s_sd, s_min, s_max, 'context switches /s']
-stats.append(s_row)
-
-# intr/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['intr/s'], 0)
-s_row = ['intr/s', s_avg, s_sd, s_min, s_max, 'interrupts /s']
-stats.append(s_row)
-
-# runq-sz
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['runq-sz'], 0)
-s_row = ['runq-sz', s_avg, s_sd, s_min, s_max, 'run queue size']
-stats.append(s_row)
-
-# plist-sz
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['plist-sz'], 0)
-s_row = ['plist-sz', s_avg, s_sd, s_min, s_max, 'number of tasks in task list']
-stats.append(s_row)
+# Map of sar header fields to the key field that splits samples into rows
+# (e.g. IFACE), taken from the metric registry
+header2key = source_fields(metrics, 'sar')
+
+# Read the wanted columns into typed arrays (interfaces x samples for IFACE),
+# straight from the sadc binary when its format is known, otherwise from
+# sadf -d text (converted here if the collection did not do it)
+stage_start = time()
+sar_bin = os.path.join(cmd_out_dir, 'sarA.bin')
+sar_text = os.path.join(cmd_out_dir, 'sarA.data')
+sar_data = None
+if os.path.exists(sar_bin):
+    try:
+        sar_data = read_sadc(sar_bin, header2key)
+    except ValueError as e:
+        print('{0}, using sadf'.format(e))
+        if not os.path.exists(sar_text):
+            call('sadf -U -d {0} -- -A >{1}'.format(sar_bin, sar_text), shell=True)
+if sar_data is None:
+    if os.path.exists(sar_text):
+        sar_data = read_sadf(sar_text, header2key)
+    elif proc_data is not None:
+        sar_data = proc_data.sar_data(header2key)
+    else:
+        print('No sar data in {0}'.format(cmd_out_dir))
+        sar_data = SarData(header2key).finish()
+stage_times.append(('sar', time() - stage_start))
+
+
+#########################
+# Process mpstat -P ALL #
+#########################
+
+# CPUs x samples matrix per % field; vmstat's host-wide usr/sys averages
+# hide a single saturated CPU on a many-core host
+stage_start = time()
+mpstat_file = os.path.join(cmd_out_dir, 'mpstat.out')
+mpstat_data = None
+cpu_analysis = None
+if os.path.exists(mpstat_file):
+    mpstat_data = read_mpstat(mpstat_file)
+elif proc_data is not None:
+    mpstat_data = proc_data.mpstat_data()
+if mpstat_data is not None:
+    cpu_analysis = CpuAnalysis(mpstat_data)
+stage_times.append(('mpstat', time() - stage_start))
 
-# packet/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['packet/s'], 0)
-s_row = ['packet/s', s_avg, s_sd, s_min, s_max, 'network packets per second']
-stats.append(s_row)
 
-# tcp/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['tcp/s'], 0)
-s_row = ['tcp/s', s_avg, s_sd, s_min, s_max, 'TCP packets per second']
-stats.append(s_row)
+#####################
+# Process iostat -x #
+#####################
 
-# udp/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['udp/s'], 0)
-s_row = ['udp/s', s_avg, s_sd, s_min, s_max, 'UDP packets per second']
-stats.append(s_row)
+# devices x samples matrix per field, whichever sysstat release wrote it
+stage_start = time()
+iostat_file = os.path.join(cmd_out_dir, 'iostat.out')
+iostat_data = None
+disk_analysis = None
+if os.path.exists(iostat_file):
+    iostat_data = read_iostat(iostat_file)
+elif proc_data is not None:
+    iostat_data = proc_data.iostat_data()
+if iostat_data is not None:
+    disk_analysis = DeviceAnalysis(iostat_data)
+stage_times.append(('iostat', time() - stage_start))
+
+
+############################
+# Process top and iotop -b #
+############################
+
+# per PID (top) and per TID (iotop) series over the samples
+stage_start = time()
+top_file = os.path.join(cmd_out_dir, 'top.out')
+top_data = None
+if os.path.exists(top_file):
+    top_data = read_top(top_file)
+stage_times.append(('top', time() - stage_start))
+stage_start = time()
+iotop_file = os.path.join(cmd_out_dir, 'iotop.out')
+iotop_data = None
+if os.path.exists(iotop_file):
+    iotop_data = read_iotop(iotop_file, iotop_interval)
+stage_times.append(('iotop', time() - stage_start))
+
+
+###################
+# Process meminfo #
+###################
+
+# /proc/meminfo at the start and end of the collection (collections before
+# meminfo_end.out only have the start)
+meminfo = []
+for name in ['meminfo.out', 'meminfo_end.out']:
+    file = os.path.join(cmd_out_dir, name)
+    if os.path.exists(file):
+        meminfo.append(memory_summary(read_meminfo(file)))
+
+
+def metric_values(metric, key_val=None):
+    """Samples of a registry metric (for one key value of keyed metrics), None if not collected."""
+    if metric.source == 'vmstat':
+        return vmstat_values(vmstat_data, metric.field)
+    return sar_data.values(metric.field, key_val)
+
+
+####################################
+# Find shifts and outliers in time #
+####################################
+
+# Every per-second series parsed above (sample j is second j of the
+# collection; vmstat's first line is the average since boot and is left
+# out), so a short stall that disappears into an average still shows
+stage_start = time()
+anomaly_series = []
+for metric in metrics:
+    if metric.source == 'meminfo':
+        continue
+    if not metric.key:
+        values = metric_values(metric)
+        if values is not None and len(values):
+            anomaly_series.append((metric.name, values[1:] if metric.source == 'vmstat' else values))
+        continue
+    for key_val in sar_data.key_values(metric.key):
+        values = sar_data.row(metric.field, key_val)
+        if values is not None:
+            anomaly_series.append(('{0} {1}'.format(key_val, metric.name), values))
+if mpstat_data is not None:
+    # 'all' moves with vmstat usr/sys
+    for cpu in mpstat_data.key_values('CPU'):
+        idle = mpstat_data.row('%idle', cpu)
+        if cpu != ALL and idle is not None:
+            anomaly_series.append(('CPU {0} busy'.format(cpu), [100.0 - v for v in idle]))
+if iostat_data is not None:
+    for device in iostat_data.key_values('Device'):
+        for field in ['await', 'aqu-sz', '%util']:
+            values = iostat_data.row(field, device)
+            if values is not None:
+                anomaly_series.append(('{0} {1}'.format(device, field), values))
+anomalies = AnomalyAnalysis(anomaly_series)
+stage_times.append(('anomaly', time() - stage_start))
 
-# tps
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['tps'], 0)
-s_row = ['tps', s_avg, s_sd, s_min, s_max, 'transfers per second to physical devices (IOPS)']
-stats.append(s_row)
 
-# rtps
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['rtps'], 0)
-s_row = ['rtps', s_avg, s_sd, s_min, s_max, 'read IOPS']
-stats.append(s_row)
+######################
+# Print Basic Report #
+######################
 
-# wtps
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['wtps'], 0)
-s_row = ['wtps', s_avg, s_sd, s_min, s_max, 'write IOPS']
-stats.append(s_row)
+stage_start = time()
 
-# bread/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['bread/s'], 0)
-s_row = ['bread/s', s_avg, s_sd, s_min, s_max, 'block reads (512B) /s']
-stats.append(s_row)
+# The report tables are also written row by row to a versioned JSON lines
+# summary (reports_out/summary.jsonl, see mod_summary) for other tools
+summary = SummaryWriter(os.path.join(report_out_dir, SUMMARY_FILE), source='perf-analyze.py',
+                        cmd_out_dir=os.path.abspath(cmd_out_dir), metrics_file=metrics_file)
 
-# bwrtn/s
-(s_avg, s_sd, s_min, s_max) = calc_avg_sd(sar_data['bwrtn/s'], 0)
-s_row = ['bwrtn/s', s_avg, s_sd, s_min, s_max, 'block writes (512B) /s']
+# One row per unkeyed metric in registry order; metrics missing from this
+# collection (e.g. an older sysstat) are left out
+stats = []
+s_row = ['metric', 'avg', 'sd', 'min', 'p95', 'p99', 'max', 'description']
 stats.append(s_row)
-
-
-######################
-# Print Basic Report #
-######################
+for metric in metrics:
+    if metric.key:
+        continue
+    values = metric_values(metric)
+    if values is None or len(values) == 0:
+        continue
+    acc = StreamStats(values)
+    stats.append([metric.name] + metric.stats(acc) + [metric.description])
+    summary.write('metric', **metric.record(acc))
 
 # Print the contents of the report file
 reportfile = os.path.join(report_out_dir, 'report.out')
@@ -482,91 +410,313 @@ with open(reportfile, 'w') as fout:
 # Print Network Adapter Report #
 ################################
 
-# TODO: need an external data file to store configuration, including
-#   order of fields to report on
-#   thresholds for each field
-#   descriptions of each filed
-
-# Initialize list for storing rows for the report and add header row
-stats = []
-row = ['adapter', 'metric', 'avg', 'sd', 'min', 'max']
-stats.append(row)
+# One table per key field (IFACE -> adapter), one block of metric rows per key value
+key_labels = {'IFACE': 'adapter'}
+for key_name in sorted(set(metric.key for metric in metrics if metric.key)):
+    stats = []
+    row = [key_labels.get(key_name, key_name), 'metric', 'avg', 'sd', 'min', 'p95', 'p99', 'max', 'description']
+    stats.append(row)
 
-re_non_zero = re.compile('drop|err')
+    for key_val in sar_data.key_values(key_name):
+        for metric in metrics:
+            if metric.key != key_name:
+                continue
+            values = metric_values(metric, key_val)
+            if values is None or len(values) == 0:
+                continue
+            acc = StreamStats(values)
+            stats.append([key_val, metric.name] + metric.stats(acc) + [metric.description])
+            summary.write(key_labels.get(key_name, key_name), key=key_name, key_value=key_val, **metric.record(acc))
+        row = [''] * len(stats[0])
+        stats.append(row)
 
-for i, x in enumerate(sar_data['IFACE']):
-    for j, y in enumerate(sar_data['IFACE'][x]):
-        (avg, sd, min, max) = calc_avg_sd(sar_data['IFACE'][x][y], 1)
+    with open(reportfile, 'a') as fout:
+        fout.write(tabulate(stats, headers="firstrow"))
+        fout.write('\n\n\n')
 
-        ######################
-        # process thresholds #
-        ######################
-        if re_non_zero.search(y):
-            if decimal.Decimal(avg) > 0:
-                avg = fmtRed(avg)
+#######################
+# Print Memory Report #
+#######################
 
-        # add row to stats table
-        row = [x, y, avg, sd, min, max]
+# start and end value of each meminfo metric, in red above its threshold
+if meminfo:
+    stats = []
+    row = ['metric', 'start', 'end', 'change', 'description']
+    stats.append(row)
+    for metric in metrics:
+        if metric.source != 'meminfo' or metric.field not in meminfo[0]:
+            continue
+        start = meminfo[0][metric.field]
+        record = {'name': metric.name, 'field': metric.field, 'start': round(start, metric.decimals),
+                  'threshold': metric.threshold, 'verdict': metric.verdict(start)}
+        if len(meminfo) > 1 and metric.field in meminfo[-1]:
+            end = meminfo[-1][metric.field]
+            row = [metric.name, metric.value(start), metric.value(end), round(end - start, metric.decimals)]
+            record.update(end=round(end, metric.decimals), change=row[3],
+                          verdict=metric.verdict(max(start, end)))
+        else:
+            row = [metric.name, metric.value(start), '', '']
+        stats.append(row + [metric.description])
+        summary.write('memory', **record)
+
+    with open(reportfile, 'a') as fout:
+        fout.write(tabulate(stats, headers="firstrow"))
+        fout.write('\n\n\n')
+
+####################
+# Print CPU Report #
+####################
+
+# avg % per CPU ('all' first), busy (100 - %idle) percentiles and flags for
+# saturated CPUs and high steal
+cpu_fields = ['%usr', '%sys', '%iowait', '%irq', '%soft', '%steal', '%idle']
+if cpu_analysis is not None and cpu_analysis.cpus:
+    hot = dict(cpu_analysis.hot)
+    stats = []
+    row = ['CPU'] + [field.lstrip('%') for field in cpu_fields] + ['busy p95', 'busy max', 'saturated', 'flags']
+    stats.append(row)
+    for cpu in [ALL] + cpu_analysis.cpus:
+        avg = cpu_analysis.avg.get(cpu)
+        if avg is None:
+            continue
+        row = [cpu] + [round(avg[field], 1) if field in avg else '' for field in cpu_fields]
+        record = dict((field, round(avg[field], 1)) for field in cpu_fields if field in avg)
+        if cpu in cpu_analysis.busy:
+            busy = cpu_analysis.busy[cpu]
+            row += [round(busy.quantile(0.95), 1), round(busy.max, 1),
+                    '{0:.0f}%'.format(cpu_analysis.saturated[cpu] * 100)]
+            record.update(busy_p95=row[-3], busy_max=row[-2], saturated=round(cpu_analysis.saturated[cpu], 3))
+        else:
+            row += ['', '', '']
+        flags = []
+        if cpu in hot:
+            flags.append('HOT ' + hot[cpu])
+        if cpu in cpu_analysis.steal:
+            flags.append('STEAL')
+        row.append(fmtRed(', '.join(flags)) if flags else '')
         stats.append(row)
-
-    # Need to figure out why this is looping more than the number of adapters (i/x)
-    row = ['', '', '', '', '', '']
+        summary.write('cpu', cpu=cpu, flags=flags, **record)
+    summary.write('cpu_summary', cpus=len(cpu_analysis.cpus), imbalance=round(cpu_analysis.imbalance, 3),
+                  hot=[cpu for (cpu, field) in cpu_analysis.hot], steal=cpu_analysis.steal)
+
+    with open(reportfile, 'a') as fout:
+        fout.write(tabulate(stats, headers="firstrow"))
+        fout.write('\n\n')
+        fout.write('CPU imbalance: {0:.2f} (0 = even load, 1 = one CPU does all the work)\n'.format(
+            cpu_analysis.imbalance))
+        if cpu_analysis.hot:
+            fout.write(fmtRed('Saturated CPUs: {0} of {1} at least {2:.0f}% busy in {3:.0f}% of samples: {4}'.format(
+                len(cpu_analysis.hot), len(cpu_analysis.cpus), SATURATED_BUSY, SATURATED_SAMPLES * 100,
+                ', '.join('{0} ({1})'.format(cpu, field) for (cpu, field) in cpu_analysis.hot))) + '\n')
+        if cpu_analysis.steal:
+            fout.write(fmtRed('High steal: avg %steal >= {0:.0f} on {1}'.format(
+                STEAL_THRESHOLD, ', '.join(cpu_analysis.steal))) + '\n')
+        fout.write('\n\n')
+
+#######################
+# Print Device Report #
+#######################
+
+# latency percentiles, queue and utilization per device, flags on the first row
+disk_metrics = [
+    ('iops', 1, 'read+write IOPS'),
+    ('r_await', 2, 'ms per read (queue+service)'),
+    ('w_await', 2, 'ms per write (queue+service)'),
+    ('await', 2, 'ms per I/O'),
+    ('aqu-sz', 2, 'avg requests queued'),
+    ('%util', 1, '% time busy (not a limit for NVMe/RAID)'),
+    ('rareq-sz', 1, 'avg read size kB'),
+    ('wareq-sz', 1, 'avg write size kB'),
+]
+if disk_analysis is not None and disk_analysis.devices:
+    stats = []
+    row = ['device', 'metric', 'avg', 'p50', 'p95', 'p99', 'max', 'flags', 'description']
     stats.append(row)
+    for device in disk_analysis.devices:
+        flags = disk_analysis.flags[device]
+        flag_text = fmtRed(', '.join(flags)) if flags else ''
+        for (field, decimal, description) in disk_metrics:
+            acc = disk_analysis.stats[device].get(field)
+            if acc is None or not acc.count:
+                continue
+            row = [device, field] + [round(v, decimal) for v in (acc.mean, acc.quantile(0.5), acc.quantile(0.95),
+                                                                 acc.quantile(0.99), acc.max)]
+            stats.append(row + [flag_text, description])
+            flag_text = ''
+            summary.write('device', device=device, metric=field, flags=flags,
+                          **dict(zip(['avg', 'p50', 'p95', 'p99', 'max'], row[2:])))
+        row = [''] * len(stats[0])
+        stats.append(row)
 
-
-with open(reportfile, 'a') as fout:
-    fout.write(tabulate(stats, headers="firstrow"))
-    fout.write('\n\n\n')
-
-#####################################
-# Analyze netstat and create report #
-#####################################
-
-# Run netstat_analyser.py to write IP lookup cache to file and write report file with lookups
-outfile = os.path.join(report_out_dir, 'netstat_an_dns.report')
-cmd = os.path.join(base_dir, 'netstat_analyser.py')
-cmd = cmd + " -n -r " + cmd_out_dir + " -w " + cmd_out_dir + " > " + outfile
-call(cmd , shell=True)
-
-# Create report file from netstat output file
-outfile = os.path.join(report_out_dir, 'netstat_an.report')
-cmd = os.path.join(base_dir, 'netstat_analyser.py')
-cmd = cmd + " -r " + cmd_out_dir + " > " + outfile
-call(cmd , shell=True)
+    with open(reportfile, 'a') as fout:
+        fout.write(tabulate(stats, headers="firstrow"))
+        fout.write('\n\n')
+        fout.write(FLAG_LEGEND + '\n')
+        fout.write('\n\n')
+
+###########################################
+# Print Shifts, Outliers and Co-movements #
+###########################################
+
+# when a series changed level (shifts) or left it briefly (outliers), in
+# seconds from the start of the collection, and which series moved together
+if anomalies.shifts or anomalies.outliers:
+    stats = [['metric', 'from s', 'to s', 'before', 'after', 'change %', 't']]
+    for (name, first, last, before, after, t) in anomalies.shifts[:anomaly_n]:
+        change = round(100.0 * (after - before) / abs(before), 1) if before else ''
+        stats.append([name, first, last, round(before, 2), round(after, 2), change, round(t, 1)])
+        summary.write('shift', metric=name, first=first, last=last, before=round(before, 2), after=round(after, 2),
+                      t=round(t, 1))
+    with open(reportfile, 'a') as fout:
+        if len(stats) > 1:
+            fout.write('Shifts (mean changes and stays changed; t = change / sample-to-sample noise):\n')
+            fout.write(tabulate(stats, headers="firstrow"))
+            fout.write('\n\n')
+
+    stats = [['metric', 'from s', 'to s', 'peak', 'baseline', 'z']]
+    for (name, first, last, peak, baseline, z) in anomalies.outliers[:anomaly_n]:
+        stats.append([name, first, last, round(peak, 2), round(baseline, 2), round(z, 1)])
+        summary.write('outlier', metric=name, first=first, last=last, peak=round(peak, 2), baseline=round(baseline, 2),
+                      z=round(z, 1))
+    with open(reportfile, 'a') as fout:
+        if len(stats) > 1:
+            fout.write('Outliers (robust z > {0} from the median/MAD of the series):\n'.format(OUTLIER_Z))
+            fout.write(tabulate(stats, headers="firstrow"))
+            fout.write('\n\n')
+
+    stats = [['from s', 'to s', 'metrics (up/down)']]
+    for (first, last, moved) in anomalies.groups:
+        names = ['{0} {1}'.format(name, direction) for (name, direction) in moved]
+        more = ', +{0} more'.format(len(names) - anomaly_n) if len(names) > anomaly_n else ''
+        stats.append([first, last, ', '.join(names[:anomaly_n]) + more])
+        summary.write('co_moving', first=first, last=last, metrics=[name for (name, direction) in moved],
+                      directions=[direction for (name, direction) in moved])
+    with open(reportfile, 'a') as fout:
+        if len(stats) > 1:
+            fout.write('Moved together (shifts and outliers starting within {0}s):\n'.format(
+                CO_MOVE_SAMPLES))
+            fout.write(tabulate(stats, headers="firstrow"))
+            fout.write('\n\n')
+        fout.write('\n')
+
+########################
+# Print Process Report #
+########################
+
+def process_row(procs, pid):
+    command = procs.commands.get(pid, '')
+    return [pid, procs.users.get(pid, ''), command[:40]]
+
+
+if top_data is not None and top_data.times:
+    samples = len(top_data.times)
+    stats = [['PID', 'user', 'command', 'avg %CPU', 'max %CPU', 'samples', 'states']]
+    for (pid, avg, peak, count) in top_consumers(top_data, '%CPU', top_n):
+        if peak <= 0:
+            continue
+        stats.append(process_row(top_data, pid) + [round(avg, 1), round(peak, 1), '{0}/{1}'.format(count, samples),
+                                                   ''.join(top_data.states.get(pid, []))])
+        summary.write('process_cpu', **dict(zip(['pid', 'user', 'command', 'avg', 'max', 'samples', 'states'],
+                                                stats[-1][:5] + [count, stats[-1][6]])))
+    with open(reportfile, 'a') as fout:
+        fout.write('Top processes by CPU (top, {0} samples):\n'.format(samples))
+        fout.write(tabulate(stats, headers="firstrow"))
+        fout.write('\n\n')
+
+    growth_fits = rss_growth(top_data)
+    growing = dict((pid, (slope, r2, growth)) for (pid, slope, r2, growth) in growth_fits)
+    stats = [['PID', 'user', 'command', 'avg RES MB', 'max RES MB', 'growth MB/min', 'samples']]
+    for (pid, avg, peak, count) in top_consumers(top_data, 'RES', top_n, by_max=True):
+        growth = ''
+        if pid in growing:
+            growth = fmtRed(round(growing[pid][0] * 60 / 1024, 2))
+        stats.append(process_row(top_data, pid) + [round(avg / 1024, 1), round(peak / 1024, 1), growth,
+                                                   '{0}/{1}'.format(count, samples)])
+        summary.write('process_memory', **dict(zip(['pid', 'user', 'command', 'avg_mb', 'max_mb'], stats[-1][:5]),
+                                               samples=count, growing=pid in growing))
+    with open(reportfile, 'a') as fout:
+        fout.write('Top processes by memory (RES):\n')
+        fout.write(tabulate(stats, headers="firstrow"))
+        fout.write('\n\n')
+
+    # every process with steadily growing RSS, not only the largest ones
+    if growing:
+        stats = [['PID', 'user', 'command', 'growth MB/min', 'growth MB', 'r2', 'max RES MB']]
+        for (pid, slope, r2, growth) in growth_fits:
+            stats.append(process_row(top_data, pid) + [round(slope * 60 / 1024, 2), round(growth / 1024, 1),
+                                                       round(r2, 2), round(max(top_data.data.values('RES', pid)) / 1024, 1)])
+            summary.write('rss_growth', **dict(zip(['pid', 'user', 'command', 'mb_per_min', 'growth_mb', 'r2', 'max_mb'],
+                                                   stats[-1])))
+        with open(reportfile, 'a') as fout:
+            fout.write(fmtRed('RSS growing steadily (least squares fit over the samples):') + '\n')
+            fout.write(tabulate(stats, headers="firstrow"))
+            fout.write('\n\n')
+    with open(reportfile, 'a') as fout:
+        fout.write('\n')
+
+if iotop_data is not None and iotop_data.times:
+    samples = len(iotop_data.times)
+    stats = [['TID', 'user', 'command', 'avg read KB/s', 'avg write KB/s', 'max KB/s', 'samples']]
+    for (tid, avg, peak, count) in top_consumers(iotop_data, 'io', top_n):
+        if peak <= 0:
+            continue
+        reads = iotop_data.data.values('read', tid)
+        writes = iotop_data.data.values('write', tid)
+        stats.append(process_row(iotop_data, tid) + [round(sum(reads) / len(reads), 1),
+                                                     round(sum(writes) / len(writes), 1), round(peak, 1),
+                                                     '{0}/{1}'.format(count, samples)])
+        summary.write('thread_io', **dict(zip(['tid', 'user', 'command', 'read_kBps', 'write_kBps', 'max_kBps'],
+                                              stats[-1][:6]), samples=count))
+    with open(reportfile, 'a') as fout:
+        fout.write('Top threads by disk I/O (iotop, {0} samples, averages over the samples listed):\n'.format(samples))
+        fout.write(tabulate(stats, headers="firstrow"))
+        fout.write('\n\n\n')
+stage_times.append(('report tables', time() - stage_start))
+
+#################################################
+# Append netstat and tcpdump reports (in order) #
+#################################################
+
+# wait for each sub-analyzer in report order, whichever finished first
+for name in ['netstat (DNS)', 'netstat', 'tcpdump']:
+    stage_times.append((name, stages[name].result()))
+pool.shutdown()
 
 with open(reportfile, 'a') as fout:
     fout.write("************************\n")
     fout.write("** netstat -an report **\n")
     fout.write("************************\n")
-    with open(outfile, 'r') as fin:
+    with open(stage_files['netstat'], 'r') as fin:
         fout.write(fin.read())
     fout.write('\n\n\n')
 
-#####################################
-# Analyze tcpdump and create report #
-#####################################
-
-# Create report file from netstat output file
-outfile = os.path.join(report_out_dir, 'tcpdump.report')
-cmd = os.path.join(base_dir, 'tcpdump-analyze.py')
-pcap_file = os.path.join(cmd_out_dir, 'tcpdump.pcap')
-cmd = cmd + " -r " + pcap_file + " > " + outfile
-call(cmd , shell=True)
-
-# combine tcpdump report "outfile" into aggregated reportfile (report.txt)
+# combine tcpdump report into aggregated reportfile (report.txt)
 with open(reportfile, 'a') as fout:
     fout.write("********************\n")
     fout.write("** tcpdump report **\n")
     fout.write("********************\n")
-    with open(outfile, 'r') as fin:
+    with open(stage_files['tcpdump'], 'r') as fin:
         fout.write(fin.read())
+    if os.path.exists(live_file):
+        fout.write('Live per-second summary:\n')
+        with open(live_file, 'r') as fin:
+            fout.write(fin.read())
     fout.write('\n\n\n')
 
 ######################
 # Write summary info #
 ######################
 
-# TBD - record key summary stats to a file in data/date dir so multiple reports can be summarized
+# netstat and tcpdump records from their -J summaries, in report order
+for name in ['netstat', 'tcpdump']:
+    if os.path.exists(stage_json.get(name, '')):
+        try:
+            summary.copy(stage_json[name])
+        except ValueError as e:
+            print('Leaving {0} out of the summary: {1}'.format(name, e))
+for (name, seconds) in stage_times:
+    summary.write('stage', name=name, seconds=round(seconds, 3))
+summary.close()
 
 #####################
 # Print report file #
@@ -576,5 +726,12 @@ with open(reportfile, 'a') as fout:
 with open(reportfile, 'r') as fin:
     print(fin.read())
 
+# wall time per stage; the sub-analyzers overlap each other and the parsing
+# so the stages add up to more than the total
+print('Stage wall times:')
+for (name, seconds) in stage_times:
+    print('  {0:<15} {1:8.2f}s'.format(name, seconds))
+print('  {0:<15} {1:8.2f}s'.format('total', time() - analyze_start))
+
 
 os._exit(0)
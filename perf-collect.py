@@ -1,12 +1,50 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import getopt
 from time import time, localtime, strftime
 from subprocess import call
 
+# modules in current directory
+from mod_sadc import sadc_readable
+from mod_catalog import Catalog
+from mod_procsample import ProcSampler, PROC_FILE
+
+def usage(exit_code=0):
+    """Display help message if -h option used or invalid syntax."""
+    print(os.path.basename(__file__) + ' [-l] [-a] [-P] [-T <tcpdump-collect options>]')
+    print("")
+    print("  -l  analyze tcpdump packets live instead of only writing tcpdump.pcap")
+    print("  -a  live tcpdump analysis keeping only the aggregate report (no pcap written)")
+    print("  -P  sample /proc in-process into {0} instead of forking mpstat, vmstat, iostat and sadc".format(PROC_FILE))
+    print("      (no sarA.bin/sarA.ksar, see mod_procsample.py for the fields)")
+    print("  -T  extra tcpdump-collect.py options, e.g. -T \"-H -C 100 -W 4 -f 'tcp port 443'\"")
+    print("")
+    sys.exit(exit_code)
+
 # set default collection options
 duration = 60
 duration_str = str(duration)
+tcpdump_opts = ''
+tcpdump_extra_opts = ''
+proc_sample = False
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "ahlPT:")
+except getopt.GetoptError:
+    usage(1)
+for opt, arg in opts:
+    if opt == '-h':
+        usage()
+    elif opt in ("-l"):
+        tcpdump_opts = ' -l'
+    elif opt in ("-a"):
+        tcpdump_opts = ' -a'
+    elif opt in ("-P"):
+        proc_sample = True
+    elif opt in ("-T"):
+        tcpdump_extra_opts = ' ' + arg
 
 
 #############################################
@@ -63,7 +101,8 @@ call('netstat -in >netstat_in_start.out', shell=True)
 children = []
 
 print("forking tcpdump")
-cmd = '{0}/tcpdump-collect.py -w {1} -t 10'.format(base_dir, os.path.join(cmd_out_dir, 'tcpdump.pcap'))
+cmd = '{0}/tcpdump-collect.py -w {1} -t 10{2}{3}'.format(base_dir, os.path.join(cmd_out_dir, 'tcpdump.pcap'),
+                                                      tcpdump_opts, tcpdump_extra_opts)
 pid = os.fork()
 if pid > 0:
     # parent
@@ -73,54 +112,65 @@ else:
     call(cmd, shell=True)
     os._exit(0)
 
-print("forking mpstat")
-cmd = 'mpstat 1 ' + duration_str + ' -P ALL >mpstat.out'
-pid = os.fork()
-if pid > 0:
-    # parent
-    children.append(pid)
+if proc_sample:
+    print("forking /proc sampler")
+    pid = os.fork()
+    if pid > 0:
+        # parent
+        children.append(pid)
+    else:
+        # child: one process reading /proc instead of four collectors
+        ProcSampler().run(PROC_FILE, 1, duration)
+        os._exit(0)
 else:
-    # child
-    call(cmd, shell=True)
-    os._exit(0)
-
-print("forking vmstat")
-cmd = 'vmstat 1 ' + duration_str + ' >vmstat.out'
-pid = os.fork()
-if pid > 0:
-    # parent
-    children.append(pid)
-else:
-    # child
-    call(cmd, shell=True)
-    os._exit(0)
-
-print("forking iostat")
-cmd = 'iostat -t -z -x 1 ' + duration_str + ' >iostat.out'
-pid = os.fork()
-if pid > 0:
-    # parent
-    children.append(pid)
-else:
-    # child
-    call(cmd, shell=True)
-    os._exit(0)
-
-print("forking sar")
-# cmd = 'sar -o sarA.bin -A 1 ' + duration_str + ' -p >sarA.out'
-for sadc in ['/usr/lib/sysstat/sadc', '/usr/lib64/sa/sadc']:
-    if os.path.exists(sadc):
-        break
-
-cmd = sadc + ' -S ALL 1 ' + duration_str + ' sarA.bin'
-pid = os.fork()
-if pid > 0:
-    # parent
-    children.append(pid)
-else:
-    # child
-    call(cmd, shell=True)
-    os._exit(0)
+    print("forking mpstat")
+    cmd = 'mpstat 1 ' + duration_str + ' -P ALL >mpstat.out'
+    pid = os.fork()
+    if pid > 0:
+        # parent
+        children.append(pid)
+    else:
+        # child
+        call(cmd, shell=True)
+        os._exit(0)
+
+    print("forking vmstat")
+    cmd = 'vmstat 1 ' + duration_str + ' >vmstat.out'
+    pid = os.fork()
+    if pid > 0:
+        # parent
+        children.append(pid)
+    else:
+        # child
+        call(cmd, shell=True)
+        os._exit(0)
+
+    print("forking iostat")
+    cmd = 'iostat -t -z -x 1 ' + duration_str + ' >iostat.out'
+    pid = os.fork()
+    if pid > 0:
+        # parent
+        children.append(pid)
+    else:
+        # child
+        call(cmd, shell=True)
+        os._exit(0)
+
+    print("forking sar")
+    # cmd = 'sar -o sarA.bin -A 1 ' + duration_str + ' -p >sarA.out'
+    for sadc in ['/usr/lib/sysstat/sadc', '/usr/lib64/sa/sadc']:
+        if os.path.exists(sadc):
+            break
+
+    cmd = sadc + ' -S ALL 1 ' + duration_str + ' sarA.bin'
+    pid = os.fork()
+    if pid > 0:
+        # parent
+        children.append(pid)
+    else:
+        # child
+        call(cmd, shell=True)
+        os._exit(0)
 
 print("forking iotop")
 interval = 5
@@ -182,6 +232,7 @@ for child in children:
 ###########################
 
 call('netstat -in >netstat_in_end.out', shell=True)
+call('cat /proc/meminfo >meminfo_end.out', shell=True)
 call('ifconfig -a >ifconfig_a.out', shell=True)
 call('uname >uname.out', shell=True)
 call('cat /proc/cpuinfo >cpuinfo.out', shell=True)
@@ -193,11 +244,16 @@ call('df -i >df_i.out', shell=True)
 # Post-process any files #
 ##########################
 
-# for perf-analyze.py
-call('sadf -U -d sarA.bin -- -A  >sarA.data', shell=True)
+if not proc_sample:
+    # for perf-analyze.py, which reads sarA.bin directly if its format is known
+    if not sadc_readable('sarA.bin'):
+        call('sadf -U -d sarA.bin -- -A  >sarA.data', shell=True)
+
+    # for ksar
+    call('LC_ALL=C sar -A -f sarA.bin >> sarA.ksar; gzip sarA.ksar', shell=True)
 
-# for ksar
-call('LC_ALL=C sar -A -f sarA.bin >> sarA.ksar; gzip sarA.ksar', shell=True)
+# add this collection to data/catalog.jsonl (perf-list.py indexes any others)
+Catalog(data_dir).add(date_dir)
 
 elapsed = time() - start_time
 print('Elapsed time: {0}.'.format(elapsed))
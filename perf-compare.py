@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import getopt
+
+from tabulate import tabulate
+from mod_stats import fmtRed
+from mod_metrics import load_metrics
+from mod_compare import Comparison, collection_dir, read_series, read_endpoints, effect_size, ALPHA
+from mod_summary import SummaryWriter
+
+def usage(exit_code=0):
+    """Display help message if -h option used or invalid syntax."""
+    print(os.path.basename(__file__) + ' -b <before> -a <after> [-p <alpha>] [-n <rows>] [-A] [-m <metrics_file>] [-J <json_file>]')
+    print("")
+    print("  -b, --before       earlier collection: data/<timestamp>, its <timestamp> or a cmds_out directory")
+    print("  -a, --after        later collection to compare with it")
+    print("  -p, --alpha        report changes with a Mann-Whitney p below this (default {0})".format(arg_dict['alpha']))
+    print("  -n, --rows         rows per table (default {0})".format(arg_dict['rows']))
+    print("  -A, --all          list every series in both collections, changed or not")
+    print("  -m, --metrics_file metric registry (default ./metrics.conf)")
+    print("  -J, --json_file    also write the tables as a JSON lines summary (mod_summary)")
+    print("")
+    sys.exit(exit_code)
+
+# default arguments
+base_dir = os.path.dirname(os.path.abspath(__file__))
+arg_dict = {}
+arg_dict['data_dir'] = os.path.join(base_dir, 'data')
+arg_dict['before'] = None
+arg_dict['after'] = None
+arg_dict['alpha'] = ALPHA
+arg_dict['rows'] = 50
+arg_dict['all'] = False
+arg_dict['metrics_file'] = os.path.join(base_dir, 'metrics.conf')
+arg_dict['json_file'] = None
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "ha:b:m:n:p:AJ:",
+                               ["after=", "before=", "metrics_file=", "rows=", "alpha=", "all", "json_file="])
+except getopt.GetoptError:
+    usage(2)
+try:
+    for opt, arg in opts:
+        if opt == '-h':
+            usage()
+        elif opt in ("-b", "--before"):
+            arg_dict['before'] = collection_dir(arg, arg_dict['data_dir'])
+        elif opt in ("-a", "--after"):
+            arg_dict['after'] = collection_dir(arg, arg_dict['data_dir'])
+        elif opt in ("-p", "--alpha"):
+            arg_dict['alpha'] = float(arg)
+        elif opt in ("-n", "--rows"):
+            arg_dict['rows'] = int(arg)
+        elif opt in ("-A", "--all"):
+            arg_dict['all'] = True
+        elif opt in ("-m", "--metrics_file"):
+            arg_dict['metrics_file'] = arg
+        elif opt in ("-J", "--json_file"):
+            arg_dict['json_file'] = arg
+except ValueError as e:
+    print('ERROR: {0}'.format(e))
+    usage(2)
+if arg_dict['before'] is None or arg_dict['after'] is None:
+    usage(2)
+
+try:
+    metrics = load_metrics(arg_dict['metrics_file'])
+except (IOError, ValueError) as e:
+    print('ERROR: cannot load metric registry: {0}'.format(e))
+    sys.exit(1)
+by_name = dict((metric.name, metric) for metric in metrics)
+
+comparison = Comparison(read_series(arg_dict['before'], metrics), read_series(arg_dict['after'], metrics),
+                        read_endpoints(arg_dict['before']), read_endpoints(arg_dict['after']))
+
+summary = None
+if arg_dict['json_file']:
+    summary = SummaryWriter(arg_dict['json_file'], source='perf-compare.py', before=os.path.abspath(arg_dict['before']),
+                            after=os.path.abspath(arg_dict['after']), alpha=arg_dict['alpha'])
+
+print('Comparing {0} (before) with {1} (after)'.format(arg_dict['before'], arg_dict['after']))
+print('')
+
+
+def describe(key):
+    """(decimals, description) of a series key (table, key value, name)."""
+    (table, key_val, name) = key
+    metric = by_name.get(name)
+    if table in ('metric', 'adapter') and metric is not None:
+        return (metric.decimals, metric.description)
+    return (2, '')
+
+
+#################
+# Series tables #
+#################
+
+# per-second samples of each series in both collections, largest effect first
+if arg_dict['all']:
+    changes = comparison.changes
+    print('All series in both collections, largest effect (Cliff\'s delta) first:')
+else:
+    changes = comparison.significant(arg_dict['alpha'])
+    print('Series whose samples changed (Mann-Whitney p < {0}, effect at least small), largest effect first:'.format(
+        arg_dict['alpha']))
+stats = [['table', 'key', 'metric', 'before avg', 'after avg', 'before p95', 'after p95', 'change %', 'p',
+          'effect', 'size', 'description']]
+for (key, before, after, p, effect) in changes[:arg_dict['rows']]:
+    (decimals, description) = describe(key)
+    size = effect_size(effect)
+    change = round(100.0 * (after.mean - before.mean) / abs(before.mean), 1) if before.mean else ''
+    row = list(key) + [round(v, decimals) for v in (before.mean, after.mean, before.quantile(0.95), after.quantile(0.95))]
+    row += [change, '{0:.2g}'.format(p), round(effect, 2), fmtRed(size) if size == 'large' and p < arg_dict['alpha'] else size,
+            description]
+    stats.append(row)
+    if summary is not None:
+        summary.write('series_change', table=key[0], key=key[1], metric=key[2], before_avg=row[3], after_avg=row[4],
+                      before_p95=row[5], after_p95=row[6], p=p, effect=round(effect, 3), size=size,
+                      before_samples=before.count, after_samples=after.count)
+if len(stats) > 1:
+    print(tabulate(stats, headers="firstrow"))
+else:
+    print('none')
+if len(changes) > arg_dict['rows']:
+    print('... {0} more (-n)'.format(len(changes) - arg_dict['rows']))
+print('')
+
+# adapters, CPUs, devices or metrics collected only once
+for (label, keys, record) in [('Only in before', comparison.removed, 'series_removed'),
+                              ('Only in after', comparison.added, 'series_added')]:
+    if not keys:
+        continue
+    print(label + ':')
+    stats = [['table', 'key', 'metrics']]
+    for key in keys:
+        if len(stats) > 1 and stats[-1][:2] == list(key[:2]):
+            stats[-1][2] += ', ' + key[2]
+        else:
+            stats.append(list(key))
+    print(tabulate(stats, headers="firstrow"))
+    print('')
+    if summary is not None:
+        for key in keys:
+            summary.write(record, table=key[0], key=key[1], metric=key[2])
+
+###################
+# Endpoints table #
+###################
+
+# established connections per endpoint (netstat_analyser.py directions) and TCP state counts
+if comparison.endpoints:
+    print('Connection endpoints and TCP states (netstat -an at the start of each collection, not tested):')
+    stats = [['direction', 'endpoint', 'before', 'after', 'change']]
+    for ((direction, endpoint), before, after) in comparison.endpoints[:arg_dict['rows']]:
+        stats.append([direction, endpoint, before, after, '{0:+d}'.format(after - before)])
+        if summary is not None:
+            summary.write('endpoint_change', direction=direction, endpoint=endpoint, before=before, after=after)
+    print(tabulate(stats, headers="firstrow"))
+    if len(comparison.endpoints) > arg_dict['rows']:
+        print('... {0} more (-n)'.format(len(comparison.endpoints) - arg_dict['rows']))
+    print('')
+
+if summary is not None:
+    summary.close()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import getopt
+
+from tabulate import tabulate
+from mod_catalog import Catalog, CATALOG_FILE, FIELDS, parse_filter, matches
+
+def usage(exit_code=0):
+    """Display help message if -h option used or invalid syntax."""
+    print(os.path.basename(__file__) + ' [-d <data_dir>] [-f <filter>]... [-s <field>] [-r] [-n <runs>] [-l] [-N] [-R]')
+    print("")
+    print("  -d, --data_dir  directory of the data/<timestamp> collections (default ./data)")
+    print("  -f, --filter    only runs where <field><op><value> holds, op one of >= <= != > < = ~ (contains),")
+    print("                  e.g. -f cpu_p95>80 -f host=web1 -f artifacts~tcpdump.pcap; repeat to combine")
+    print("  -s, --sort      sort by a field (default run, which is the start time)")
+    print("  -r, --reverse   reverse the order")
+    print("  -n, --runs      only the last <runs> runs after sorting")
+    print("  -l, --long      list the files of each run")
+    print("  -N, --no_update list the catalog as it is, without looking for new collections")
+    print("  -R, --rebuild   index every collection again")
+    print("")
+    print("  fields: " + ', '.join(FIELDS + ['start']))
+    print("")
+    sys.exit(exit_code)
+
+# default arguments
+base_dir = os.path.dirname(os.path.abspath(__file__))
+arg_dict = {}
+arg_dict['data_dir'] = os.path.join(base_dir, 'data')
+arg_dict['filters'] = []
+arg_dict['sort'] = 'run'
+arg_dict['reverse'] = False
+arg_dict['runs'] = None
+arg_dict['long'] = False
+arg_dict['update'] = True
+arg_dict['rebuild'] = False
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "hd:f:s:rn:lNR",
+                               ["data_dir=", "filter=", "sort=", "reverse", "runs=", "long", "no_update", "rebuild"])
+except getopt.GetoptError:
+    usage(2)
+try:
+    for opt, arg in opts:
+        if opt == '-h':
+            usage()
+        elif opt in ("-d", "--data_dir"):
+            arg_dict['data_dir'] = arg
+        elif opt in ("-f", "--filter"):
+            arg_dict['filters'].append(parse_filter(arg))
+        elif opt in ("-s", "--sort"):
+            if arg not in FIELDS + ['start']:
+                raise ValueError('cannot sort by {0}'.format(arg))
+            arg_dict['sort'] = arg
+        elif opt in ("-r", "--reverse"):
+            arg_dict['reverse'] = True
+        elif opt in ("-n", "--runs"):
+            arg_dict['runs'] = int(arg)
+        elif opt in ("-l", "--long"):
+            arg_dict['long'] = True
+        elif opt in ("-N", "--no_update"):
+            arg_dict['update'] = False
+        elif opt in ("-R", "--rebuild"):
+            arg_dict['rebuild'] = True
+except ValueError as e:
+    print('ERROR: {0}'.format(e))
+    usage(2)
+
+if not os.path.isdir(arg_dict['data_dir']):
+    print('ERROR: cannot find data directory {0}'.format(arg_dict['data_dir']))
+    sys.exit(1)
+
+catalog = Catalog(arg_dict['data_dir'])
+if arg_dict['update'] or arg_dict['rebuild']:
+    indexed = catalog.update(arg_dict['rebuild'])
+    if indexed:
+        print('Indexed {0} run(s) into {1}'.format(len(indexed), os.path.join(arg_dict['data_dir'], CATALOG_FILE)))
+
+# runs without a number sort first (ascending), whatever the field
+runs = [record for record in catalog.runs if matches(record, arg_dict['filters'])]
+runs.sort(key=lambda record: (record.get(arg_dict['sort']) is not None, record.get(arg_dict['sort'])),
+          reverse=arg_dict['reverse'])
+if arg_dict['runs'] is not None:
+    runs = runs[-arg_dict['runs']:] if arg_dict['runs'] else []
+
+stats = [['run', 'host', 'cpus', 'secs', 'cpu avg', 'cpu p95', 'iowait', 'runq', 'rx kB/s', 'tx kB/s', 'adapter',
+          '%util', 'await p95', 'device', 'mem %', 'swap %', 'files', 'report']]
+for record in runs:
+    artifacts = record.get('artifacts') or []
+    row = [record.get(field) for field in FIELDS if field != 'artifacts']
+    row = ['' if value is None else value for value in row]
+    row += [len([name for name in artifacts if not name.startswith('reports_out/')]),
+            'yes' if 'reports_out/report.out' in artifacts else '']
+    stats.append(row)
+print(tabulate(stats, headers="firstrow"))
+print('{0} of {1} runs'.format(len(runs), len(catalog.runs)))
+
+if arg_dict['long']:
+    print('')
+    for record in runs:
+        print('{0}: {1}'.format(record['run'], ' '.join(record.get('artifacts') or [])))
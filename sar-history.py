@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import getopt
+from time import localtime, strftime
+
+from tabulate import tabulate
+from mod_metrics import load_metrics, source_fields
+from mod_history import SaHistory, parse_hour, FIRST_HOUR, LAST_HOUR
+
+def usage(exit_code=0):
+    """Display help message if -h option used or invalid syntax."""
+    print(os.path.basename(__file__) + ' [-d <sa_dir>] [-f <from>] [-t <to>] [-H <metrics>] [-c <cache_dir>] [-m <metrics_file>]')
+    print("")
+    print("  -d, --sa_dir       directory of daily sadc files saDD (default /var/log/sa or /var/log/sysstat)")
+    print("  -f, --from         first hour to report, YYYY-MM-DD[ HH] (default: oldest data)")
+    print("  -t, --to           last hour to report, YYYY-MM-DD[ HH] (default: newest data)")
+    print("  -H, --hours        comma separated metrics for the hour-of-day table (default {0})".format(arg_dict['hour_metrics']))
+    print("  -c, --cache_dir    hourly summary cache (default ./data/history)")
+    print("  -m, --metrics_file metric registry (default ./metrics.conf)")
+    print("")
+    sys.exit(exit_code)
+
+def fmt_time(ts):
+    if ts is None:
+        return ''
+    return strftime('%Y-%m-%d %H:%M:%S', localtime(ts))
+
+# default arguments
+base_dir = os.path.dirname(os.path.abspath(__file__))
+arg_dict = {}
+arg_dict['sa_dir'] = '/var/log/sa'
+if not os.path.isdir(arg_dict['sa_dir']):
+    arg_dict['sa_dir'] = '/var/log/sysstat'
+arg_dict['start'] = FIRST_HOUR
+arg_dict['end'] = LAST_HOUR
+arg_dict['hour_metrics'] = 'runq-sz,cswch/s,tps,fault/s'
+arg_dict['cache_dir'] = os.path.join(base_dir, 'data', 'history')
+arg_dict['metrics_file'] = os.path.join(base_dir, 'metrics.conf')
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "hc:d:f:m:t:H:",
+                               ["sa_dir=", "from=", "to=", "hours=", "cache_dir=", "metrics_file="])
+except getopt.GetoptError:
+    usage(2)
+try:
+    for opt, arg in opts:
+        if opt == '-h':
+            usage()
+        elif opt in ("-d", "--sa_dir"):
+            arg_dict['sa_dir'] = arg
+        elif opt in ("-f", "--from"):
+            arg_dict['start'] = parse_hour(arg, 0)
+        elif opt in ("-t", "--to"):
+            arg_dict['end'] = parse_hour(arg, 23)
+        elif opt in ("-H", "--hours"):
+            arg_dict['hour_metrics'] = arg
+        elif opt in ("-c", "--cache_dir"):
+            arg_dict['cache_dir'] = arg
+        elif opt in ("-m", "--metrics_file"):
+            arg_dict['metrics_file'] = arg
+except ValueError as e:
+    print('ERROR: {0}'.format(e))
+    usage(2)
+
+if not os.path.isdir(arg_dict['sa_dir']):
+    print('ERROR: cannot find sa directory {0}'.format(arg_dict['sa_dir']))
+    sys.exit(1)
+
+try:
+    metrics = [metric for metric in load_metrics(arg_dict['metrics_file']) if metric.source == 'sar']
+except (IOError, ValueError) as e:
+    print('ERROR: cannot load metric registry: {0}'.format(e))
+    sys.exit(1)
+header2key = source_fields(metrics, 'sar')
+
+history = SaHistory(arg_dict['sa_dir'], arg_dict['cache_dir'], header2key)
+window = history.query(arg_dict['start'], arg_dict['end'])
+if not window.hours:
+    print('No sar data in {0} between {1} and {2}'.format(arg_dict['sa_dir'], arg_dict['start'], arg_dict['end']))
+    sys.exit(0)
+
+print('sar history of {0}: {1}:00 to {2}:59, {3} hours from {4} files'.format(
+    arg_dict['sa_dir'], window.first, window.last, len(window.hours), window.files))
+print('')
+
+########################
+# Window summary table #
+########################
+
+stats = [['metric', 'avg', 'sd', 'min', 'p95', 'p99', 'max', 'peak at', 'busiest hour', 'description']]
+for metric in metrics:
+    if metric.key:
+        continue
+    total = window.total.get((metric.field, None))
+    if total is None:
+        continue
+    busiest = window.busiest[(metric.field, None)][1]
+    stats.append([metric.name] + metric.stats(total.stats) + [fmt_time(total.peak_ts), busiest + ':00', metric.description])
+print(tabulate(stats, headers="firstrow"))
+print('')
+
+##########################
+# Network Adapter Tables #
+##########################
+
+key_labels = {'IFACE': 'adapter'}
+for key_name in sorted(set(metric.key for metric in metrics if metric.key)):
+    stats = [[key_labels.get(key_name, key_name), 'metric', 'avg', 'sd', 'min', 'p95', 'p99', 'max', 'peak at', 'busiest hour']]
+    for key_val in window.key_values(key_name, header2key):
+        for metric in metrics:
+            total = window.total.get((metric.field, key_val))
+            if metric.key != key_name or total is None:
+                continue
+            busiest = window.busiest[(metric.field, key_val)][1]
+            stats.append([key_val, metric.name] + metric.stats(total.stats) + [fmt_time(total.peak_ts), busiest + ':00'])
+        stats.append([''] * len(stats[0]))
+    print(tabulate(stats, headers="firstrow"))
+    print('')
+
+#######################
+# Hour-of-day profile #
+#######################
+
+by_name = dict((metric.name, metric) for metric in metrics if not metric.key)
+hour_metrics = [by_name[name] for name in arg_dict['hour_metrics'].split(',')
+                if name in by_name and (by_name[name].field, None) in window.hour_of_day]
+if hour_metrics:
+    print('Hour of day (avg / p95 over all days in the window):')
+    stats = [['hour'] + [label for metric in hour_metrics for label in (metric.name + ' avg', 'p95')]]
+    for hod in range(24):
+        row = ['{0:02d}:00'.format(hod)]
+        for metric in hour_metrics:
+            acc = window.hour_of_day[(metric.field, None)][hod]
+            if acc.count:
+                row.extend([round(acc.mean, metric.decimals), round(acc.quantile(0.95), metric.decimals)])
+            else:
+                row.extend(['', ''])
+        stats.append(row)
+    print(tabulate(stats, headers="firstrow"))
@@ -6,16 +6,44 @@ import subprocess
 import sys
 from time import time, sleep, localtime, strftime
 import getopt
+import heapq
 import re
 
 # modules from parent directory (export PYTHONPATH=<parent_dir>)
 #sys.path.append('..')
 from mod_stats import *
+from mod_pcap import (FLAG_LEGEND, Conversation, PacketSummary, PcapFile, Talker, analyze_live, analyze_parallel,
+                      capture_format, feed_capture, format_conversation, format_ip, format_talker, is_pcap,
+                      parse_tcpdump_stats, stats_file)
+from mod_summary import SummaryWriter
 from tabulate import tabulate
 
 def usage(exit_code=0):
     """Display help message if -h option used or invalid syntax."""
-    print(os.path.basename(__file__) + ' -r <input_file>')
+    print(os.path.basename(__file__) + ' -r <input_file> [-r <input_file> ...] [-t] [-j <jobs>] [-a <max_entries>]'
+          ' [-s <interval_sec>] [-l] [-J <json_file>]')
+    print(os.path.basename(__file__) + ' -i <interface> [-d <duration_sec>] [-w <pcap_file>] [-o <live_file>]'
+          ' [-S <snaplen>] [-f <filter>] [-c <packets>] [-b <bytes>] [-a <max_entries>] [-s <interval_sec>] [-l]')
+    print("")
+    print("  -r  pcap or pcapng file to analyze, optionally gzip/bzip2/xz/zstd compressed")
+    print("      (repeat for ring buffer files, which are reported together)")
+    print("  -i  live mode: capture on interface through a pipe and analyze as packets arrive")
+    print("  -d  live mode: stop after duration_sec (default: until tcpdump exits or Ctrl-C)")
+    print("  -w  live mode: also save the raw packets to pcap_file (default: keep only the aggregate)")
+    print("  -o  live mode: write the per-second summaries to live_file instead of stdout")
+    print("  -S  live mode: bytes to capture per packet (tcpdump -s)")
+    print("  -f  live mode: BPF filter expression")
+    print("  -c  live mode: stop after this many packets")
+    print("  -b  live mode: stop after this many bytes of capture")
+    print("  -t  decode with tcpdump -r -nn -tt text output instead of the native pcap decoder")
+    print("      (protocols are named as tcpdump prints them, see the Protocol Summary header)")
+    print("  -j  number of processes to decode a libpcap file with (default 1)")
+    print("  -a  approximate mode: track at most max_entries talkers and conversations")
+    print("      (heavy hitters with error bounds, native decoder only)")
+    print("  -s  also keep a sub-second throughput series, e.g. -s 0.1 for 100ms peaks")
+    print("  -l  TCP latency report: handshake RTT, retransmits and dup-ACKs per remote host")
+    print("      (with -a, at most max_entries open flows and handshakes are tracked)")
+    print("  -J  also write the report tables as a JSON lines summary (mod_summary)")
     print("")
     sys.exit(exit_code)
 
@@ -24,25 +52,101 @@ base_dir = os.path.dirname(os.path.abspath(__file__))
 datetime = strftime("%Y-%m-%d_%H%M%S", localtime())
 arg_dict = {}
 arg_dict['input_file'] = None
+arg_dict['input_files'] = []
+arg_dict['interface'] = None
+arg_dict['duration'] = None
+arg_dict['save_file'] = None
+arg_dict['live_file'] = None
+arg_dict['tcpdump_args'] = []
+arg_dict['filter'] = None
+arg_dict['byte_budget'] = None
+arg_dict['decoder'] = 'native'
+arg_dict['jobs'] = 1
+arg_dict['max_entries'] = None
+arg_dict['fine_interval'] = None
+arg_dict['latency'] = False
+arg_dict['json_file'] = None
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "hr:")
+    opts, args = getopt.getopt(sys.argv[1:], "ha:b:c:d:f:i:j:lo:r:s:tw:J:S:")
 except getopt.GetoptError:
     usage(1)
 for opt, arg in opts:
     if opt == '-h':
         usage()
     elif opt in ("-r"):
-        arg_dict['input_file'] = arg
+        arg_dict['input_files'].append(arg)
+        if not arg_dict['input_file']:
+            arg_dict['input_file'] = arg
+    elif opt in ("-t"):
+        arg_dict['decoder'] = 'tcpdump'
+    elif opt in ("-i"):
+        arg_dict['interface'] = arg
+    elif opt in ("-d"):
+        try:
+            arg_dict['duration'] = float(arg)
+        except ValueError:
+            print('ERROR: -d requires a duration in seconds')
+            usage(1)
+    elif opt in ("-w"):
+        arg_dict['save_file'] = arg
+    elif opt in ("-o"):
+        arg_dict['live_file'] = arg
+    elif opt in ("-S"):
+        arg_dict['tcpdump_args'].extend(['-s', arg])
+    elif opt in ("-c"):
+        arg_dict['tcpdump_args'].extend(['-c', arg])
+    elif opt in ("-f"):
+        arg_dict['filter'] = arg
+    elif opt in ("-b"):
+        try:
+            arg_dict['byte_budget'] = int(arg)
+        except ValueError:
+            print('ERROR: -b requires a number of bytes')
+            usage(1)
+    elif opt in ("-j"):
+        try:
+            arg_dict['jobs'] = int(arg)
+        except ValueError:
+            print('ERROR: -j requires a number of processes')
+            usage(1)
+    elif opt in ("-a"):
+        try:
+            arg_dict['max_entries'] = int(arg)
+        except ValueError:
+            print('ERROR: -a requires a maximum number of entries')
+            usage(1)
+    elif opt in ("-l"):
+        arg_dict['latency'] = True
+    elif opt in ("-J"):
+        arg_dict['json_file'] = arg
+    elif opt in ("-s"):
+        try:
+            arg_dict['fine_interval'] = float(arg)
+        except ValueError:
+            print('ERROR: -s requires an interval in seconds')
+            usage(1)
+
+if not arg_dict['input_file'] and not arg_dict['interface']:
+    print('ERROR: -r or -i is required')
+    usage(1)
 
-if not arg_dict['input_file']:
-    print('ERROR: -r is required')
+if arg_dict['input_file'] and arg_dict['interface']:
+    print('ERROR: -r and -i cannot be used together')
     usage(1)
 
-if not os.path.exists(arg_dict['input_file']):
-    print('ERROR: input file {0} does not exist'.format(arg_dict['input_file']))
+if arg_dict['interface'] and arg_dict['decoder'] != 'native':
+    print('ERROR: live mode (-i) uses the native decoder, -t is not supported')
     usage(1)
 
+for input_file in arg_dict['input_files']:
+    if not os.path.exists(input_file):
+        print('ERROR: input file {0} does not exist'.format(input_file))
+        usage(1)
+
+if arg_dict['filter']:
+    arg_dict['tcpdump_args'].append(arg_dict['filter'])
+
 def get_local_ips():
     host_ips = []
     re_interface = re.compile(r"^(\S.*?):")
@@ -51,9 +155,12 @@ def get_local_ips():
     re_inet6 = re.compile(r"inet6 (.*?)\s")
 
     # Check for ifconfig_a.out file in same directory as input file (more portable)
-    input_file_dir = os.path.dirname(os.path.abspath(arg_dict['input_file']))
-    ifconfig_path = os.path.join(input_file_dir, 'ifconfig_a.out')
-    if os.path.exists(ifconfig_path):
+    # A live capture is always on this host, so ask ifconfig
+    ifconfig_path = None
+    if arg_dict['input_file']:
+        input_file_dir = os.path.dirname(os.path.abspath(arg_dict['input_file']))
+        ifconfig_path = os.path.join(input_file_dir, 'ifconfig_a.out')
+    if ifconfig_path and os.path.exists(ifconfig_path):
         print('Using ifconfig -a output from file: {0}'.format(ifconfig_path))
         with open(ifconfig_path) as fh:
             ifconfig_stdout = fh.read()
@@ -93,209 +200,302 @@ def get_ip_port(ip_port):
     ip = '.'.join(ip_port_list[0:-1])
     return(ip, port)
 
+def analyze_tcpdump_text(input_file, host_ips):
+    """Parse tcpdump -r -nn -tt text output into a PacketSummary."""
+    summary = PacketSummary(host_ips)
+    # Can use these if using netstat to more accurately determine direction
+    # count_syn_recv = 0
+    # count_syn_sent = 0
+    # count_rst_recv = 0
+    # count_rst_sent = 0
+
+    cmd = ['tcpdump', '-r', input_file, '-nn', '-tt']
+
+    process = subprocess.Popen(cmd,stdout=subprocess.PIPE, universal_newlines=True)
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            break
+        summary.count_total += 1
+        packet = line.split()
+
+        # Grab packet timings (start, end is set to current for each packet)
+        if not summary.ts_start:
+            summary.ts_start = packet[0]
+        summary.ts_end = packet[0]
+
+        # parse based on protocol determined by field 5 (Flags=TCP, ICMP)
+        if packet[1] == 'IP':
+            if packet[5] == 'UDP,':
+                proto = 'UDP'
+            elif packet[5] == 'ICMP':
+                proto = 'ICMP'
+            else:
+                proto = 'TCP'
+        else:
+            # ARP, LLDP, ST, IP6, ICMP6
+            proto = packet[1][:-1]  # remove ending comma (might need to check it really is a comma)
 
-# get local IPs to determine ingress/egress
-host_ips = get_local_ips()
+        if proto not in summary.proto_count:
+            summary.proto_count[proto] = 0
 
-# stat variables
-conversations = {}  # conversations collect packet counts, keys = normalized ip1:port1;ip2:port2)
-talkers = {}  # talkers collect normalized ip combinations (no port), keys 
-protos = set()
-proto_count = {}
-ip_to_hostname_cache = {}
-datetime_start = False
-datetime_end = 0
-count_total = 0
-count_ingress = 0
-count_egress = 0
-count_internal = 0
-count_unknown = 0
-count_rst = 0
-count_fin = 0
-count_syn = 0
-count_syna = 0
-# Can use these if using netstat to more accurately determine direction
-# count_syn_recv = 0
-# count_syn_sent = 0
-# count_rst_recv = 0
-# count_rst_sent = 0
-
-cmd = ['tcpdump', '-r', arg_dict['input_file'], '-nn', '-tt']
-
-process = subprocess.Popen(cmd,stdout=subprocess.PIPE, universal_newlines=True)
-while True:
-    line = process.stdout.readline()
-    if not line:
-        break
-    count_total += 1
-    flag_syn_set = 0
-    flag_ack_set = 0
-    packet = line.split()
-
-    # Grab packet timings (start, end is set to current for each packet)
-    if not datetime_start:
-        datetime_start = packet[0]
-    datetime_end = packet[0]
-
-    # parse based on protocol determined by field 5 (Flags=TCP, ICMP)
-    if packet[1] == 'IP':
-        if packet[5] == 'UDP,':
-            proto = 'UDP'
-        elif packet[5] == 'ICMP':
-            proto = 'ICMP'
-        else:
-            proto = 'TCP'
-    else:
-        # ARP, LLDP, ST, IP6, ICMP6
-        proto = packet[1][:-1]  # remove ending comma (might need to check it really is a comma)
-
-    if proto not in protos:
-        protos.add(proto)
-        proto_count[proto] = 0
-
-    proto_count[proto] += 1
-
-    if packet[1] != 'IP':
-        # too many other protocols to decode this way so just skip
-        continue
-
-    packet[4] = packet[4][:-1] #remove ending ":" from dest IP
-    ip_src, port_src = get_ip_port(packet[2])
-    ip_dest, port_dest = get_ip_port(packet[4])
-
-    # Figure out direction and normalize conversations for counting
-    # It would be better to have a netstat -an report with listening ports to use here
-    direction = "unknown"
-    if ip_src in host_ips and ip_dest in host_ips:
-        direction = "internal"
-        count_internal += 1
-        if ip_src > ip_dest:
+        summary.proto_count[proto] += 1
+
+        if packet[1] != 'IP':
+            # too many other protocols to decode this way so just skip
+            continue
+
+        packet[4] = packet[4][:-1] #remove ending ":" from dest IP
+        ip_src, port_src = get_ip_port(packet[2])
+        ip_dest, port_dest = get_ip_port(packet[4])
+
+        # Figure out direction and normalize conversations for counting
+        # It would be better to have a netstat -an report with listening ports to use here
+        if ip_src in host_ips and ip_dest in host_ips:
+            summary.count_internal += 1
+            if ip_src > ip_dest:
+                conversation = '{0}:{1};{2}:{3}'.format(ip_src, port_src, ip_dest, port_dest)
+                talker = '{0};{1}'.format(ip_src, ip_dest)
+            else:
+                conversation = '{0}:{1};{2}:{3}'.format(ip_dest, port_dest, ip_src, port_src)
+                talker = '{0};{1}'.format(ip_dest, ip_src)
+        elif ip_src in host_ips:
+            summary.count_egress += 1
             conversation = '{0}:{1};{2}:{3}'.format(ip_src, port_src, ip_dest, port_dest)
             talker = '{0};{1}'.format(ip_src, ip_dest)
-        else:
+        elif ip_dest in host_ips:
+            summary.count_ingress += 1
             conversation = '{0}:{1};{2}:{3}'.format(ip_dest, port_dest, ip_src, port_src)
             talker = '{0};{1}'.format(ip_dest, ip_src)
-    elif ip_src in host_ips:
-        direction = "egress"
-        count_egress += 1
-        conversation = '{0}:{1};{2}:{3}'.format(ip_src, port_src, ip_dest, port_dest)
-        talker = '{0};{1}'.format(ip_src, ip_dest)
-    elif ip_dest in host_ips:
-        direction = "ingress"
-        count_ingress += 1
-        conversation = '{0}:{1};{2}:{3}'.format(ip_dest, port_dest, ip_src, port_src)
-        talker = '{0};{1}'.format(ip_dest, ip_src)
+        else:
+            summary.count_unknown += 1
+            if ip_src > ip_dest:
+                conversation = '{0}:{1};{2}:{3}'.format(ip_src, port_src, ip_dest, port_dest)
+                talker = '{0};{1}'.format(ip_src, ip_dest)
+            else:
+                conversation = '{0}:{1};{2}:{3}'.format(ip_dest, port_dest, ip_src, port_src)
+                talker = '{0};{1}'.format(ip_dest, ip_src)
+
+        conversations = summary.conversations
+        talkers = summary.talkers
+        if conversation not in conversations:
+            conversations[conversation] = Conversation()
+
+        if talker not in talkers:
+            talkers[talker] = Talker()
+
+        talkers[talker].count += 1
+        conversations[conversation].count += 1
+
+        # Some IP packets like syslog still make it this far
+        if packet[5] != 'Flags':
+            continue
+
+        if proto == 'TCP':
+            # field 6 has TCP flags in square brackets; the columns count the
+            # same exact flag combinations as the native decoder (FLAG_LEGEND)
+            flags = packet[6][:-1]  # remove ending comma (might need to check it really is a comma)
+            if flags == '[.]':
+                talkers[talker].ack += 1
+            elif flags == '[none]':
+                talkers[talker].none += 1
+            elif flags == '[P.]':
+                talkers[talker].push += 1
+            elif flags == '[S]':
+                talkers[talker].syn += 1
+                summary.count_syn += 1
+            elif flags == '[S.]':
+                talkers[talker].syna += 1
+                summary.count_syna += 1
+            elif flags == '[R]':
+                talkers[talker].rst += 1
+                summary.count_rst += 1
+            elif flags == '[F.]':
+                talkers[talker].fin += 1
+                summary.count_fin += 1
+    return summary
+
+def analyze_pcap(input_file, host_ips, max_entries=None, fine_interval=None, latency=False):
+    """
+    Decode a capture directly (no tcpdump subprocess) into a PacketSummary.
+    Plain libpcap files are memory-mapped; pcapng and compressed captures
+    are decoded as a stream.
+    """
+    summary = PacketSummary(host_ips, max_entries, fine_interval, latency)
+    if is_pcap(input_file):
+        pcap = PcapFile(input_file)
+        pcap.feed(summary)
+        pcap.close()
     else:
-        direction = "unknown"
-        count_unknown += 1
-        if ip_src > ip_dest:
-            conversation = '{0}:{1};{2}:{3}'.format(ip_src, port_src, ip_dest, port_dest)
-            talker = '{0};{1}'.format(ip_src, ip_dest)
+        feed_capture(summary, input_file)
+    return summary
+
+
+# get local IPs to determine ingress/egress
+host_ips = get_local_ips()
+
+# Use the native decoder unless told otherwise or a file is neither
+# libpcap nor pcapng (other formats tcpdump understands go through tcpdump -r)
+for input_file in arg_dict['input_files']:
+    if arg_dict['decoder'] == 'native' and not capture_format(input_file):
+        print('{0} is not a pcap or pcapng file, decoding with tcpdump -r'.format(input_file))
+        arg_dict['decoder'] = 'tcpdump'
+
+# Only plain libpcap files can be split into byte ranges
+if arg_dict['interface']:
+    arg_dict['jobs'] = 1
+elif arg_dict['jobs'] > 1 and len(arg_dict['input_files']) == 1 and not is_pcap(arg_dict['input_file']):
+    print('{0} is compressed or pcapng, decoding with 1 job'.format(arg_dict['input_file']))
+    arg_dict['jobs'] = 1
+
+if arg_dict['max_entries'] and arg_dict['decoder'] != 'native':
+    print('approximate mode (-a) needs the native decoder, counting every flow')
+    arg_dict['max_entries'] = None
+
+if arg_dict['latency'] and arg_dict['decoder'] != 'native':
+    print('TCP latency report (-l) needs the native decoder, skipping it')
+    arg_dict['latency'] = False
+
+time_start = time()
+if arg_dict['interface']:
+    # Live mode decodes tcpdump -w - output as it arrives, nothing is written
+    # to disk unless -w asks for the raw packets too
+    if arg_dict['live_file']:
+        live_out = open(arg_dict['live_file'], 'w')
+    else:
+        live_out = sys.stdout
+    print('Live capture on {0}, per-second summary:'.format(arg_dict['interface']))
+    try:
+        summary = analyze_live(arg_dict['interface'], host_ips, live_out, arg_dict['save_file'], arg_dict['duration'],
+                               arg_dict['max_entries'], arg_dict['fine_interval'], arg_dict['latency'],
+                               arg_dict['tcpdump_args'], arg_dict['byte_budget'])
+    except ValueError as e:
+        # an empty summary would read as an idle link
+        print('ERROR: {0}'.format(e))
+        sys.exit(1)
+    finally:
+        if arg_dict['live_file']:
+            live_out.close()
+    print('')
+else:
+    # Ring buffer files are decoded one at a time and merged into one summary
+    # (TCP handshakes spanning two files are not timed)
+    summary = None
+    for input_file in arg_dict['input_files']:
+        if arg_dict['decoder'] == 'native' and arg_dict['jobs'] > 1 and is_pcap(input_file):
+            file_summary = analyze_parallel(input_file, host_ips, arg_dict['jobs'], arg_dict['max_entries'],
+                                            arg_dict['fine_interval'], arg_dict['latency'])
+        elif arg_dict['decoder'] == 'native':
+            file_summary = analyze_pcap(input_file, host_ips, arg_dict['max_entries'], arg_dict['fine_interval'],
+                                        arg_dict['latency'])
         else:
-            conversation = '{0}:{1};{2}:{3}'.format(ip_dest, port_dest, ip_src, port_src)
-            talker = '{0};{1}'.format(ip_dest, ip_src)
+            file_summary = analyze_tcpdump_text(input_file, host_ips)
+        if summary is None:
+            summary = file_summary
+        else:
+            summary.merge(file_summary)
+    # tcpdump-collect.py saves tcpdump's packet counts next to the capture
+    if os.path.exists(stats_file(arg_dict['input_file'])):
+        with open(stats_file(arg_dict['input_file'])) as fh:
+            summary.capture_stats = parse_tcpdump_stats(fh.read())
+analysis_sec = time() - time_start
 
-    if conversation not in conversations:
-        conversations[conversation] = {
-            'count': 0
-        }
-
-    if talker not in talkers:
-        talkers[talker] = {
-            'count': 0,
-            'syn': 0,
-            'syna': 0,
-            'fin': 0,
-            'rst': 0,
-            'ack': 0,
-            'none': 0,
-            'push': 0
-        }
-
-    talkers[talker]['count'] += 1
-    conversations[conversation]['count'] += 1
-
-    # print(packet)
-
-    # Some IP packets like syslog still make it this far
-    if packet[5] != 'Flags':
-        # print(packet)
-        continue
-
-    # # Last resort for valid TCP
-    # if len(packet) < 6:
-    #     print(packet)
-    #     continue
-
-    if proto == 'TCP':
-        # field 6 has TCP flags in square brackets
-        flags = packet[6][:-1]  # remove ending comma (might need to check it really is a comma)
-        if flags == '[.]':
-            if packet[7] == 'ack' or packet[9] == 'ack':
-                talkers[talker]['ack'] += 1
-            else:
-                talkers[talker]['none'] += 1
-        elif flags == '[P.]':
-            talkers[talker]['push'] += 1
-        elif flags == '[S]':
-            talkers[talker]['syn'] += 1
-            count_syn += 1
-        elif flags == '[S.]':
-            talkers[talker]['syna'] += 1
-            count_syna += 1
-        elif flags == '[R]':
-            talkers[talker]['rst'] += 1
-            count_rst += 1
-        elif flags == '[F.]':
-            talkers[talker]['fin'] += 1
-            count_fin += 1
-        # else:
-        #     print(packet)
+talkers = summary.talkers
+conversations = summary.conversations
+proto_count = summary.proto_count
 
 # Calculate duration to be used w/ packet rates
-duration_sec = float(datetime_end) - float(datetime_start)
+duration_sec = summary.duration()
 
 # Function to sort talker and converstion counts
 def keyfunc(tup): 
     _key, d = tup
-    return d['count']
+    return d.count
+
+# In approximate mode counts are upper bounds: the true count is within
+# count - err, and any talker/conversation not listed has a count <= the
+# printed limit.  A key that takes over an evicted entry inherits its count but
+# not its bytes or flags, which only cover packets since the key was tracked
+approx = summary.max_entries is not None
+
+# Frame lengths are only known when the native decoder reads the pcap records
+show_bytes = arg_dict['decoder'] == 'native'
+# ...but per talker/conversation they would undercount next to an upper bound
+# count in approximate mode, so only the totals show bytes there
+flow_bytes = show_bytes and not approx
+
+# JSON lines copy of the tables (-J), written row by row along with the report
+summary_out = None
+if arg_dict['json_file']:
+    summary_out = SummaryWriter(arg_dict['json_file'], source='tcpdump-analyze.py', decoder=arg_dict['decoder'],
+                                approximate=approx, duration=duration_sec)
+
+# Kernel drops mean the counts below are short of what was on the wire
+capture_stats = summary.capture_stats
+if capture_stats:
+    print('Capture completeness (tcpdump):')
+    received = capture_stats.get('received by filter', 0)
+    if summary_out is not None:
+        summary_out.write('tcpdump_capture', **dict((name.replace(' ', '_'), count)
+                                                    for (name, count) in capture_stats.items()))
+    for name in ['captured', 'received by filter', 'dropped by kernel', 'dropped by interface']:
+        if name not in capture_stats:
+            continue
+        count = capture_stats[name]
+        if name.startswith('dropped') and count > 0:
+            print('{0:<22} {1} ({2}% of received)'.format(name, fmtRed(count), divide(count * 100.0, received, 2)))
+        else:
+            print('{0:<22} {1}'.format(name, count))
+    print('')
 
 talker_max_report = 25
 print('Talker Summary (top {0}):'.format(talker_max_report))
-count = 0
+if approx:
+    print('approximate: {0} of max {1} entries tracked, untracked talkers <= {2} packets'.format(
+        len(talkers), summary.max_entries, talkers.min_count()))
+    print('approximate: count - err <= true count <= count; flags and bytes only start when a key is tracked,')
+    print('             so bytes are left out here and in the conversations (exact in the totals)')
 stats = []
 row = ['talker', 'count', 'syn', 'syna', 'fin', 'rst', 'ack', 'push', 'none']
+if flow_bytes:
+    row.insert(2, 'bytes')
+if approx:
+    row.insert(2, 'err')
 stats.append(row)
-for talker, _subd in sorted(talkers.items(), key=keyfunc, reverse=True):
-    # if talkers[talker]['count'] < 500:
-    #     continue
-    talker_print = talker.replace(';', ' ')
-    row = [talker_print, talkers[talker]['count'], talkers[talker]['syn'], talkers[talker]['syna'],
-        talkers[talker]['fin'], talkers[talker]['rst'], talkers[talker]['ack'],
-        talkers[talker]['push'], talkers[talker]['none']]
+for talker, rec in heapq.nlargest(talker_max_report, talkers.items(), key=keyfunc):
+    row = [format_talker(talker), rec.count, rec.syn, rec.syna, rec.fin, rec.rst, rec.ack, rec.push, rec.none]
+    if flow_bytes:
+        row.insert(2, rec.bytes)
+    if approx:
+        row.insert(2, talkers.error(talker))
     stats.append(row)
-
-    count += 1
-    if count >= talker_max_report:
-        break
+    if summary_out is not None:
+        summary_out.write('talker', **dict(zip(stats[0], row)))
 print(tabulate(stats, headers="firstrow"))
+print(FLAG_LEGEND)
 print('')
 
 conv_max_report = 25
 print('Conversation Summary (top {0}):'.format(conv_max_report))
-count = 0
+if approx:
+    print('approximate: {0} of max {1} entries tracked, untracked conversations <= {2} packets'.format(
+        len(conversations), summary.max_entries, conversations.min_count()))
 stats = []
 row = ['conversation', 'count', 'pps']
+if flow_bytes:
+    row.extend(['bytes', 'kB/s'])
+if approx:
+    row.insert(2, 'err')
 stats.append(row)
-for conversation, _subd in sorted(conversations.items(), key=keyfunc, reverse=True):
-    # if conversations[conversation]['count'] < 500:
-    #     continue
-    conv_print = conversation.replace(';', ' ')
-    row = [conv_print, conversations[conversation]['count'], divide(conversations[conversation]['count'], duration_sec, 0)]
+for conversation, rec in heapq.nlargest(conv_max_report, conversations.items(), key=keyfunc):
+    row = [format_conversation(conversation), rec.count, divide(rec.count, duration_sec, 0)]
+    if flow_bytes:
+        row.extend([rec.bytes, divide(rec.bytes / 1024.0, duration_sec, 1)])
+    if approx:
+        row.insert(2, conversations.error(conversation))
     stats.append(row)
-    count += 1
-    if count >= conv_max_report:
-        break
+    if summary_out is not None:
+        summary_out.write('conversation', **dict(zip(stats[0], row)))
 print(tabulate(stats, headers="firstrow"))
 print('')
 
@@ -304,34 +504,130 @@ print('Total packet counts:')
 print('duration (sec): {0:.2f}'.format(duration_sec))
 stats = []
 row = ['', 'Total', 'pps']
+if show_bytes:
+    row.extend(['bytes', 'kB/s'])
 stats.append(row)
-row = ['total', count_total, divide(count_total, duration_sec, 0)]
-stats.append(row)
-row = ['ingress', count_ingress, divide(count_ingress, duration_sec, 0)]
-stats.append(row)
-row = ['egress', count_egress, divide(count_egress, duration_sec, 0)]
-stats.append(row)
-row = ['internal', count_internal, divide(count_internal, duration_sec, 0)]
-stats.append(row)
-row = ['unknown', count_unknown, divide(count_unknown, duration_sec, 0)]
-stats.append(row)
-row = ['SYN', count_syn, divide(count_syn, duration_sec, 1)]
+for (direction, count, nbytes) in [('total', summary.count_total, summary.bytes_total),
+                                   ('ingress', summary.count_ingress, summary.bytes_ingress),
+                                   ('egress', summary.count_egress, summary.bytes_egress),
+                                   ('internal', summary.count_internal, summary.bytes_internal),
+                                   ('unknown', summary.count_unknown, summary.bytes_unknown)]:
+    row = [direction, count, divide(count, duration_sec, 0)]
+    if show_bytes:
+        row.extend([nbytes, divide(nbytes / 1024.0, duration_sec, 1)])
+    stats.append(row)
+    if summary_out is not None:
+        summary_out.write('tcpdump_total', **dict(zip(['direction', 'count', 'pps', 'bytes', 'kB/s'], row)))
+row = ['SYN', summary.count_syn, divide(summary.count_syn, duration_sec, 1)]
 stats.append(row)
-row = ['SYN-ACK', count_syna, divide(count_syna, duration_sec, 1)]
+row = ['SYN-ACK', summary.count_syna, divide(summary.count_syna, duration_sec, 1)]
 stats.append(row)
-row = ['FIN', count_fin, divide(count_fin, duration_sec, 1)]
+row = ['FIN', summary.count_fin, divide(summary.count_fin, duration_sec, 1)]
 stats.append(row)
-count_rst_print = count_rst
+count_rst_print = summary.count_rst
 if count_rst_print > 0:
-    count_rst_print = fmtRed(count_rst)
-row = ['RST', count_rst_print, divide(count_rst, duration_sec, 1)]
+    count_rst_print = fmtRed(summary.count_rst)
+row = ['RST', count_rst_print, divide(summary.count_rst, duration_sec, 1)]
 stats.append(row)
+if summary_out is not None:
+    summary_out.write('tcpdump_flags', syn=summary.count_syn, syna=summary.count_syna, fin=summary.count_fin,
+                      rst=summary.count_rst, verdict='high' if summary.count_rst > 0 else 'ok')
+# flag rows have no byte columns
+for row in stats:
+    row.extend([''] * (len(stats[0]) - len(row)))
 print(tabulate(stats, headers="firstrow"))
 print('')
 
+# Averages hide bursts, so show the busiest second (and sub-second interval)
+if show_bytes and len(summary.series) > 0:
+    print('Throughput (average vs peak):')
+    stats = []
+    row = ['', 'avg', 'peak 1s']
+    # a capture shorter than the interval fills only part of it, which would
+    # put the peak rate below the average, so its peak is n/a
+    peak_pps = summary.series.peak('packets')
+    peak_bytes = summary.series.peak('bytes')
+    short = duration_sec < summary.series.interval
+    row_pps = ['pps', divide(summary.count_total, duration_sec, 0), 'n/a' if short else round(peak_pps[1])]
+    row_mbit = ['Mbit/s', divide(summary.bytes_total * 8 / 1e6, duration_sec, 2),
+                'n/a' if short else round(peak_bytes[2] * 8 / 1e6, 2)]
+    fine_series = summary.fine_series
+    if fine_series is not None and len(fine_series) > 0:
+        short_fine = duration_sec < fine_series.interval
+        row.append('peak {0:g}ms'.format(fine_series.interval * 1000))
+        row_pps.append('n/a' if short_fine else round(fine_series.peak('packets')[1]))
+        row_mbit.append('n/a' if short_fine else round(fine_series.peak('bytes')[2] * 8 / 1e6, 2))
+    stats.append(row)
+    stats.append(row_pps)
+    stats.append(row_mbit)
+    if summary_out is not None:
+        summary_out.write('tcpdump_throughput', **dict((name + ' ' + unit, None if value == 'n/a' else value)
+                                                       for (unit, values) in
+                                                       [(row_pps[0], row_pps), (row_mbit[0], row_mbit)]
+                                                       for (name, value) in zip(row[1:], values[1:])))
+    print(tabulate(stats, headers="firstrow"))
+    if not short:
+        print('busiest second (bytes) starts at {0:.0f}'.format(peak_bytes[0]))
+    print('')
+
+# Handshake RTT tells network latency apart from application latency;
+# retransmits and dup-ACK runs (fast retransmit triggers) point at loss
+if summary.tcp is not None:
+    latency_max_report = 25
+    hosts = summary.tcp.hosts
+    print('TCP Latency Summary per remote host (top {0}):'.format(latency_max_report))
+    stats = []
+    row = ['remote', 'handshakes', 'rtt p50 ms', 'rtt p90 ms', 'rtt p99 ms', 'rtt max ms',
+           'syn rexmit', 'data segs', 'rexmit', 'rexmit %', 'dupack', 'dupack runs']
+    stats.append(row)
+    def latency_key(addr):
+        return (len(hosts[addr].rtts), hosts[addr].data_segs)
+    for addr in heapq.nlargest(latency_max_report, hosts, key=latency_key):
+        rec = hosts[addr]
+        rtts_ms = [rtt * 1000 for rtt in rec.rtts]
+        rexmit_pct = divide(rec.retrans * 100.0, rec.data_segs, 2) if rec.data_segs else 0
+        if rexmit_pct > 1:
+            rexmit_pct = fmtRed(rexmit_pct)
+        row = [format_ip(addr), len(rtts_ms)]
+        if rtts_ms:
+            row.extend([round(percentile(rtts_ms, 50), 3), round(percentile(rtts_ms, 90), 3),
+                        round(percentile(rtts_ms, 99), 3), round(max(rtts_ms), 3)])
+        else:
+            row.extend(['', '', '', ''])
+        row.extend([rec.syn_retrans, rec.data_segs, rec.retrans, rexmit_pct, rec.dupacks, rec.dupack_runs])
+        stats.append(row)
+        if summary_out is not None:
+            record = dict(zip(stats[0], row))
+            record['rexmit %'] = divide(rec.retrans * 100.0, rec.data_segs, 2) if rec.data_segs else 0
+            record['verdict'] = 'high' if record['rexmit %'] > 1 else 'ok'
+            summary_out.write('tcp_latency', **record)
+    print(tabulate(stats, headers="firstrow"))
+    print('')
+
 # sys.exit(0)
 print('Protocol Summary:')
+# the decoders name protocols differently, so -t and native counts of one
+# capture do not line up row for row
+if arg_dict['decoder'] == 'native':
+    print('(IPv4 and IPv6 counted by transport: TCP, UDP, ICMP, ICMP6, GRE, ...; non-IP by ethertype)')
+else:
+    print('(tcpdump -nn names: IPv4 as TCP, UDP or ICMP, any other IPv4 as TCP; IPv6 as IP6; non-IP as printed)')
 print('{0:<10} {1}'.format('Protocol', 'Count'))
 for proto in proto_count:
     print('{0:<10} {1}'.format(proto, proto_count[proto]))
 print('')
+if summary_out is not None:
+    summary_out.write('protocols', **proto_count)
+    summary_out.close()
+
+# Decoder throughput, to compare the native decoder against tcpdump -r
+# (in live mode this is the capture time)
+if arg_dict['interface']:
+    print('Analysis throughput ({0} decoder, live):'.format(arg_dict['decoder']))
+elif arg_dict['decoder'] == 'native' and arg_dict['jobs'] > 1:
+    print('Analysis throughput ({0} decoder, {1} jobs):'.format(arg_dict['decoder'], arg_dict['jobs']))
+else:
+    print('Analysis throughput ({0} decoder):'.format(arg_dict['decoder']))
+print('{0:<10} {1:.3f}'.format('seconds', analysis_sec))
+print('{0:<10} {1:.0f}'.format('packets/s', divide(summary.count_total, analysis_sec, 0)))
+print('')
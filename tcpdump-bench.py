@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import getopt
+import json
+import platform
+import shlex
+import struct
+import subprocess
+from time import time, localtime, strftime
+
+from mod_pcap import HEADER_SNAPLEN
+from tabulate import tabulate
+
+def usage(exit_code=0):
+    """Display help message if -h option used or invalid syntax."""
+    print(os.path.basename(__file__) + ' [-p <packets>] [-f <flows>] [-m <mix>] [-a <analyzer_args>] [-n <runs>]'
+          ' [-d <pcap_dir>] [-o <results_file>] [-c <previous_results>] [-S <snaplen>] [-R <pps>] [-s <seed>] [-g]')
+    print("")
+    print("  -p  comma separated packet counts, k/M suffixes allowed (default 10k,100k,1M; up to 50M)")
+    print("  -f  comma separated flow cardinalities (default 100,10k)")
+    print("  -m  protocol mix, repeat for several: {0}".format(', '.join(sorted(MIXES))))
+    print("      or weights like tcp=70,udp=20,icmp=5,tcp6=5 (tcp, udp, icmp, tcp6, udp6)")
+    print("  -a  extra tcpdump-analyze.py options, e.g. -a \"-j 4 -l\"")
+    print("  -n  runs per case, the fastest is reported (default 1)")
+    print("  -d  directory for the generated pcaps, reused across runs (default ./bench_pcaps)")
+    print("  -o  JSON results file (default ./bench_<datetime>.json)")
+    print("  -c  compare packets/s with a previous results file")
+    print("  -S  bytes captured per packet in the generated pcaps (default {0}, header-only)".format(HEADER_SNAPLEN))
+    print("  -R  packet rate of the generated traffic in packets/s (default 100k)")
+    print("  -s  generator seed (default 1)")
+    print("  -g  only generate the pcaps")
+    print("")
+    sys.exit(exit_code)
+
+# named protocol mixes (weights per flow)
+MIXES = {
+    'tcp': 'tcp=100',
+    'udp': 'udp=100',
+    'mixed': 'tcp=70,udp=20,icmp=5,tcp6=5',
+    'ipv6': 'tcp6=80,udp6=20',
+}
+PROTOCOLS = ['tcp', 'udp', 'icmp', 'tcp6', 'udp6']
+
+# address of the host the synthetic traffic is captured on (written to ifconfig_a.out)
+LOCAL_IP = b'\x0a\x00\x00\x01'
+LOCAL_IP6 = b'\xfd\x00' + b'\x00' * 13 + b'\x01'
+IFCONFIG = """eth0: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 1500
+        inet 10.0.0.1  netmask 255.0.0.0  broadcast 10.255.255.255
+        inet6 fd00::1  prefixlen 64  scopeid 0x0<global>
+"""
+SERVER_PORTS = [443, 80, 5432, 6379, 8080, 9092]
+TS_BASE = 1700000000
+
+# flows are generated this many at a time, so handshakes interleave like real traffic
+CONCURRENT_FLOWS = 64
+
+MASK64 = 0xffffffffffffffff
+
+ether_ip4 = b'\x00\x11\x22\x33\x44\x55\x00\x66\x77\x88\x99\xaa\x08\x00'
+ether_ip6 = b'\x00\x11\x22\x33\x44\x55\x00\x66\x77\x88\x99\xaa\x86\xdd'
+ip4_header = struct.Struct('!BBHHHBBH4s4s')
+ip6_header = struct.Struct('!IHBB16s16s')
+tcp_header = struct.Struct('!HHIIBBHHH')
+udp_header = struct.Struct('!HHHH')
+icmp_header = struct.Struct('!BBHHH')
+record_header = struct.Struct('<IIII')
+
+# default arguments
+base_dir = os.path.dirname(os.path.abspath(__file__))
+datetime = strftime("%Y-%m-%d_%H%M%S", localtime())
+arg_dict = {}
+arg_dict['packets'] = '10k,100k,1M'
+arg_dict['flows'] = '100,10k'
+arg_dict['mixes'] = []
+arg_dict['analyzer_args'] = ''
+arg_dict['runs'] = 1
+arg_dict['pcap_dir'] = './bench_pcaps'
+arg_dict['results_file'] = './bench_{0}.json'.format(datetime)
+arg_dict['compare_file'] = None
+arg_dict['snaplen'] = HEADER_SNAPLEN
+arg_dict['rate'] = '100k'
+arg_dict['seed'] = 1
+arg_dict['generate_only'] = False
+
+def parse_count(text):
+    """'10k' -> 10000, '50M' -> 50000000."""
+    text = text.strip()
+    scale = 1
+    if text[-1:] in ('k', 'K'):
+        scale = 1000
+        text = text[:-1]
+    elif text[-1:] in ('m', 'M'):
+        scale = 1000000
+        text = text[:-1]
+    return int(float(text) * scale)
+
+def parse_mix(mix):
+    """Protocol weights from a mix name or 'tcp=70,udp=30' -> [('tcp', 70), ('udp', 30)]."""
+    weights = []
+    for item in MIXES.get(mix, mix).split(','):
+        (proto, weight) = item.split('=')
+        if proto not in PROTOCOLS:
+            raise ValueError('unknown protocol {0} in mix {1}'.format(proto, mix))
+        weights.append((proto, int(weight)))
+    return weights
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "a:c:d:f:ghm:n:o:p:s:R:S:")
+except getopt.GetoptError:
+    usage(1)
+try:
+    for opt, arg in opts:
+        if opt == '-h':
+            usage()
+        elif opt in ("-p"):
+            arg_dict['packets'] = arg
+        elif opt in ("-f"):
+            arg_dict['flows'] = arg
+        elif opt in ("-m"):
+            arg_dict['mixes'].append(arg)
+        elif opt in ("-a"):
+            arg_dict['analyzer_args'] = arg
+        elif opt in ("-n"):
+            arg_dict['runs'] = int(arg)
+        elif opt in ("-d"):
+            arg_dict['pcap_dir'] = arg
+        elif opt in ("-o"):
+            arg_dict['results_file'] = arg
+        elif opt in ("-c"):
+            arg_dict['compare_file'] = arg
+        elif opt in ("-S"):
+            arg_dict['snaplen'] = int(arg)
+        elif opt in ("-R"):
+            arg_dict['rate'] = arg
+        elif opt in ("-s"):
+            arg_dict['seed'] = int(arg)
+        elif opt in ("-g"):
+            arg_dict['generate_only'] = True
+    packet_counts = [parse_count(count) for count in arg_dict['packets'].split(',')]
+    flow_counts = [parse_count(count) for count in arg_dict['flows'].split(',')]
+    rate = parse_count(arg_dict['rate'])
+    mixes = arg_dict['mixes'] or ['mixed']
+    for mix in mixes:
+        parse_mix(mix)
+except ValueError as e:
+    print('ERROR: {0}'.format(e))
+    usage(1)
+
+def mix64(x):
+    """splitmix64 finalizer: a fast, portable hash so flows are the same on every run."""
+    x = (x + 0x9e3779b97f4a7c15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & MASK64
+    return x ^ (x >> 31)
+
+def make_flow(seed, index, weights, total_weight):
+    """(proto, client, server, client_port, server_port, isn, payload) for flow number index."""
+    h = mix64(seed * 0x100000000 + index)
+    pick = h % total_weight
+    for (proto, weight) in weights:
+        if pick < weight:
+            break
+        pick -= weight
+    h2 = mix64(h)
+    if proto in ('tcp6', 'udp6'):
+        remote = b'\xfd\x00' + struct.pack('!Q', h2)[:6] + b'\x00' * 4 + struct.pack('!I', index)
+        local = LOCAL_IP6
+    else:
+        remote = struct.pack('!I', 0xac100000 | (h2 & 0x000fffff))
+        local = LOCAL_IP
+    # about half the flows are opened by this host
+    if h & 0x100000000:
+        (client, server) = (local, remote)
+    else:
+        (client, server) = (remote, local)
+    client_port = 32768 + (h2 >> 20) % 28000
+    server_port = 53 if proto in ('udp', 'udp6') and h2 & 0x10000000000 else SERVER_PORTS[(h >> 40) % len(SERVER_PORTS)]
+    payload = 64 + (h2 >> 32) % 1384
+    return (proto, client, server, client_port, server_port, h2 & 0xffffffff, payload)
+
+def make_frame(flow, k, last):
+    """Frame for packet number k of a flow -> (frame bytes before any snaplen cut, wire length)."""
+    (proto, client, server, client_port, server_port, isn, payload) = flow
+    if proto in ('tcp', 'tcp6'):
+        # SYN, SYN-ACK, ACK, then data from the client acked by the server, FIN to close
+        isn_server = (isn * 7) & 0xffffffff
+        if k == 0:
+            (src, dst, sport, dport, seq, ack, flags, size) = (client, server, client_port, server_port, isn, 0, 0x02, 0)
+        elif k == 1:
+            (src, dst, sport, dport, seq, ack, flags, size) = (server, client, server_port, client_port, isn_server,
+                                                                isn + 1, 0x12, 0)
+        else:
+            # client data segments go out at k = 4, 6, 8, ...
+            client_seq = (isn + 1 + max(0, (k - 3) // 2) * payload) & 0xffffffff
+            if last:
+                (src, dst, sport, dport, seq, ack, flags, size) = (client, server, client_port, server_port,
+                                                                    client_seq, isn_server + 1, 0x11, 0)
+            elif k % 2 == 0:
+                (src, dst, sport, dport, seq, ack, flags, size) = (client, server, client_port, server_port,
+                                                                    client_seq, isn_server + 1,
+                                                                    0x10 if k == 2 else 0x18, 0 if k == 2 else payload)
+            else:
+                (src, dst, sport, dport, seq, ack, flags, size) = (server, client, server_port, client_port,
+                                                                    isn_server + 1, client_seq, 0x10, 0)
+        l4 = tcp_header.pack(sport, dport, seq & 0xffffffff, ack & 0xffffffff, 0x50, flags, 65535, 0, 0)
+    elif proto in ('udp', 'udp6'):
+        if k % 2 == 0:
+            (src, dst, sport, dport) = (client, server, client_port, server_port)
+        else:
+            (src, dst, sport, dport) = (server, client, server_port, client_port)
+        size = payload // 4
+        l4 = udp_header.pack(sport, dport, 8 + size, 0)
+    else:
+        # echo request / reply
+        if k % 2 == 0:
+            (src, dst, icmp_type) = (client, server, 8)
+        else:
+            (src, dst, icmp_type) = (server, client, 0)
+        size = 56
+        l4 = icmp_header.pack(icmp_type, 0, 0, client_port, k // 2)
+    l4_len = len(l4) + size
+    if len(src) == 16:
+        next_header = 6 if proto == 'tcp6' else 17
+        header = ether_ip6 + ip6_header.pack(0x60000000, l4_len, next_header, 64, src, dst) + l4
+    else:
+        ip_proto = 6 if proto == 'tcp' else (17 if proto == 'udp' else 1)
+        header = ether_ip4 + ip4_header.pack(0x45, 0, 20 + l4_len, k & 0xffff, 0, 64, ip_proto, 0, src, dst) + l4
+    return (header, len(header) + size)
+
+def generate_pcap(path, packets, flows, mix, seed, rate, snaplen):
+    """
+    Write a deterministic synthetic libpcap file: packets spread over flows
+    (CONCURRENT_FLOWS open at a time, each with the same number of packets)
+    using the protocol mix, at rate packets/s, cut to snaplen bytes.
+    """
+    weights = parse_mix(mix)
+    total_weight = sum(weight for (_proto, weight) in weights)
+    flows = max(1, min(flows, packets))
+    per_flow = -(-packets // flows)
+    pad = b'\x00' * snaplen
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, snaplen, 1))
+        count = 0
+        parts = []
+        for group_start in range(0, flows, CONCURRENT_FLOWS):
+            group = [make_flow(seed, index, weights, total_weight)
+                     for index in range(group_start, min(group_start + CONCURRENT_FLOWS, flows))]
+            for k in range(per_flow):
+                last = k == per_flow - 1 and per_flow >= 4
+                for flow in group:
+                    if count == packets:
+                        break
+                    (header, wirelen) = make_frame(flow, k, last)
+                    caplen = min(wirelen, snaplen)
+                    if caplen > len(header):
+                        frame = header + pad[:caplen - len(header)]
+                    else:
+                        frame = header[:caplen]
+                    ts = count / float(rate)
+                    parts.append(record_header.pack(TS_BASE + int(ts), int((ts % 1) * 1000000), caplen, wirelen))
+                    parts.append(frame)
+                    count += 1
+                if len(parts) >= 131072:
+                    fh.write(b''.join(parts))
+                    parts = []
+        fh.write(b''.join(parts))
+    os.rename(tmp_path, path)
+
+def git_commit():
+    try:
+        pid = subprocess.Popen(['git', '-C', base_dir, 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, universal_newlines=True)
+        return pid.communicate()[0].strip() or None
+    except OSError:
+        return None
+
+def run_analyzer(pcap_path):
+    """
+    Run tcpdump-analyze.py on a pcap -> (exit code, wall seconds, peak RSS in kB
+    of the largest process, the analyzer's own decode seconds).
+    """
+    cmd = [sys.executable, os.path.join(base_dir, 'tcpdump-analyze.py'), '-r', pcap_path]
+    cmd.extend(shlex.split(arg_dict['analyzer_args']))
+    time_start = time()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    output = process.stdout.read()
+    (_pid, status, rusage) = os.wait4(process.pid, 0)
+    wall_sec = time() - time_start
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    process.stdout.close()
+    decode_sec = None
+    lines = output.splitlines()
+    for (i, line) in enumerate(lines):
+        if line.startswith('Analysis throughput') and i + 1 < len(lines):
+            decode_sec = float(lines[i + 1].split()[1])
+    return (process.returncode, wall_sec, rusage.ru_maxrss, decode_sec)
+
+
+if not os.path.exists(arg_dict['pcap_dir']):
+    os.makedirs(arg_dict['pcap_dir'])
+# tcpdump-analyze.py uses ifconfig_a.out next to the pcap for the local addresses
+with open(os.path.join(arg_dict['pcap_dir'], 'ifconfig_a.out'), 'w') as fh:
+    fh.write(IFCONFIG)
+
+results = []
+for packets in packet_counts:
+    for flows in flow_counts:
+        for mix in mixes:
+            flows_used = max(1, min(flows, packets))
+            name = 'synth_{0}p_{1}f_{2}_s{3}_S{4}_R{5}.pcap'.format(packets, flows_used, mix.replace('=', '').replace(',', '-'),
+                                                                   arg_dict['seed'], arg_dict['snaplen'], rate)
+            pcap_path = os.path.join(arg_dict['pcap_dir'], name)
+            if not os.path.exists(pcap_path):
+                print('generating {0}'.format(pcap_path))
+                time_start = time()
+                generate_pcap(pcap_path, packets, flows_used, mix, arg_dict['seed'], rate, arg_dict['snaplen'])
+                print('generated {0} packets in {1:.1f} seconds'.format(packets, time() - time_start))
+            if arg_dict['generate_only']:
+                continue
+            best = None
+            for run in range(arg_dict['runs']):
+                result = run_analyzer(pcap_path)
+                if best is None or result[1] < best[1]:
+                    best = result
+            (exit_code, wall_sec, peak_rss_kb, decode_sec) = best
+            results.append({
+                'packets': packets,
+                'flows': flows_used,
+                'mix': mix,
+                'pcap': name,
+                'pcap_bytes': os.path.getsize(pcap_path),
+                'exit_code': exit_code,
+                'wall_sec': round(wall_sec, 3),
+                'packets_per_sec': round(packets / wall_sec) if wall_sec else None,
+                'decode_sec': decode_sec,
+                'decode_packets_per_sec': round(packets / decode_sec) if decode_sec else None,
+                'peak_rss_kb': peak_rss_kb,
+            })
+            print('{0} packets, {1} flows, {2}: {3:.2f} sec, {4} packets/s, {5} kB peak RSS'.format(
+                packets, flows_used, mix, wall_sec, results[-1]['packets_per_sec'], peak_rss_kb))
+
+if arg_dict['generate_only']:
+    sys.exit(0)
+
+with open(arg_dict['results_file'], 'w') as fh:
+    json.dump({
+        'version': 1,
+        'started': datetime,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'host': platform.node(),
+        'cpus': os.cpu_count(),
+        'analyzer_args': arg_dict['analyzer_args'],
+        'seed': arg_dict['seed'],
+        'snaplen': arg_dict['snaplen'],
+        'rate': rate,
+        'runs': arg_dict['runs'],
+        'results': results,
+    }, fh, indent=2)
+print('results written to {0}'.format(arg_dict['results_file']))
+print('')
+
+# Compare with an earlier run on the same cases (e.g. before a decoder change)
+previous = {}
+if arg_dict['compare_file']:
+    with open(arg_dict['compare_file']) as fh:
+        for result in json.load(fh)['results']:
+            previous[(result['packets'], result['flows'], result['mix'])] = result
+
+stats = []
+row = ['packets', 'flows', 'mix', 'wall sec', 'packets/s', 'decode packets/s', 'peak RSS MB']
+if previous:
+    row.extend(['prev packets/s', 'change %'])
+stats.append(row)
+for result in results:
+    row = [result['packets'], result['flows'], result['mix'], result['wall_sec'], result['packets_per_sec'],
+           result['decode_packets_per_sec'], round(result['peak_rss_kb'] / 1024.0, 1)]
+    if previous:
+        old = previous.get((result['packets'], result['flows'], result['mix']))
+        if old is not None and old['packets_per_sec'] and result['packets_per_sec']:
+            row.extend([old['packets_per_sec'],
+                        round((result['packets_per_sec'] - old['packets_per_sec']) * 100.0 / old['packets_per_sec'], 1)])
+        else:
+            row.extend(['', ''])
+    stats.append(row)
+print(tabulate(stats, headers="firstrow"))
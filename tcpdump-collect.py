@@ -7,12 +7,29 @@ import sys
 from time import time, sleep, localtime, strftime
 import getopt
 import re
+import glob
+
+from mod_pcap import HEADER_SNAPLEN
 
 # from subprocess import call
 
 def usage(exit_code=0):
     """Display help message if -h option used or invalid syntax."""
-    print(os.path.basename(__file__) + ' [-w <output_file>] [-t <timeout_sec>]')
+    print(os.path.basename(__file__) + ' [-w <output_file>] [-t <timeout_sec>] [-l] [-a] [-H | -s <snaplen>]'
+          ' [-f <filter>] [-C <file_mb> -W <files>] [-c <packets>] [-b <bytes>]')
+    print("")
+    print("  -H  header-only capture (snaplen {0}, enough for link/IP/TCP headers)".format(HEADER_SNAPLEN))
+    print("  -s  bytes to capture per packet (tcpdump -s)")
+    print("  -f  BPF filter expression, e.g. -f 'tcp port 443'")
+    print("  -C  ring buffer: rotate to a new file every file_mb MB (tcpdump -C, needs -W)")
+    print("  -W  ring buffer: keep at most files files, overwriting the oldest (tcpdump -W)")
+    print("  -c  stop after capturing this many packets (tcpdump -c)")
+    print("  -b  stop once the capture holds this many bytes (before timeout_sec)")
+    print("  tcpdump's packet counts (incl. dropped by kernel) are written to <output_file>_stats.out")
+    print("")
+    print("  -l  live mode: analyze packets as they arrive (tcpdump -w - into tcpdump-analyze.py),")
+    print("      writing <output_file>.report (and <output_file>.jsonl) and per-second summaries to <output_file>_live.out")
+    print("  -a  live mode keeping only the aggregate: no pcap is written (implies -l)")
     print("")
     sys.exit(exit_code)
 
@@ -22,9 +39,17 @@ datetime = strftime("%Y-%m-%d_%H%M%S", localtime())
 arg_dict = {}
 arg_dict['output_file'] = './tcpdump.{0}.pcap'.format(datetime)
 arg_dict['timeout_sec'] = "10"
+arg_dict['live'] = False
+arg_dict['aggregate_only'] = False
+arg_dict['snaplen'] = None
+arg_dict['filter'] = None
+arg_dict['file_mb'] = None
+arg_dict['files'] = None
+arg_dict['packets'] = None
+arg_dict['byte_budget'] = None
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "ht:w:")
+    opts, args = getopt.getopt(sys.argv[1:], "ab:c:f:hlt:s:w:C:HW:")
 except getopt.GetoptError:
     usage(1)
 for opt, arg in opts:
@@ -34,6 +59,33 @@ for opt, arg in opts:
         arg_dict['timeout_sec'] = arg
     elif opt in ("-w"):
         arg_dict['output_file'] = arg
+    elif opt in ("-l"):
+        arg_dict['live'] = True
+    elif opt in ("-a"):
+        arg_dict['live'] = True
+        arg_dict['aggregate_only'] = True
+    elif opt in ("-H"):
+        arg_dict['snaplen'] = str(HEADER_SNAPLEN)
+    elif opt in ("-s"):
+        arg_dict['snaplen'] = arg
+    elif opt in ("-f"):
+        arg_dict['filter'] = arg
+    elif opt in ("-C"):
+        arg_dict['file_mb'] = arg
+    elif opt in ("-W"):
+        arg_dict['files'] = arg
+    elif opt in ("-c"):
+        arg_dict['packets'] = arg
+    elif opt in ("-b"):
+        try:
+            arg_dict['byte_budget'] = int(arg)
+        except ValueError:
+            print('ERROR: -b requires a number of bytes')
+            usage(1)
+
+if arg_dict['file_mb'] and not arg_dict['files']:
+    print('ERROR: -C requires -W to bound the total size of the ring buffer')
+    usage(1)
 
 # Find network interface with default route
 interface = False
@@ -50,7 +102,52 @@ if not interface:
     print("ERROR: Could not determine interface with default route from netstat -rn")
     sys.exit(1)
 
-cmd = '/usr/sbin/tcpdump -i {0} -nn -w {1}'.format(interface, arg_dict['output_file'])
+# Options that keep the capture small: header-only snaplen, a filter and a packet limit
+tcpdump_args = []
+if arg_dict['snaplen']:
+    tcpdump_args.extend(['-s', arg_dict['snaplen']])
+if arg_dict['packets']:
+    tcpdump_args.extend(['-c', arg_dict['packets']])
+output_base = os.path.splitext(arg_dict['output_file'])[0]
+
+if arg_dict['live']:
+    # Analyze in-process instead of re-reading a pcap later, so the capture
+    # adds no disk writes unless the raw packets are wanted too
+    report_file = output_base + '.report'
+    cmd = [os.path.join(base_dir, 'tcpdump-analyze.py'), '-i', interface, '-d', arg_dict['timeout_sec'],
+           '-o', output_base + '_live.out', '-l', '-J', output_base + '.jsonl']
+    if not arg_dict['aggregate_only']:
+        cmd.extend(['-w', arg_dict['output_file']])
+    if arg_dict['snaplen']:
+        cmd.extend(['-S', arg_dict['snaplen']])
+    if arg_dict['packets']:
+        cmd.extend(['-c', arg_dict['packets']])
+    if arg_dict['byte_budget']:
+        cmd.extend(['-b', str(arg_dict['byte_budget'])])
+    if arg_dict['filter']:
+        cmd.extend(['-f', arg_dict['filter']])
+    if arg_dict['file_mb']:
+        print('ring buffer (-C/-W) does not apply to live mode, writing a single pcap')
+    print('analyzing live capture on {0} for {1} seconds'.format(interface, arg_dict['timeout_sec']))
+    with open(report_file, 'w') as fh:
+        returncode = subprocess.call(cmd, stdout=fh)
+    if returncode:
+        print('ERROR: live capture failed, see {0}'.format(report_file))
+        sys.exit(returncode)
+    print('tcpdump report written to {0}'.format(report_file))
+    sys.exit(0)
+
+cmd = ['/usr/sbin/tcpdump', '-i', interface, '-nn', '-w', arg_dict['output_file']] + tcpdump_args
+if arg_dict['file_mb']:
+    # files are named <output_file>0, <output_file>1, ... and the oldest is overwritten
+    cmd.extend(['-C', arg_dict['file_mb'], '-W', arg_dict['files']])
+if arg_dict['filter']:
+    cmd.append(arg_dict['filter'])
+stats_file = output_base + '_stats.out'
+
+def capture_size():
+    """Bytes in the capture file(s) written so far."""
+    return sum(os.path.getsize(path) for path in glob.glob(glob.escape(arg_dict['output_file']) + '*'))
 
 pid = os.fork()
 if pid > 0:
@@ -60,10 +157,34 @@ else:
     # child
     os.setpgrp() # Set process group so the child processes are cleaned up (avoids long running tcpdump in the background)
     print('forked child pid {0} to run tcpdump'.format(os.getpid()))
-    subprocess.call(cmd, shell=True)
+    # keep waiting through the SIGHUP so tcpdump can write its packet counts
+    signal.signal(signal.SIGHUP, lambda signum, frame: None)
+    with open(stats_file, 'w') as fh:
+        subprocess.call(cmd, stderr=fh)
     os._exit(0)
 
+# Stop at the timeout, or earlier when tcpdump exits by itself (-c) or the byte budget is used up
 print('waiting {0} seconds for tcpdump to finish'.format(arg_dict['timeout_sec']))
-sleep(int(arg_dict['timeout_sec']))
-os.kill(-pid_tcpdump, signal.SIGHUP)  # negative sign in front of pid to cleanup process group
+deadline = time() + int(arg_dict['timeout_sec'])
+finished = False
+while time() < deadline:
+    if os.waitpid(pid_tcpdump, os.WNOHANG)[0] != 0:
+        finished = True
+        break
+    if arg_dict['byte_budget'] and capture_size() >= arg_dict['byte_budget']:
+        print('byte budget of {0} reached'.format(arg_dict['byte_budget']))
+        break
+    sleep(min(1, max(0, deadline - time())))
+if not finished:
+    try:
+        os.kill(-pid_tcpdump, signal.SIGHUP)  # negative sign in front of pid to cleanup process group
+    except OSError:
+        pass  # tcpdump exited just now
+    os.waitpid(pid_tcpdump, 0)
 print('tcpdump pid {0} finished'.format(pid_tcpdump))
+
+# tcpdump prints how many packets it captured and how many the kernel dropped
+with open(stats_file) as fh:
+    for line in fh:
+        if 'packets' in line:
+            print(line.strip())
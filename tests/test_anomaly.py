@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+
+import mod_anomaly
+from mod_anomaly import AnomalyAnalysis
+
+NAN = float('nan')
+NOISE = [0.3, -0.2, 0.1, -0.4, 0.2, 0.0, -0.1, 0.4, -0.3, 0.2]
+
+
+def known_series():
+    """a shifts up at 30, b spikes at 31, c is flat."""
+    a = [10 + NOISE[j % 10] + (10 if j >= 30 else 0) for j in range(60)]
+    b = [50 + NOISE[j * 3 % 10] for j in range(60)]
+    b[31] = 120
+    return [('a', a), ('b', b), ('c', [5.0] * 60), ('empty', [])]
+
+
+def random_series(n, m, seed):
+    """m noisy series of n samples with shifts, spikes, a gap, a short series and two flat ones."""
+    rand = random.Random(seed)
+    series = []
+    for s in range(m):
+        base = rand.choice([5, 30, 1000])
+        values = [base + rand.gauss(0, base * 0.05) for _j in range(n)]
+        if s % 3 == 0:
+            for j in range(n // 2, n):
+                values[j] += base * 0.8
+        if s % 3 == 1:
+            for j in range(n // 3, min(n // 3 + 5, n)):
+                values[j] += base * 2
+        if s == 2:
+            values[n // 8] = NAN
+        series.append(('s{0}'.format(s), values[:n - 3] if s == 4 else values))
+    series.append(('zero', [0.0] * (n - 1) + [5.0]))
+    series.append(('const', [1.0] * n))
+    return series
+
+
+def rounded(analysis):
+    """Results with the floats rounded, as numpy and Python sum in a different order."""
+    return ([row[:3] + tuple(round(v, 6) for v in row[3:]) for row in analysis.shifts],
+            [row[:3] + tuple(round(v, 6) for v in row[3:]) for row in analysis.outliers],
+            analysis.groups)
+
+
+class AnomalyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.numpy = mod_anomaly.numpy
+
+    def tearDown(self):
+        mod_anomaly.numpy = self.numpy
+
+    def python(self, series):
+        mod_anomaly.numpy = None
+        try:
+            return AnomalyAnalysis(series)
+        finally:
+            mod_anomaly.numpy = self.numpy
+
+    def test_known_anomalies(self):
+        analysis = self.python(known_series())
+        self.assertEqual(analysis.names, ['a', 'b', 'c', 'empty'])
+        self.assertEqual([row[:3] for row in analysis.shifts], [('a', 30, 59)])
+        (name, first, last, before, after, t) = analysis.shifts[0]
+        self.assertAlmostEqual(before, 10.02)
+        self.assertAlmostEqual(after, 20.02)
+        self.assertGreater(t, mod_anomaly.CHANGE_T)
+        self.assertEqual([row[:4] for row in analysis.outliers], [('b', 31, 31, 120)])
+        self.assertGreater(analysis.outliers[0][5], mod_anomaly.OUTLIER_Z)
+        self.assertEqual(analysis.groups, [(30, 31, [('a', 'up'), ('b', 'up')])])
+
+    def test_flat_and_empty(self):
+        analysis = self.python([('c', [5.0] * 60), ('empty', [])])
+        self.assertEqual((analysis.shifts, analysis.outliers, analysis.groups), ([], [], []))
+        analysis = self.python([])
+        self.assertEqual((analysis.names, analysis.shifts), ([], []))
+
+    @unittest.skipIf(mod_anomaly.numpy is None, 'numpy is not installed')
+    def test_numpy_matches_python(self):
+        for (n, m, seed) in [(60, 6, 3), (300, 12, 7), (12, 4, 11), (5, 3, 1)]:
+            series = random_series(n, m, seed)
+            expected = rounded(self.python(series))
+            self.assertEqual(rounded(AnomalyAnalysis(series)), expected, (n, m, seed))
+        series = known_series()
+        self.assertEqual(rounded(AnomalyAnalysis(series)), rounded(self.python(series)))
+
+
+if __name__ == '__main__':
+    unittest.main()
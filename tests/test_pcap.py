@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+import gzip
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import unittest
+
+from mod_pcap import (PacketSummary, PcapFile, analyze_range, capture_format, feed_capture, pack_ip,
+                      LINKTYPE_ETHERNET, PCAP_HEADER_LEN, PCAPNG_SHB, PCAPNG_IDB, PCAPNG_EPB, PCAPNG_OPT_TSRESOL)
+from mod_tcp import HANDSHAKE_TIMEOUT
+
+HOST = '10.0.0.1'
+START = 1700000000
+
+TCP_FIN = 0x11
+TCP_RST = 0x14
+TCP_SYN = 0x02
+TCP_SYNA = 0x12
+TCP_ACK = 0x10
+TCP_PUSH = 0x18
+
+
+def ip4(addr):
+    return socket.inet_aton(addr)
+
+
+def tcp_frame(src, sport, dst, dport, flags, seq=0, ack=0, payload=b''):
+    """Ethernet + IPv4 + TCP frame."""
+    tcp = struct.pack('!HHIIBBHHH', sport, dport, seq, ack, 5 << 4, flags, 65535, 0, 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0, 64, 6, 0, ip4(src), ip4(dst))
+    return b'\x00' * 12 + b'\x08\x00' + ip + tcp
+
+
+def udp_frame(src, sport, dst, dport, payload=b''):
+    udp = struct.pack('!HHHH', sport, dport, 8 + len(payload), 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0, ip4(src), ip4(dst))
+    return b'\x00' * 12 + b'\x08\x00' + ip + udp
+
+
+def traffic(n=300):
+    """(ts, frame) of a mixed capture: TCP and UDP between a few hosts, frames of varying size."""
+    packets = []
+    peers = ['10.0.0.2', '10.0.0.3', '192.168.1.9', '10.0.0.1']
+    for i in range(n):
+        ts = START + i * 0.013
+        peer = peers[i % len(peers)]
+        payload = bytes(bytearray((i * 7 + k) % 251 for k in range(i % 97)))
+        if i % 5 == 0:
+            frame = udp_frame(HOST, 53, peer, 30000 + i % 3, payload)
+        elif i % 2:
+            frame = tcp_frame(peer, 40000 + i % 4, HOST, 443, TCP_PUSH, i * 1000, 1, payload)
+        else:
+            frame = tcp_frame(HOST, 443, peer, 40000 + i % 4, TCP_ACK, 1, i * 1000)
+        packets.append((ts, frame))
+    return packets
+
+
+def pcap_bytes(packets, endian='<', nsec=False, snaplen=65535):
+    """libpcap file contents; returns (data, offset of every record)."""
+    magic = 0xa1b23c4d if nsec else 0xa1b2c3d4
+    data = struct.pack(endian + 'IHHiIII', magic, 2, 4, 0, 0, snaplen, LINKTYPE_ETHERNET)
+    offsets = []
+    for (ts, frame) in packets:
+        sec = int(ts)
+        frac = int(round((ts - sec) * (1e9 if nsec else 1e6)))
+        offsets.append(len(data))
+        data += struct.pack(endian + 'IIII', sec, frac, len(frame), len(frame)) + frame
+    return (data, offsets)
+
+
+def pcapng_bytes(packets, endian='<'):
+    """pcapng section with one Ethernet interface in nanoseconds and an EPB per packet."""
+
+    def block(block_type, body):
+        body += b'\x00' * (-len(body) % 4)
+        total = 12 + len(body)
+        return struct.pack(endian + 'II', block_type, total) + body + struct.pack(endian + 'I', total)
+
+    data = block(PCAPNG_SHB, struct.pack(endian + 'IHHq', 0x1A2B3C4D, 1, 0, -1))
+    options = struct.pack(endian + 'HH', PCAPNG_OPT_TSRESOL, 1) + b'\x09\x00\x00\x00' + struct.pack(endian + 'HH', 0, 0)
+    data += block(PCAPNG_IDB, struct.pack(endian + 'HHI', LINKTYPE_ETHERNET, 0, 65535) + options)
+    for (ts, frame) in packets:
+        stamp = int(round(ts * 1e9))
+        data += block(PCAPNG_EPB, struct.pack(endian + 'IIIII', 0, stamp >> 32, stamp & 0xffffffff,
+                                              len(frame), len(frame)) + frame)
+    return data
+
+
+def summary_state(summary):
+    """Comparable counters of a PacketSummary."""
+    return {
+        'counts': [summary.count_total, summary.count_ingress, summary.count_egress, summary.count_internal,
+                   summary.count_unknown, summary.count_rst, summary.count_fin, summary.count_syn, summary.count_syna],
+        'bytes': [summary.bytes_total, summary.bytes_ingress, summary.bytes_egress, summary.bytes_internal,
+                  summary.bytes_unknown],
+        'talkers': dict((key, tuple(getattr(rec, name) for name in rec.__slots__))
+                        for (key, rec) in summary.talkers.items()),
+        'conversations': dict((key, (rec.count, rec.bytes)) for (key, rec) in summary.conversations.items()),
+        'protos': summary.proto_count,
+        'span': (round(summary.ts_start, 6), round(summary.ts_end, 6)),
+        'series': (summary.series.base, list(summary.series.packets), list(summary.series.bytes)),
+    }
+
+
+class PcapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.packets = traffic()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def decode(self, path):
+        summary = PacketSummary([HOST])
+        pcap = PcapFile(path)
+        count = pcap.feed(summary)
+        pcap.close()
+        self.assertEqual(count, summary.count_total)
+        return summary
+
+    def test_decode_counters(self):
+        summary = self.decode(self.write('le.pcap', pcap_bytes(self.packets)[0]))
+        self.assertEqual(summary.count_total, len(self.packets))
+        self.assertEqual(summary.bytes_total, sum(len(frame) for (ts, frame) in self.packets))
+        self.assertEqual(summary.proto_count, {'UDP': 60, 'TCP': 240})
+        # every 4th packet is between the host and itself
+        self.assertEqual(summary.count_internal, 75)
+        self.assertEqual(summary.count_ingress + summary.count_egress + summary.count_internal, len(self.packets))
+        # 10.0.0.2 only gets ACKs from the host, 10.0.0.3 only sends PSH+ACK (and 15 UDP packets each)
+        talker = summary.talkers[pack_ip(HOST) + pack_ip('10.0.0.2')]
+        self.assertEqual((talker.count, talker.ack, talker.push), (75, 60, 0))
+        talker = summary.talkers[pack_ip(HOST) + pack_ip('10.0.0.3')]
+        self.assertEqual((talker.count, talker.ack, talker.push), (75, 0, 60))
+        self.assertEqual(summary.duration(), self.packets[-1][0] - self.packets[0][0])
+
+    def test_byte_order_and_resolution(self):
+        expected = summary_state(self.decode(self.write('le.pcap', pcap_bytes(self.packets)[0])))
+        for (name, endian, nsec) in [('be.pcap', '>', False), ('ns.pcap', '<', True), ('bens.pcap', '>', True)]:
+            path = self.write(name, pcap_bytes(self.packets, endian, nsec)[0])
+            self.assertEqual(summary_state(self.decode(path)), expected, name)
+
+    def test_truncated_last_record(self):
+        data = pcap_bytes(self.packets)[0]
+        summary = self.decode(self.write('cut.pcap', data[:-5]))
+        self.assertEqual(summary.count_total, len(self.packets) - 1)
+
+    def test_not_a_pcap(self):
+        path = self.write('junk.pcap', b'this is not a capture at all')
+        self.assertRaises(ValueError, PcapFile, path)
+        self.assertRaises(ValueError, feed_capture, PacketSummary([HOST]), path)
+        self.assertIsNone(capture_format(path))
+        self.assertRaises(ValueError, PcapFile, self.write('empty.pcap', b''))
+
+    def test_stream_decoders(self):
+        data = pcap_bytes(self.packets)[0]
+        expected = summary_state(self.decode(self.write('le.pcap', data)))
+        for (name, contents, kind) in [('stream.pcap', data, 'pcap'),
+                                       ('stream.pcap.gz', gzip.compress(data), 'pcap'),
+                                       ('le.pcapng', pcapng_bytes(self.packets), 'pcapng'),
+                                       ('be.pcapng', pcapng_bytes(self.packets, '>'), 'pcapng'),
+                                       ('be.pcapng.gz', gzip.compress(pcapng_bytes(self.packets, '>')), 'pcapng')]:
+            path = self.write(name, contents)
+            self.assertEqual(capture_format(path), kind, name)
+            summary = PacketSummary([HOST])
+            self.assertEqual(feed_capture(summary, path), len(self.packets), name)
+            self.assertEqual(summary_state(summary), expected, name)
+
+    def test_find_record(self):
+        (data, offsets) = pcap_bytes(self.packets)
+        pcap = PcapFile(self.write('le.pcap', data))
+        try:
+            self.assertEqual(pcap.find_record(PCAP_HEADER_LEN), PCAP_HEADER_LEN)
+            for off in range(PCAP_HEADER_LEN, len(data), 37):
+                self.assertEqual(pcap.find_record(off), min([o for o in offsets if o >= off] + [len(data)]), off)
+        finally:
+            pcap.close()
+
+    def test_split_matches_serial_decode(self):
+        (data, offsets) = pcap_bytes(self.packets)
+        path = self.write('le.pcap', data)
+        expected = summary_state(self.decode(path))
+        pcap = PcapFile(path)
+        ranges = pcap.split(7, min_size=1024)
+        pcap.close()
+        self.assertEqual(len(ranges), 7)
+        self.assertEqual(ranges[0][0], PCAP_HEADER_LEN)
+        self.assertEqual(ranges[-1][1], len(data))
+        for ((start, end), (next_start, next_end)) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertIn(next_start, offsets)
+        summary = PacketSummary([HOST])
+        for (start, end) in reversed(ranges):
+            summary.merge(analyze_range(path, [HOST], start, end))
+        self.assertEqual(summary_state(summary), expected)
+
+    def test_split_small_file(self):
+        path = self.write('le.pcap', pcap_bytes(self.packets)[0])
+        pcap = PcapFile(path)
+        self.assertEqual(pcap.split(8), [(PCAP_HEADER_LEN, pcap.size)])
+        pcap.close()
+
+
+class TcpLatencyTest(unittest.TestCase):
+
+    def test_handshake_retransmit_dupack(self):
+        client = '10.0.0.2'
+        packets = [
+            (0.000, tcp_frame(client, 40000, HOST, 80, TCP_SYN, 1000)),
+            (0.010, tcp_frame(HOST, 80, client, 40000, TCP_SYNA, 5000, 1001)),
+            (0.050, tcp_frame(client, 40000, HOST, 80, TCP_ACK, 1001, 5001)),
+            (0.100, tcp_frame(HOST, 80, client, 40000, TCP_PUSH, 5001, 1001, b'x' * 100)),
+            (0.300, tcp_frame(HOST, 80, client, 40000, TCP_PUSH, 5001, 1001, b'x' * 100)),
+            (0.310, tcp_frame(client, 40000, HOST, 80, TCP_ACK, 1001, 5001)),
+            (0.311, tcp_frame(client, 40000, HOST, 80, TCP_ACK, 1001, 5001)),
+            (0.312, tcp_frame(client, 40000, HOST, 80, TCP_ACK, 1001, 5001)),
+            (0.320, tcp_frame(client, 40000, HOST, 80, TCP_ACK, 1001, 5101)),
+            (0.400, tcp_frame(HOST, 80, client, 40000, TCP_FIN, 5101, 1001)),
+        ]
+        summary = PacketSummary([HOST], latency=True)
+        for (ts, frame) in packets:
+            summary.add(START + ts, LINKTYPE_ETHERNET, frame, 0, len(frame), len(frame))
+        host = summary.tcp.hosts[pack_ip(client)]
+        self.assertEqual(len(host.rtts), 1)
+        # a remote client: SYN-ACK -> ACK is the leg crossing the network
+        self.assertAlmostEqual(host.rtts[0], 0.040, places=6)
+        self.assertEqual((host.data_segs, host.retrans), (2, 1))
+        self.assertEqual((host.dupacks, host.dupack_runs), (3, 1))
+        self.assertEqual(host.syn_retrans, 0)
+        talker = summary.talkers[pack_ip(HOST) + pack_ip(client)]
+        self.assertEqual((talker.syn, talker.syna, talker.ack, talker.push, talker.fin), (1, 1, 5, 2, 1))
+        self.assertEqual((summary.count_syn, summary.count_syna, summary.count_fin), (1, 1, 1))
+
+    def test_syn_retransmit_not_sampled(self):
+        client = '10.0.0.2'
+        packets = [
+            (0.0, tcp_frame(HOST, 50000, client, 22, TCP_SYN, 7)),
+            (1.0, tcp_frame(HOST, 50000, client, 22, TCP_SYN, 7)),
+            (1.2, tcp_frame(client, 22, HOST, 50000, TCP_SYNA, 90, 8)),
+            (1.3, tcp_frame(HOST, 50000, client, 22, TCP_ACK, 8, 91)),
+        ]
+        summary = PacketSummary([HOST], latency=True)
+        for (ts, frame) in packets:
+            summary.add(START + ts, LINKTYPE_ETHERNET, frame, 0, len(frame), len(frame))
+        host = summary.tcp.hosts[pack_ip(client)]
+        self.assertEqual(host.syn_retrans, 1)
+        self.assertEqual(host.rtts, [])
+
+    def test_flow_state_bounded(self):
+        summary = PacketSummary([HOST], latency=True)
+        client = '10.0.0.2'
+        for (ts, frame) in [
+                (0.0, tcp_frame(client, 40000, HOST, 80, TCP_SYN, 1000)),
+                (0.1, tcp_frame(HOST, 80, client, 40000, TCP_PUSH, 5001, 1001, b'x' * 10)),
+                (0.2, tcp_frame(client, 40000, HOST, 80, TCP_RST, 1001))]:
+            summary.add(START + ts, LINKTYPE_ETHERNET, frame, 0, len(frame), len(frame))
+        # the reset ends both directions
+        self.assertEqual((len(summary.tcp.flows), len(summary.tcp.handshakes)), (0, 0))
+
+        # a SYN scan: unanswered handshakes expire, the latest are kept
+        for port in range(1000):
+            frame = tcp_frame(client, 40000, HOST, port, TCP_SYN, port)
+            summary.add(START + port, LINKTYPE_ETHERNET, frame, 0, len(frame), len(frame))
+        self.assertLessEqual(len(summary.tcp.handshakes), 2 * HANDSHAKE_TIMEOUT + 1)
+
+        summary = PacketSummary([HOST], max_entries=10, latency=True)
+        for port in range(1000):
+            frame = tcp_frame(client, port, HOST, 80, TCP_SYN, port)
+            summary.add(START + port * 0.001, LINKTYPE_ETHERNET, frame, 0, len(frame), len(frame))
+        self.assertEqual((len(summary.tcp.flows), len(summary.tcp.handshakes)), (10, 10))
+        self.assertIn(pack_ip(client) + struct.pack('!H', 999) + pack_ip(HOST) + struct.pack('!H', 80),
+                      summary.tcp.handshakes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mod_procsample import ProcSampler, read_procsample
+from mod_vmstat import minor2major
+
+HEADER2KEY = {'cswch/s': '', 'proc/s': '', 'intr/s': '', 'fault/s': '', 'pgsteal/s': '', '%vmeff': '',
+              'runq-sz': '', 'plist-sz': '', 'ldavg-1': '', 'rtps': '', 'wtps': '', 'bread/s': '',
+              'rxpck/s': 'IFACE', 'rxkB/s': 'IFACE', 'txpck/s': 'IFACE'}
+
+NET_HEADER = ('Inter-|   Receive                                                |  Transmit\n'
+              ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls'
+              ' carrier compressed\n')
+
+
+class FakeProc(object):
+    """A /proc and /sys/block tree whose counters are set per sample."""
+
+    def __init__(self, root):
+        self.proc_dir = os.path.join(root, 'proc')
+        self.block_dir = os.path.join(root, 'block')
+        os.makedirs(os.path.join(self.proc_dir, 'net'))
+        # sda1 is a partition, left out like iostat without -p
+        os.makedirs(os.path.join(self.block_dir, 'sda'))
+        with open(os.path.join(self.proc_dir, 'uptime'), 'w') as fh:
+            fh.write('1000.00 3900.00\n')
+
+    def _write(self, name, text):
+        # truncated in place, so the files the sampler keeps open see the new counters
+        with open(os.path.join(self.proc_dir, name), 'w') as fh:
+            fh.write(text)
+
+    def set(self, cpu, ctxt, processes, vm, disk, rx, running=3, threads=1070):
+        """
+        cpu is user, system, idle, iowait ticks; vm is pgpgin, pgfault,
+        pgscan_kswapd, pgsteal_kswapd (pgsteal_direct is a fifth of it);
+        disk is reads, rd_sectors, rd_ticks, writes, wr_sectors, wr_ticks,
+        io_ticks, time_in_queue; rx is bytes, packets.  The other counters
+        follow ctxt.
+        """
+        (user, system, idle, iowait) = cpu
+        cpu_line = '{0} 0 {1} {2} {3} 0 0 0 0 0'.format(user, system, idle, iowait)
+        self._write('stat', 'cpu  {0}\ncpu0 {0}\nintr {1} 0 0\nctxt {2}\nbtime 1700000000\nprocesses {3}\n'
+                            'procs_running {4}\nprocs_blocked 1\n'.format(cpu_line, ctxt // 2, ctxt, processes, running))
+        (pgpgin, pgfault, scan, steal) = vm
+        self._write('vmstat', 'nr_free_pages 1000\npgpgin {0}\npgpgout 0\npswpin 0\npswpout 0\npgfault {1}\n'
+                              'pgmajfault 0\npgfree 0\npgscan_kswapd {2}\npgscan_direct 0\n'
+                              'pgscan_direct_throttle {3}\npgsteal_kswapd {4}\npgsteal_direct {5}\n'
+                              .format(pgpgin, pgfault, scan, ctxt, steal, steal // 5))
+        (reads, rd_sectors, rd_ticks, writes, wr_sectors, wr_ticks, io_ticks, time_in_queue) = disk
+        line = '   8       {0} {1} {2} 0 {3} {4} {5} 0 {6} {7} 0 {8} {9}\n'
+        self._write('diskstats', line.format(0, 'sda', reads, rd_sectors, rd_ticks, writes, wr_sectors, wr_ticks,
+                                             io_ticks, time_in_queue) +
+                                 line.format(1, 'sda1', reads, rd_sectors, rd_ticks, writes, wr_sectors, wr_ticks,
+                                             io_ticks, time_in_queue))
+        (rx_bytes, rx_packets) = rx
+        self._write('net/dev', NET_HEADER +
+                               '    lo: 100 1 0 0 0 0 0 0 100 1 0 0 0 0 0 0\n'
+                               '  eth0: {0} {1} 0 0 0 0 0 0 0 {2} 0 0 0 0 0 0\n'.format(rx_bytes, rx_packets, ctxt))
+        self._write('loadavg', '0.52 0.58 0.59 {0}/{1} 12345\n'.format(running, threads))
+
+
+class ProcSampleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'proc.bin')
+        proc = FakeProc(self.dir)
+        # since boot, then 1 second and 2 seconds later (sda idle in the second interval)
+        proc.set((1000, 500, 8000, 500), 10000, 100, (400, 3000, 1000, 1000), (10, 80, 20, 30, 240, 90, 500, 600),
+                 (0, 0))
+        sampler = ProcSampler(proc.proc_dir, proc.block_dir)
+        with open(self.path, 'wb') as fh:
+            sampler.write_header(fh, 1)
+            sampler.write_record(fh, 1700000000.0)
+            proc.set((1100, 550, 8800, 550), 11000, 110, (440, 3300, 1100, 1050), (20, 160, 40, 60, 480, 180, 1000,
+                     1200), (2048, 20))
+            sampler.write_record(fh, 1700000001.0)
+            proc.set((1300, 550, 10600, 550), 15000, 130, (440, 3300, 1100, 1050), (20, 160, 40, 60, 480, 180, 1000,
+                     1200), (3072, 30), running=1)
+            sampler.write_record(fh, 1700000003.0)
+        sampler.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_layout(self):
+        proc = read_procsample(self.path)
+        self.assertEqual(proc.header['cpus'], ['all', '0'])
+        self.assertEqual(proc.header['devices'], ['sda'])
+        self.assertEqual(proc.header['ifaces'], ['lo', 'eth0'])
+        self.assertEqual(proc.times, [1700000000.0, 1700000001.0, 1700000003.0])
+
+    def test_vmstat(self):
+        data = read_procsample(self.path).vmstat_data()
+
+        def column(minor):
+            return data[minor2major[minor]][minor]
+        self.assertEqual(column('cs'), [10, 1000, 2000])
+        self.assertEqual(column('in'), [5, 500, 1000])
+        self.assertEqual(column('bi'), [0, 40, 0])
+        self.assertEqual(column('us')[1:], [10, 10])
+        self.assertEqual(column('sy')[1:], [5, 0])
+        self.assertEqual(column('id')[1:], [80, 90])
+        self.assertEqual(column('wa')[1:], [5, 0])
+        self.assertEqual(column('r'), [2, 2, 0])
+        self.assertEqual(column('b'), [1, 1, 1])
+
+    def test_sar(self):
+        sar = read_procsample(self.path).sar_data(HEADER2KEY)
+        self.assertEqual(list(sar.values('cswch/s')), [1000.0, 2000.0])
+        self.assertEqual(list(sar.values('proc/s')), [10.0, 10.0])
+        self.assertEqual(list(sar.values('fault/s')), [300.0, 0.0])
+        # pgscan_direct_throttle is not a scan counter
+        self.assertEqual(list(sar.values('pgsteal/s')), [60.0, 0.0])
+        self.assertEqual(list(sar.values('%vmeff')), [60.0, 0.0])
+        self.assertEqual(list(sar.values('runq-sz')), [2.0, 0.0])
+        self.assertEqual(list(sar.values('plist-sz')), [1070.0, 1070.0])
+        self.assertEqual(list(sar.values('ldavg-1')), [0.52, 0.52])
+        # whole disks only
+        self.assertEqual(list(sar.values('rtps')), [10.0, 0.0])
+        self.assertEqual(list(sar.values('bread/s')), [80.0, 0.0])
+        self.assertEqual(sar.key_values('IFACE'), ['lo', 'eth0'])
+        self.assertEqual(list(sar.values('rxpck/s', 'eth0')), [20.0, 5.0])
+        self.assertEqual(list(sar.values('rxkB/s', 'eth0')), [2.0, 0.5])
+        self.assertEqual(list(sar.values('txpck/s', 'eth0')), [1000.0, 2000.0])
+        self.assertEqual(list(sar.values('rxpck/s', 'lo')), [0.0, 0.0])
+
+    def test_mpstat(self):
+        mp = read_procsample(self.path).mpstat_data()
+        for cpu in ['all', '0']:
+            self.assertEqual([round(v, 6) for v in mp.values('%usr', cpu)], [10.0, 10.0])
+            self.assertEqual([round(v, 6) for v in mp.values('%sys', cpu)], [5.0, 0.0])
+            self.assertEqual([round(v, 6) for v in mp.values('%iowait', cpu)], [5.0, 0.0])
+            self.assertEqual([round(v, 6) for v in mp.values('%idle', cpu)], [80.0, 90.0])
+
+    def test_iostat(self):
+        io = read_procsample(self.path).iostat_data()
+        self.assertEqual(io.key_values('Device'), ['sda'])
+        expected = {'r/s': 10.0, 'w/s': 30.0, 'iops': 40.0, 'rkB/s': 40.0, 'wkB/s': 120.0, 'r_await': 2.0,
+                    'w_await': 3.0, 'await': 2.75, 'aqu-sz': 0.6, '%util': 50.0, 'rareq-sz': 4.0, 'wareq-sz': 4.0}
+        for (field, value) in expected.items():
+            # the idle second interval is left out as with iostat -z
+            self.assertEqual([round(v, 6) for v in io.values(field, 'sda')], [value], field)
+
+    def test_truncated_and_foreign_files(self):
+        with open(self.path, 'ab') as fh:
+            fh.write(b'\x01\x02\x03\x04\x05')
+        self.assertEqual(len(read_procsample(self.path).records), 3)
+        other = os.path.join(self.dir, 'vmstat.out')
+        with open(other, 'w') as fh:
+            fh.write('procs -----------memory---------- ---swap--\n')
+        self.assertRaises(ValueError, read_procsample, other)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from mod_sadc import (read_sadc, sadc_readable, SYSSTAT_MAGIC, FORMAT_MAGIC, FILE_MAGIC, A_PCSW, A_NET_DEV,
+                      R_STATS, R_RESTART, R_COMMENT, MAX_COMMENT_LEN, MAX_IFACE_LEN)
+
+HEADER2KEY = {'cswch/s': '', 'proc/s': '', 'rxpck/s': 'IFACE', 'rxkB/s': 'IFACE', 'txpck/s': 'IFACE'}
+
+# file_header of the writer below: ust_time and hz (2 unsigned long long),
+# 12 unsigned int, then day, month and sizeof_long
+HDR_TYPES_NR = (2, 0, 12)
+HEADER_SIZE = 16 + 48 + 3
+# record_header: uptime_cs, ust_time, extra_next, record_type, hour, minute, second
+REC_TYPES_NR = (2, 0, 1)
+REC_SIZE = 24
+# file_activity: 9 unsigned int
+ACT_SIZE = 36
+# stats_pcsw: context_switch (ULL), processes (UL); stats_net_dev: 7 ULL, speed
+# (U), interface[16], duplex, padded to 8 bytes
+PCSW = (A_PCSW, (1, 1, 0), 16)
+NET_DEV = (A_NET_DEV, (7, 0, 1), 80)
+
+
+class SadcWriter(object):
+    """Minimal sadc data file with the pcsw and net_dev activities, in either byte order."""
+
+    def __init__(self, endian='<', ust_time=1700000000):
+        self.endian = endian
+        e = endian
+        self.data = struct.pack(e + FILE_MAGIC, SYSSTAT_MAGIC, FORMAT_MAGIC, 12, 5, 4, 0, HEADER_SIZE, 0,
+                                *HDR_TYPES_NR)
+        uints = [1, 2, 0, 0, 0, 9] + list(REC_TYPES_NR) + [ACT_SIZE, REC_SIZE, 0]
+        self.data += struct.pack(e + 'QQ12IBBB', ust_time, 100, *(uints + [15, 11, 8]))
+        for (act_id, types_nr, size) in (PCSW, NET_DEV):
+            has_nr = 1 if act_id == A_NET_DEV else 0
+            self.data += struct.pack(e + '9I', act_id, 0, 1, 1, has_nr, size, *types_nr)
+
+    def record(self, rtype, uptime_cs, ust_time):
+        self.data += struct.pack(self.endian + 'QQIB3x', uptime_cs, ust_time, 0, rtype)
+
+    def stats(self, uptime_cs, ust_time, cswch, procs, ifaces):
+        """One statistics record; ifaces is [(name, rx packets, tx packets, rx bytes)]."""
+        e = self.endian
+        self.record(R_STATS, uptime_cs, ust_time)
+        self.data += struct.pack(e + 'QQ', cswch, procs)
+        self.data += struct.pack(e + 'i', len(ifaces))
+        for (name, rxpck, txpck, rxbytes) in ifaces:
+            self.data += (struct.pack(e + '7QI', rxpck, txpck, rxbytes, 0, 0, 0, 0, 1000) +
+                          name.encode().ljust(MAX_IFACE_LEN, b'\0') + b'\0' * 4)
+
+    def restart(self, uptime_cs, ust_time):
+        self.record(R_RESTART, uptime_cs, ust_time)
+        self.data += struct.pack(self.endian + 'I', 4)
+
+    def comment(self, uptime_cs, ust_time, text):
+        self.record(R_COMMENT, uptime_cs, ust_time)
+        self.data += text.encode().ljust(MAX_COMMENT_LEN, b'\0')
+
+
+def values(sar, field, key_val=None):
+    return [round(v, 6) for v in sar.values(field, key_val)]
+
+
+class SadcTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def collection(self, endian):
+        sadc = SadcWriter(endian)
+        sadc.stats(100, 1700000001, 1000, 10, [('lo', 5, 5, 0), ('eth0', 0, 0, 0)])
+        sadc.stats(200, 1700000002, 1500, 12, [('lo', 5, 5, 0), ('eth0', 100, 50, 102400)])
+        sadc.comment(250, 1700000002, 'load test')
+        # 2 seconds later, and eth1 shows up
+        sadc.stats(400, 1700000004, 2500, 15, [('lo', 9, 9, 0), ('eth0', 300, 70, 204800), ('eth1', 1, 1, 1)])
+        return sadc
+
+    def check(self, sar):
+        self.assertEqual(values(sar, 'cswch/s'), [500.0, 500.0])
+        self.assertEqual(values(sar, 'proc/s'), [2.0, 1.5])
+        self.assertEqual(sar.key_values('IFACE'), ['lo', 'eth0'])
+        self.assertEqual(values(sar, 'rxpck/s', 'eth0'), [100.0, 100.0])
+        self.assertEqual(values(sar, 'txpck/s', 'eth0'), [50.0, 10.0])
+        self.assertEqual(values(sar, 'rxkB/s', 'eth0'), [100.0, 50.0])
+        self.assertEqual(values(sar, 'rxpck/s', 'lo'), [0.0, 2.0])
+
+    def test_little_endian(self):
+        path = self.write('sa_le', self.collection('<').data)
+        self.assertTrue(sadc_readable(path))
+        self.check(read_sadc(path, HEADER2KEY))
+
+    def test_big_endian(self):
+        path = self.write('sa_be', self.collection('>').data)
+        self.assertTrue(sadc_readable(path))
+        self.check(read_sadc(path, HEADER2KEY))
+
+    def test_restart(self):
+        sadc = self.collection('<')
+        # counters start again after a reboot; no sample spans it
+        sadc.restart(10, 1700000100)
+        sadc.stats(100, 1700000101, 40, 1, [('lo', 0, 0, 0), ('eth0', 0, 0, 0)])
+        sadc.stats(200, 1700000102, 140, 3, [('lo', 0, 0, 0), ('eth0', 10, 0, 0)])
+        sar = read_sadc(self.write('sa_restart', sadc.data), HEADER2KEY)
+        self.assertEqual(values(sar, 'cswch/s'), [500.0, 500.0, 100.0])
+        self.assertEqual(values(sar, 'rxpck/s', 'eth0'), [100.0, 100.0, 10.0])
+
+    def test_truncated_record(self):
+        data = self.collection('<').data
+        sar = read_sadc(self.write('sa_cut', data[:-30]), HEADER2KEY)
+        self.assertEqual(values(sar, 'cswch/s'), [500.0])
+
+    def test_not_sadc(self):
+        path = self.write('junk', b'Linux 5.15.0 (host) 01/15/24 _x86_64_ (8 CPU)\n' * 4)
+        self.assertFalse(sadc_readable(path))
+        self.assertRaises(ValueError, read_sadc, path, HEADER2KEY)
+        self.assertFalse(sadc_readable(os.path.join(self.dir, 'missing')))
+
+    def test_other_format(self):
+        data = bytearray(self.collection('<').data)
+        # sysstat 11.6 and older write another format magic
+        struct.pack_into('<H', data, 2, 0x2173)
+        path = self.write('sa_old', bytes(data))
+        self.assertFalse(sadc_readable(path))
+        self.assertRaises(ValueError, read_sadc, path, HEADER2KEY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+
+from mod_pcap import Conversation
+from mod_stats import SpaceSaving, StreamStats, RateSeries, calc_avg_sd, mann_whitney, percentile
+
+
+def zipf_keys(n, keys, seed):
+    """n draws of keys 0..keys-1, key k about 1/(k+1) as often as key 0."""
+    rand = random.Random(seed)
+    weights = [1.0 / (k + 1) for k in range(keys)]
+    return rand.choices(range(keys), weights, k=n)
+
+
+def count(table, keys):
+    for key in keys:
+        rec = table.get(key)
+        if rec is None:
+            rec = table.insert(key)
+        rec.count += 1
+        rec.bytes += 100
+    return table
+
+
+class SpaceSavingTest(unittest.TestCase):
+
+    def check_bounds(self, table, keys):
+        true = {}
+        for key in keys:
+            true[key] = true.get(key, 0) + 1
+        self.assertLessEqual(len(table), table.capacity)
+        for (key, rec) in table.items():
+            self.assertLessEqual(rec.count - table.error(key), true[key], key)
+            self.assertGreaterEqual(rec.count, true[key], key)
+        for key in true:
+            if table.get(key) is None:
+                self.assertLessEqual(true[key], table.min_count(), key)
+        return true
+
+    def test_exact_below_capacity(self):
+        keys = zipf_keys(1000, 20, 1)
+        table = count(SpaceSaving(25, Conversation), keys)
+        true = self.check_bounds(table, keys)
+        self.assertEqual(dict((key, rec.count) for (key, rec) in table.items()), true)
+        self.assertEqual(table.min_count(), 0)
+
+    def test_bounds(self):
+        keys = zipf_keys(20000, 500, 2)
+        table = count(SpaceSaving(50, Conversation), keys)
+        true = self.check_bounds(table, keys)
+        # the heaviest keys are always tracked
+        for key in sorted(true, key=true.get, reverse=True)[:5]:
+            self.assertIsNotNone(table.get(key))
+
+    def test_merge(self):
+        keys = zipf_keys(20000, 500, 3)
+        for capacity in (50, 1000):
+            merged = count(SpaceSaving(capacity, Conversation), keys[:7000])
+            merged.merge(count(SpaceSaving(capacity, Conversation), keys[7000:]))
+            true = self.check_bounds(merged, keys)
+            if capacity == 1000:
+                self.assertEqual(dict((key, rec.count) for (key, rec) in merged.items()), true)
+                self.assertEqual(sum(rec.bytes for (key, rec) in merged.items()), 100 * len(keys))
+
+
+class StreamStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(5)
+        self.values = [rand.lognormvariate(3, 1) for _i in range(5000)] + [0.0] * 50 + [-2.5, float('nan')]
+
+    def test_one_pass(self):
+        acc = StreamStats(self.values)
+        samples = [v for v in self.values if v == v]
+        mean = sum(samples) / len(samples)
+        self.assertEqual(acc.count, len(samples))
+        self.assertAlmostEqual(acc.mean, mean, places=9)
+        self.assertAlmostEqual(acc.variance(), sum((v - mean) ** 2 for v in samples) / len(samples), places=6)
+        self.assertEqual((acc.min, acc.max), (min(samples), max(samples)))
+        for q in (0.5, 0.95, 0.99):
+            exact = percentile(samples, q * 100)
+            self.assertLessEqual(abs(acc.quantile(q) - exact), 0.03 * exact, q)
+        self.assertIsNone(StreamStats().quantile(0.5))
+
+    def test_calc_avg_sd(self):
+        acc = StreamStats(self.values)
+        self.assertEqual(calc_avg_sd(self.values, 3),
+                         (round(acc.mean, 3), round(acc.sd(), 3), round(acc.min, 3), round(acc.max, 3)))
+
+    def test_merge_matches_one_pass(self):
+        whole = StreamStats(self.values)
+        merged = StreamStats()
+        for part in (self.values[:1], self.values[1:2000], [], self.values[2000:]):
+            merged.merge(StreamStats(part))
+        self.assertEqual(merged.count, whole.count)
+        self.assertAlmostEqual(merged.mean, whole.mean, places=9)
+        self.assertAlmostEqual(merged.sd(), whole.sd(), places=9)
+        self.assertEqual((merged.min, merged.max, merged.zeros), (whole.min, whole.max, whole.zeros))
+        self.assertEqual((merged.positive, merged.negative), (whole.positive, whole.negative))
+        for q in (0.0, 0.25, 0.5, 0.95, 1.0):
+            self.assertEqual(merged.quantile(q), whole.quantile(q))
+        self.assertEqual(StreamStats.from_state(whole.state()).state(), whole.state())
+        self.assertRaises(ValueError, merged.merge, StreamStats(accuracy=0.05))
+
+
+class RateSeriesTest(unittest.TestCase):
+
+    def test_merge_aligns_on_time(self):
+        first = RateSeries(1.0)
+        second = RateSeries(1.0)
+        for (ts, nbytes) in [(100.2, 10), (101.5, 20), (103.0, 5)]:
+            first.add(ts, nbytes)
+        for (ts, nbytes) in [(98.9, 7), (101.1, 30)]:
+            second.add(ts, nbytes)
+        first.merge(second)
+        self.assertEqual(first.base, 98)
+        self.assertEqual(list(first.packets), [1, 0, 1, 2, 0, 1])
+        self.assertEqual(list(first.bytes), [7, 0, 10, 50, 0, 5])
+        self.assertEqual(first.peak(), (101.0, 2.0, 50.0))
+
+
+class MannWhitneyTest(unittest.TestCase):
+
+    def test_shift(self):
+        rand = random.Random(9)
+        before = [rand.gauss(10, 1) for _i in range(50)]
+        after = [rand.gauss(13, 1) for _i in range(50)]
+        (u, p, effect) = mann_whitney(before, after)
+        self.assertLess(p, 0.001)
+        self.assertGreater(effect, 0.8)
+        (u, p, effect) = mann_whitney(after, before)
+        self.assertLess(effect, -0.8)
+
+    def test_same_and_empty(self):
+        (u, p, effect) = mann_whitney([1.0] * 20, [1.0] * 20 + [float('nan')])
+        self.assertEqual((u, p, effect), (200.0, 1.0, 0.0))
+        self.assertIsNone(mann_whitney([], [1.0]))
+
+
+if __name__ == '__main__':
+    unittest.main()